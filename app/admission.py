@@ -0,0 +1,237 @@
+import asyncio
+import itertools
+from typing import Callable, Optional
+
+from fastapi.responses import JSONResponse
+
+from app.config import (
+    ADMISSION_CONCURRENCY,
+    ADMISSION_FEED_CONCURRENCY,
+    ADMISSION_MIN_CONCURRENCY,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_RETRY_AFTER,
+    ADMISSION_TARGET_POOL_WAIT,
+)
+from app.metrics import (
+    ADMISSION_DECISIONS,
+    ADMISSION_LIMIT,
+    ADMISSION_QUEUE_DEPTH,
+    pool_wait,
+)
+
+# Приоритеты по убыванию: дешёвые записи, чтения с API key, тяжёлые ленты,
+# запросы без API key (они всё равно получат 401)
+PRIORITY_WRITE = 0
+PRIORITY_READ = 1
+PRIORITY_FEED = 2
+PRIORITY_ANONYMOUS = 3
+PRIORITY_NAMES = {
+    PRIORITY_WRITE: "write",
+    PRIORITY_READ: "read",
+    PRIORITY_FEED: "feed",
+    PRIORITY_ANONYMOUS: "anonymous",
+}
+# Маршруты, которые дороги для БД и ограничиваются отдельно
+EXPENSIVE_ROUTES = {"GET /api/tweets"}
+
+
+def request_priority(route: str, authenticated: bool) -> int:
+    """Приоритет запроса по маршруту вида "GET /api/tweets" """
+    if not authenticated:
+        return PRIORITY_ANONYMOUS
+    if route in EXPENSIVE_ROUTES:
+        return PRIORITY_FEED
+    if route.startswith("GET "):
+        return PRIORITY_READ
+    return PRIORITY_WRITE
+
+
+class _Waiter:
+    """Запрос в очереди на допуск"""
+
+    def __init__(self, route: str, priority: int, seq: int):
+        self.route = route
+        self.priority = priority
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def order(self) -> tuple[int, int]:
+        return self.priority, self.seq
+
+
+class AdmissionController:
+    """
+    Ограничивает число одновременно обрабатываемых запросов, чтобы они
+    ждали не внутри пула соединений, а в короткой очереди с приоритетами.
+    Лимит уменьшается, когда среднее ожидание соединения из пула выше
+    целевого. При полной очереди запрос сразу получает отказ, а запрос
+    с более высоким приоритетом вытесняет из очереди самый низкий
+    """
+
+    def __init__(
+        self,
+        concurrency: int = ADMISSION_CONCURRENCY,
+        min_concurrency: int = ADMISSION_MIN_CONCURRENCY,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        target_pool_wait: float = ADMISSION_TARGET_POOL_WAIT,
+        route_limits: Optional[dict[str, int]] = None,
+    ):
+        self.concurrency = concurrency
+        self.min_concurrency = min(min_concurrency, concurrency)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.target_pool_wait = target_pool_wait
+        self.route_limits = (
+            {"GET /api/tweets": ADMISSION_FEED_CONCURRENCY}
+            if route_limits is None
+            else route_limits
+        )
+        self.active = 0
+        self.active_by_route: dict[str, int] = {}
+        self.queue: list[_Waiter] = []
+        self._seq = itertools.count()
+
+    def limit(self) -> int:
+        """Лимит одновременных запросов с учётом текущего ожидания пула"""
+        waited = pool_wait.value
+        if waited <= self.target_pool_wait:
+            return self.concurrency
+        scaled = int(self.concurrency * self.target_pool_wait / waited)
+        return max(self.min_concurrency, scaled)
+
+    def _can_run(self, route: str, limit: int) -> bool:
+        if self.active >= limit:
+            return False
+        route_limit = self.route_limits.get(route)
+        return route_limit is None or self.active_by_route.get(route, 0) < route_limit
+
+    def _start(self, route: str) -> None:
+        self.active += 1
+        self.active_by_route[route] = self.active_by_route.get(route, 0) + 1
+
+    def _dispatch(self) -> None:
+        """Допускает ждущие запросы по приоритету, пока позволяют лимиты"""
+        limit = self.limit()
+        ADMISSION_LIMIT.set(limit)
+        for waiter in sorted(self.queue, key=_Waiter.order):
+            if self.active >= limit:
+                break
+            if self._can_run(waiter.route, limit):
+                self.queue.remove(waiter)
+                self._start(waiter.route)
+                waiter.future.set_result(True)
+        ADMISSION_QUEUE_DEPTH.set(len(self.queue))
+
+    def _drop(self, waiter: _Waiter, decision: str) -> None:
+        self.queue.remove(waiter)
+        if not waiter.future.done():
+            waiter.future.set_result(False)
+        ADMISSION_DECISIONS.labels(PRIORITY_NAMES[waiter.priority], decision).inc()
+        ADMISSION_QUEUE_DEPTH.set(len(self.queue))
+
+    async def acquire(self, route: str, priority: int) -> bool:
+        """
+        Ждёт допуска запроса. True - запрос можно обрабатывать (после него
+        обязателен release), False - отказ: очередь полна, запрос вытеснен
+        более приоритетным или ждал дольше queue_timeout
+        """
+        name = PRIORITY_NAMES[priority]
+        if not self.queue and self._can_run(route, self.limit()):
+            self._start(route)
+            ADMISSION_DECISIONS.labels(name, "admitted").inc()
+            return True
+
+        waiter = _Waiter(route, priority, next(self._seq))
+        if len(self.queue) >= self.queue_size:
+            worst = max(self.queue, key=_Waiter.order, default=None)
+            if worst is None or worst.priority <= priority:
+                ADMISSION_DECISIONS.labels(name, "rejected").inc()
+                return False
+            self._drop(worst, "evicted")
+        self.queue.append(waiter)
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # клиент ушёл, пока запрос ждал: место в очереди или слот освобождаются
+            if waiter.future.done() and waiter.future.result():
+                self.release(route)
+            elif waiter in self.queue:
+                self.queue.remove(waiter)
+                ADMISSION_QUEUE_DEPTH.set(len(self.queue))
+            raise
+        if waiter.future.done():
+            admitted = waiter.future.result()
+            if admitted:
+                ADMISSION_DECISIONS.labels(name, "queued").inc()
+            return admitted
+        self._drop(waiter, "timeout")
+        return False
+
+    def release(self, route: str) -> None:
+        self.active -= 1
+        self.active_by_route[route] -= 1
+        if not self.active_by_route[route]:
+            del self.active_by_route[route]
+        self._dispatch()
+
+    def state(self) -> dict:
+        return {
+            "limit": self.limit(),
+            "active": self.active,
+            "queued": len(self.queue),
+            "active_by_route": dict(self.active_by_route),
+        }
+
+
+admission_controller = AdmissionController()
+
+
+def overloaded_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={
+            "result": False,
+            "error_type": "ServiceUnavailable",
+            "error_message": "Server is overloaded, retry later",
+        },
+        headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+    )
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware, пропускающее запросы к /api/ через admission_controller.
+    Административные эндпоинты не ограничиваются, чтобы под нагрузкой
+    оставалась возможность посмотреть, что происходит
+    """
+
+    def __init__(self, app, route_of: Callable[[dict], str]):
+        self.app = app
+        # шаблон маршрута по scope, как в метках метрик
+        self.route_of = route_of
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or not path.startswith("/api/")
+            or path.startswith("/api/admin/")
+        ):
+            await self.app(scope, receive, send)
+            return
+        route = f"{scope['method']} {self.route_of(scope)}"
+        authenticated = any(name == b"api-key" for name, _ in scope["headers"])
+        controller = admission_controller
+        if not await controller.acquire(route, request_priority(route, authenticated)):
+            await overloaded_response()(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(route)
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Iterable, Optional
+
+from app.config import CACHE_BACKEND, CACHE_KEY_PREFIX, CACHE_MAX_BYTES
+from app.metrics import record_cache_lookup
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class CacheError(Exception):
+    """Хранилище кэша недоступно или ответило ошибкой"""
+
+
+class CacheBackend(ABC):
+    """
+    Хранилище кэша: байтовые значения по строковым ключам с временем жизни.
+    ttl=None - без срока. Реализации: MemoryCacheBackend и RedisCacheBackend
+    """
+
+    @abstractmethod
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]: ...
+
+    @abstractmethod
+    async def set_many(self, items: dict[str, bytes], ttl: Optional[float]) -> None: ...
+
+    @abstractmethod
+    async def add(self, key: str, value: bytes) -> bool:
+        """Записывает значение, только если ключа нет. True - записано"""
+
+    @abstractmethod
+    async def delete_many(self, keys: list[str]) -> None: ...
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Удаляет все ключи с префиксом CACHE_KEY_PREFIX"""
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Кэш в памяти процесса с ограничением по объёму: при превышении
+    max_bytes вытесняются давно не читавшиеся записи. Значение больше
+    max_bytes не сохраняется. Просроченные записи удаляются при чтении
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = CACHE_MAX_BYTES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.entries: OrderedDict[str, tuple[bytes, Optional[float]]] = OrderedDict()
+        self.size = 0
+
+    @staticmethod
+    def _entry_size(key: str, value: bytes) -> int:
+        return len(key) + len(value)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= self.clock():
+            self._delete(key)
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def _delete(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= self._entry_size(key, entry[0])
+
+    def _set(self, key: str, value: bytes, ttl: Optional[float]) -> None:
+        self._delete(key)
+        size = self._entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        expires_at = None if ttl is None else self.clock() + ttl
+        self.entries[key] = (value, expires_at)
+        self.size += size
+        while self.size > self.max_bytes:
+            oldest, (old_value, _) = self.entries.popitem(last=False)
+            self.size -= self._entry_size(oldest, old_value)
+
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        return [self._get(key) for key in keys]
+
+    async def set_many(self, items: dict[str, bytes], ttl: Optional[float]) -> None:
+        for key, value in items.items():
+            self._set(key, value, ttl)
+
+    async def add(self, key: str, value: bytes) -> bool:
+        if self._get(key) is not None:
+            return False
+        self._set(key, value, None)
+        return True
+
+    async def delete_many(self, keys: list[str]) -> None:
+        for key in keys:
+            self._delete(key)
+
+    async def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+
+def create_backend() -> CacheBackend:
+    """Хранилище по настройке CACHE_BACKEND"""
+    if CACHE_BACKEND == "redis":
+        from app.redis_cache import RedisCacheBackend
+
+        return RedisCacheBackend()
+    return MemoryCacheBackend()
+
+
+cache_backend = create_backend()
+
+# ошибки хранилища превращаются в промахи: без кэша запрос идёт в БД
+BACKEND_ERRORS = (CacheError, OSError, asyncio.TimeoutError)
+
+
+class Cache:
+    """
+    Пространство имён в кэше со своим временем жизни записей.
+
+    Значения хранятся в JSON вместе с версией пространства. invalidate()
+    меняет версию, и все записи с прежней становятся промахами без
+    перебора ключей. Версия - случайная строка, а не счётчик, поэтому
+    вытеснение ключа версии не оживляет старые записи. get_or_load
+    сохраняет значение с версией, прочитанной до загрузки: если во время
+    загрузки пространство сбросили, устаревшее значение не будет прочитано
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: Optional[float] = None,
+        backend: Optional[CacheBackend] = None,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._backend = backend
+        self._version_key = f"{CACHE_KEY_PREFIX}{namespace}:__version__"
+
+    @property
+    def backend(self) -> CacheBackend:
+        return self._backend or cache_backend
+
+    def _key(self, key: Hashable) -> str:
+        return f"{CACHE_KEY_PREFIX}{self.namespace}:{key}"
+
+    async def _read(self, keys: list) -> tuple[Optional[str], dict]:
+        """Версия пространства и найденные значения одним обращением"""
+        try:
+            raw = await self.backend.get_many(
+                [self._version_key] + [self._key(key) for key in keys]
+            )
+            version = raw[0].decode() if raw[0] is not None else None
+            if version is None:
+                version = uuid.uuid4().hex
+                if not await self.backend.add(self._version_key, version.encode()):
+                    version = None
+        except BACKEND_ERRORS as error:
+            logger.warning(f"cache {self.namespace} read failed: {error!r}")
+            raw, version = [None] * (len(keys) + 1), None
+
+        found = {}
+        for key, blob in zip(keys, raw[1:]):
+            if blob is not None:
+                stored_version, value = json.loads(blob)
+                if stored_version == version:
+                    found[key] = value
+            record_cache_lookup(self.namespace, key in found)
+        return version, found
+
+    async def _write(
+        self, version: Optional[str], items: dict, ttl: Optional[float]
+    ) -> None:
+        if version is None or not items:
+            return
+        try:
+            await self.backend.set_many(
+                {
+                    self._key(key): json.dumps([version, value]).encode()
+                    for key, value in items.items()
+                },
+                self.ttl if ttl is None else ttl,
+            )
+        except BACKEND_ERRORS as error:
+            logger.warning(f"cache {self.namespace} write failed: {error!r}")
+
+    async def get(self, key: Hashable) -> Any:
+        _, found = await self._read([key])
+        return found.get(key)
+
+    async def get_many(self, keys: Iterable[Hashable]) -> dict:
+        _, found = await self._read(list(keys))
+        return found
+
+    async def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        await self.set_many({key: value}, ttl)
+
+    async def set_many(self, items: dict, ttl: Optional[float] = None) -> None:
+        version, _ = await self._read([])
+        await self._write(version, items, ttl)
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+    ) -> Any:
+        """Значение из кэша или из loader; None от loader не сохраняется"""
+        version, found = await self._read([key])
+        if key in found:
+            return found[key]
+        value = await loader()
+        if value is not None:
+            await self._write(version, {key: value}, ttl)
+        return value
+
+    async def delete(self, *keys: Hashable) -> None:
+        try:
+            await self.backend.delete_many([self._key(key) for key in keys])
+        except BACKEND_ERRORS as error:
+            logger.warning(f"cache {self.namespace} delete failed: {error!r}")
+
+    async def invalidate(self) -> None:
+        """Сбрасывает всё пространство имён сменой версии"""
+        try:
+            await self.backend.set_many(
+                {self._version_key: uuid.uuid4().hex.encode()}, None
+            )
+        except BACKEND_ERRORS as error:
+            logger.warning(f"cache {self.namespace} invalidate failed: {error!r}")
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from typing import Callable
+
+import sqlalchemy.exc
+
+from app.config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+from app.metrics import CIRCUIT_OPEN
+
+# Ошибки, означающие, что БД недоступна или не отвечает (а не ошибку в запросе)
+DB_UNAVAILABLE_ERRORS = (
+    sqlalchemy.exc.OperationalError,
+    sqlalchemy.exc.InterfaceError,
+    sqlalchemy.exc.TimeoutError,  # ожидание соединения из пула
+    asyncio.TimeoutError,
+    OSError,  # соединение с БД не устанавливается
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты БД. После failure_threshold ошибок подряд размыкается:
+    запросы к БД не выполняются reset_timeout секунд, затем пропускается
+    один пробный. Удачный пробный запрос замыкает автомат, неудачный -
+    снова размыкает. Если пробный запрос не отчитался (клиент ушёл),
+    следующий пропускается ещё через reset_timeout
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос к БД"""
+        if self.state == CLOSED:
+            return True
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return False
+        # пробный запрос; следующий - не раньше чем через reset_timeout
+        self.state = HALF_OPEN
+        self.opened_at = self.clock()
+        return True
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        CIRCUIT_OPEN.set(0)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = self.clock()
+            CIRCUIT_OPEN.set(1)
+
+    def retry_after(self) -> float:
+        return max(self.reset_timeout - (self.clock() - self.opened_at), 0.0)
+
+
+db_circuit = CircuitBreaker()
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Папка, где лежит этот файл (то есть app/)
@@ -5,3 +6,190 @@ BASE_DIR = Path(__file__).resolve().parent
 
 # В app/ создается папка media — туда будем сохранять файлы
 MEDIA_DIR = BASE_DIR / "media"
+
+# Лента показывает твиты не старше этого числа дней,
+# благодаря этому планировщик отсекает старые партиции tweets
+FEED_WINDOW_DAYS = int(os.getenv("FEED_WINDOW_DAYS", "90"))
+# Если за FEED_WINDOW_DAYS в ленте меньше твитов, она дополняется
+# столькими же более старыми (подписки давно ничего не писали)
+FEED_MIN_TWEETS = int(os.getenv("FEED_MIN_TWEETS", "20"))
+
+# На сколько месяцев вперёд заранее создаются партиции tweets
+TWEETS_PARTITION_MONTHS_AHEAD = int(os.getenv("TWEETS_PARTITION_MONTHS_AHEAD", "3"))
+# Как часто (в секундах) фоновая задача проверяет наличие будущих партиций
+PARTITION_MAINTENANCE_INTERVAL = int(
+    os.getenv("PARTITION_MAINTENANCE_INTERVAL", str(12 * 60 * 60))
+)
+# Количество hash-партиций таблицы likes (меняется только миграцией)
+LIKES_PARTITIONS = 16
+
+# Запрос, выполнивший больше SQL-выражений, попадает в лог с предупреждением
+QUERY_COUNT_WARNING = int(os.getenv("QUERY_COUNT_WARNING", "10"))
+# Сколько раз одно и то же выражение может повториться за запрос,
+# прежде чем это будет считаться признаком N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "3"))
+
+# Как часто (в секундах) измеряется опоздание event loop для метрик
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5"))
+
+# API-ключи администраторов через запятую: им доступны профилирование
+# и диагностические эндпоинты
+ADMIN_API_KEYS = frozenset(
+    key.strip() for key in os.getenv("ADMIN_API_KEYS", "").split(",") if key.strip()
+)
+# Доля запросов (0..1), которые профилируются без заголовка X-Profile
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Интервал (в секундах) между снимками стека при профилировании
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+# Куда сохраняются профили в формате folded stacks (flamegraph.pl, speedscope)
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(BASE_DIR.parent / "profiles")))
+
+# Трассировка: запросы дольше TRACE_SLOW_MS сохраняются всегда (tail sampling),
+# быстрые - с вероятностью TRACE_SAMPLE_RATE или по флагу sampled в traceparent
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "500"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# Сколько последних сохранённых трасс держится в памяти
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "1000"))
+# Файл, куда трассы дописываются построчно в JSON (пусто - только в памяти)
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+
+# Выражения дольше SLOW_QUERY_MS попадают в журнал медленных запросов
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Сколько разных (нормализованных) выражений хранит журнал
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "200"))
+# Снимать ли план EXPLAIN (ANALYZE, BUFFERS) для медленных выражений
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "0") == "1"
+# Ограничение времени выполнения EXPLAIN ANALYZE (в миллисекундах)
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "5000"))
+
+# Собирать ли пиковые аллокации по маршрутам (включает tracemalloc при старте)
+MEMORY_ROUTE_STATS = os.getenv("MEMORY_ROUTE_STATS", "0") == "1"
+# Глубина стека, которую tracemalloc сохраняет для каждой аллокации
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "10"))
+# Сколько снимков памяти хранится для сравнения
+MEMORY_SNAPSHOTS_KEPT = int(os.getenv("MEMORY_SNAPSHOTS_KEPT", "5"))
+# Размер блока при записи загружаемых файлов на диск
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Допуск запросов к /api/ (кроме /api/admin/): сколько запросов обрабатывается
+# одновременно, остальные ждут в очереди по приоритету
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", "30"))
+# Ниже этого лимит не опускается даже при долгом ожидании пула
+ADMISSION_MIN_CONCURRENCY = int(os.getenv("ADMISSION_MIN_CONCURRENCY", "4"))
+# Сколько из одновременных запросов может приходиться на ленту GET /api/tweets
+ADMISSION_FEED_CONCURRENCY = int(os.getenv("ADMISSION_FEED_CONCURRENCY", "10"))
+# Длина очереди; при переполнении запрос сразу получает 503
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "100"))
+# Сколько секунд запрос может ждать в очереди, прежде чем получить 503
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+# Целевое ожидание соединения из пула (в секундах): когда среднее ожидание
+# выше, лимит одновременных запросов уменьшается пропорционально
+ADMISSION_TARGET_POOL_WAIT = float(os.getenv("ADMISSION_TARGET_POOL_WAIT", "0.05"))
+# Значение заголовка Retry-After (в секундах) в ответе 503
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+# Ограничение частоты запросов к /api/ по API key (без ключа - по IP клиента):
+# токенов в секунду и ёмкость корзины на ключ по всем маршрутам
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "20"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "100"))
+# Отдельные корзины ключа для дорогих маршрутов: ленты и загрузки медиа
+RATE_LIMIT_FEED_RATE = float(os.getenv("RATE_LIMIT_FEED_RATE", "5"))
+RATE_LIMIT_FEED_BURST = int(os.getenv("RATE_LIMIT_FEED_BURST", "20"))
+RATE_LIMIT_MEDIA_RATE = float(os.getenv("RATE_LIMIT_MEDIA_RATE", "1"))
+RATE_LIMIT_MEDIA_BURST = int(os.getenv("RATE_LIMIT_MEDIA_BURST", "10"))
+# Через сколько секунд без запросов корзина ключа удаляется из памяти
+RATE_LIMIT_IDLE_TTL = float(os.getenv("RATE_LIMIT_IDLE_TTL", "600"))
+# На сколько частей делится хранилище корзин в памяти
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+# Сколько корзин (и проверенных API key) хранится в памяти процесса не больше
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Корзина IP клиента для запросов без ключа и с ещё не проверенным ключом:
+# случайные ключи с одного адреса не получают каждый свою полную корзину
+RATE_LIMIT_IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", "20"))
+RATE_LIMIT_IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", "100"))
+
+# Stale-while-revalidate для ленты и профилей: сколько секунд ждать свежий
+# ответ, если есть сохранённый, прежде чем отдать сохранённый
+STALE_DEADLINE = float(os.getenv("STALE_DEADLINE", "1"))
+# Сколько секунд после сохранения ответ можно отдавать вместо свежего (ответы
+# хранятся в кэше, см. CACHE_BACKEND)
+STALE_TTL = float(os.getenv("STALE_TTL", "300"))
+# Автомат защиты БД: после стольких ошибок БД подряд запросы к БД прекращаются
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# Через сколько секунд после срабатывания пропускается пробный запрос
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "10"))
+
+# Кэш: memory - в памяти процесса, redis - общий для воркеров сервер Redis
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Соединений с Redis на процесс и ограничение времени одной операции (в секундах)
+CACHE_REDIS_POOL_SIZE = int(os.getenv("CACHE_REDIS_POOL_SIZE", "10"))
+CACHE_REDIS_TIMEOUT = float(os.getenv("CACHE_REDIS_TIMEOUT", "0.5"))
+# Префикс всех ключей кэша, чтобы не пересекаться с другими данными в Redis
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "twitter:")
+# Сколько байт может занимать кэш в памяти процесса
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Время жизни записей кэша (в секундах): API key, профили, ленты
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+FEED_CACHE_TTL = float(os.getenv("FEED_CACHE_TTL", "30"))
+# Твит или лайк автора, у которого подписчиков больше, сбрасывает все ленты
+# сменой версии, а не удаляет ленту каждого подписчика по ключу
+FEED_INVALIDATION_MAX_READERS = int(os.getenv("FEED_INVALIDATION_MAX_READERS", "1000"))
+# Сколько подписчиков и подписок отдаёт профиль в режиме preview
+PROFILE_PREVIEW_SIZE = int(os.getenv("PROFILE_PREVIEW_SIZE", "10"))
+# Как часто (в секундах) фоновая задача сверяет счётчики пользователей
+USER_STATS_RECONCILE_INTERVAL = int(
+    os.getenv("USER_STATS_RECONCILE_INTERVAL", str(60 * 60))
+)
+# Сколько пользователей сверяется в одной транзакции
+USER_STATS_BATCH_SIZE = int(os.getenv("USER_STATS_BATCH_SIZE", "1000"))
+# Сколько байт может занимать индекс подписок в памяти процесса
+FOLLOW_GRAPH_MAX_BYTES = int(
+    os.getenv("FOLLOW_GRAPH_MAX_BYTES", str(256 * 1024 * 1024))
+)
+# Как часто (в секундах) индекс подписок перестраивается из БД (изменения
+# из других процессов приходят через NOTIFY, перестроение - страховка)
+FOLLOW_GRAPH_REFRESH_INTERVAL = int(os.getenv("FOLLOW_GRAPH_REFRESH_INTERVAL", "300"))
+# Сколько рекомендаций «кого читать» хранится для пользователя
+SUGGESTIONS_COUNT = int(os.getenv("SUGGESTIONS_COUNT", "20"))
+# Вес того, что кандидат уже подписан на пользователя, относительно
+# одной общей подписки
+SUGGESTIONS_FOLLOWS_YOU_WEIGHT = float(os.getenv("SUGGESTIONS_FOLLOWS_YOU_WEIGHT", "2"))
+# Сколько пользователей считается и записывается за раз
+SUGGESTIONS_BATCH_SIZE = int(os.getenv("SUGGESTIONS_BATCH_SIZE", "1000"))
+# Как часто (в секундах) пересчитываются рекомендации пользователей
+# с изменившимися подписками и как часто - рекомендации всех пользователей
+SUGGESTIONS_INTERVAL = int(os.getenv("SUGGESTIONS_INTERVAL", "300"))
+SUGGESTIONS_FULL_INTERVAL = int(
+    os.getenv("SUGGESTIONS_FULL_INTERVAL", str(24 * 60 * 60))
+)
+# Сколько id можно передать в массовую подписку одним запросом
+FOLLOWS_IMPORT_MAX_IDS = int(os.getenv("FOLLOWS_IMPORT_MAX_IDS", "1000"))
+# Сколько строк подписок читается за раз при выгрузке списка
+FOLLOWS_EXPORT_CHUNK_SIZE = int(os.getenv("FOLLOWS_EXPORT_CHUNK_SIZE", "1000"))
+# Время жизни (в секундах) кэша скрытых и заблокированных пользователей
+EXCLUSIONS_CACHE_TTL = float(os.getenv("EXCLUSIONS_CACHE_TTL", "300"))
+# Сколько пользователей может вернуть поиск за один запрос
+USER_SEARCH_MAX_LIMIT = int(os.getenv("USER_SEARCH_MAX_LIMIT", "50"))
+# Сколько запросов поиска хранит кэш префиксов процесса и сколько секунд
+# живёт запись (число подписчиков в результатах может устареть на это время)
+USER_SEARCH_CACHE_SIZE = int(os.getenv("USER_SEARCH_CACHE_SIZE", "10000"))
+USER_SEARCH_CACHE_TTL = float(os.getenv("USER_SEARCH_CACHE_TTL", "60"))
+# Поиск твитов: за сколько последних дней ищутся твиты, сколько самых новых
+# совпадений ранжируется и сколько твитов можно вернуть за один запрос
+TWEET_SEARCH_WINDOW_DAYS = int(os.getenv("TWEET_SEARCH_WINDOW_DAYS", "365"))
+TWEET_SEARCH_CANDIDATES = int(os.getenv("TWEET_SEARCH_CANDIDATES", "1000"))
+TWEET_SEARCH_MAX_LIMIT = int(os.getenv("TWEET_SEARCH_MAX_LIMIT", "50"))
+# Среди скольких самых новых твитов сначала ищутся совпадения, прежде чем
+# искать по всему окну через GIN-индекс
+TWEET_SEARCH_SCAN_LIMIT = int(os.getenv("TWEET_SEARCH_SCAN_LIMIT", "20000"))
+# Тренды хештегов: сколько лучших хештегов держится готовыми, за сколько
+# часов учитываются хештеги и за сколько секунд вклад хештега уменьшается
+# вдвое
+TRENDS_TOP_K = int(os.getenv("TRENDS_TOP_K", "50"))
+TRENDS_WINDOW_HOURS = int(os.getenv("TRENDS_WINDOW_HOURS", "24"))
+TRENDS_HALF_LIFE = float(os.getenv("TRENDS_HALF_LIFE", str(2 * 60 * 60)))
+# Как часто (в секундах) счётчики процесса сбрасываются в БД, а тренды
+# обновляются из БД
+TRENDS_FLUSH_INTERVAL = float(os.getenv("TRENDS_FLUSH_INTERVAL", "10"))
@@ -1,4 +1,5 @@
 import logging
+import os
 
 import sqlalchemy
 from sqlalchemy.ext.asyncio import (  # Импортируем асинхронный движок и сессию
@@ -8,15 +9,21 @@ from sqlalchemy.ext.asyncio import (  # Импортируем асинхрон
 from sqlalchemy.orm import sessionmaker  # Импортируем фабрику сессий
 from sqlalchemy.orm import declarative_base
 
+from app.metrics import TimedQueuePool
+
 logging.basicConfig(level=logging.DEBUG)
 logging.getLogger("sqlalchemy.engine").setLevel(logging.DEBUG)
 
-DATABASE_URL = "postgresql+asyncpg://admin:admin@db:5432/admin"
+DATABASE_URL = os.getenv(
+    "DATABASE_URL", "postgresql+asyncpg://admin:admin@db:5432/admin"
+)
 
 # Создаём асинхронный движок SQLAlchemy
 engine = create_async_engine(
     DATABASE_URL,
     echo=True,
+    # пул отдаёт в /metrics загрузку и время ожидания соединения
+    poolclass=TimedQueuePool,
 )
 
 # Создаём фабрику асинхронных сессий
@@ -32,3 +39,9 @@ Base = sqlalchemy.orm.declarative_base()
 async def get_session():
     async with async_session() as session:
         yield session
+
+
+# метод для получения фабрики сессий: нужен вычислениям, которые живут дольше
+# одного запроса и не могут пользоваться его сессией (single-flight)
+def get_session_factory():
+    return async_session
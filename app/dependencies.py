@@ -3,14 +3,19 @@ import logging
 
 from fastapi import Depends, HTTPException, Request, status
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 
+from app.cache import Cache
+from app.config import ADMIN_API_KEYS, AUTH_CACHE_TTL
 from app.database import AsyncSession, get_session
-from app.models import Follows, Users
+from app.models import Users
+from app.tracing import span
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# id и имя пользователя по API key
+auth_cache = Cache("auth", ttl=AUTH_CACHE_TTL)
+
 
 async def get_current_user(
     request: Request, session: AsyncSession = Depends(get_session)
@@ -24,21 +29,35 @@ async def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="API key is missing"
         )
     logger.info(f"api_key: {api_key}")
-    # Проверяем зарегистрирован ли такой юзер в бд
-    async with session.begin():
-        result = await session.execute(
-            select(Users)
-            .options(
-                selectinload(Users.followers).joinedload(Follows.follower),
-                selectinload(Users.following).joinedload(Follows.followed),
-            )
-            .where(Users.api_key == api_key)
+
+    async def load_user():
+        # Проверяем зарегистрирован ли такой юзер в бд
+        async with session.begin():
+            with span("auth"):
+                result = await session.execute(
+                    select(Users.id, Users.name).where(Users.api_key == api_key)
+                )
+                row = result.first()
+        return None if row is None else {"id": row.id, "name": row.name}
+
+    cached = await auth_cache.get_or_load(api_key, load_user)
+    if cached is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Invalid API key"
         )
-        user = result.scalars().first()
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Invalid API key"
-            )
+    # Пользователь не привязан к сессии: подписки и подписчиков эндпоинты
+    # берут из кэша профилей
+    user = Users(id=cached["id"], name=cached["name"], api_key=api_key)
+    # ключ проверен: ограничение частоты перестаёт тратить на него корзину IP
+    request.state.user_id = user.id
+    logger.info(f"user: {user.id}, {user.name}, {user.api_key}")
+    return user
+
 
-        logger.info(f"user: {user.id}, {user.name}, {user.api_key}")
+async def get_admin_user(user: Users = Depends(get_current_user)) -> Users:
+    """Depends - текущий пользователь, если его api_key входит в ADMIN_API_KEYS"""
+    if user.api_key not in ADMIN_API_KEYS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Admin API key required"
+        )
     return user
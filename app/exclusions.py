@@ -0,0 +1,82 @@
+import logging
+from dataclasses import dataclass
+
+from sqlalchemy import and_, exists, literal, or_, select, union_all
+
+from app.cache import Cache
+from app.config import EXCLUSIONS_CACHE_TTL
+from app.database import AsyncSession
+from app.models import Blocks, Mutes
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# скрытые и заблокированные пользователи по id пользователя
+exclusions_cache = Cache("exclusions", ttl=EXCLUSIONS_CACHE_TTL)
+
+
+@dataclass(frozen=True)
+class Exclusions:
+    """
+    Кого не показывать пользователю. blocked - блокировки в обе стороны:
+    и те, кого заблокировал пользователь, и те, кто заблокировал его
+    """
+
+    muted: frozenset[int]
+    blocked: frozenset[int]
+
+    @property
+    def hidden(self) -> frozenset[int]:
+        """Авторы, чьи твиты не попадают в ленту (только для чтения ленты)"""
+        return self.muted | self.blocked
+
+
+def blocked_between(user_id, other_id):
+    """
+    Условие для записи: один из пользователей заблокировал другого. Запись
+    проверяет блокировку в той же транзакции, а не по кэшу исключений, кэш
+    другого процесса может не знать о новой блокировке. Оба направления идут
+    по индексам blocks
+    """
+    return exists().where(
+        or_(
+            and_(Blocks.blocker_id == user_id, Blocks.blocked_id == other_id),
+            and_(Blocks.blocker_id == other_id, Blocks.blocked_id == user_id),
+        )
+    )
+
+
+async def get_exclusions(session: AsyncSession, user_id: int) -> Exclusions:
+    """
+    Множества пользователя из кэша, при промахе - одним запросом по
+    первичным ключам mutes и blocks и индексу blocked_id. Вызывается
+    внутри транзакции вызывающего
+    """
+
+    async def load_exclusions():
+        result = await session.execute(
+            union_all(
+                select(
+                    literal("muted").label("kind"), Mutes.muted_id.label("id")
+                ).where(Mutes.muter_id == user_id),
+                select(literal("blocked"), Blocks.blocked_id).where(
+                    Blocks.blocker_id == user_id
+                ),
+                select(literal("blocked"), Blocks.blocker_id).where(
+                    Blocks.blocked_id == user_id
+                ),
+            )
+        )
+        loaded = {"muted": [], "blocked": []}
+        for row in result:
+            loaded[row.kind].append(row.id)
+        return loaded
+
+    cached = await exclusions_cache.get_or_load(user_id, load_exclusions)
+    return Exclusions(
+        muted=frozenset(cached["muted"]), blocked=frozenset(cached["blocked"])
+    )
+
+
+async def invalidate_exclusions(*user_ids: int) -> None:
+    await exclusions_cache.delete(*user_ids)
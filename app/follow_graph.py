@@ -0,0 +1,354 @@
+import asyncio
+import bisect
+import logging
+import sys
+from array import array
+from collections import Counter, OrderedDict
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.config import (
+    FOLLOW_GRAPH_MAX_BYTES,
+    FOLLOW_GRAPH_REFRESH_INTERVAL,
+)
+from app.metrics import FOLLOW_GRAPH_BYTES, FOLLOW_GRAPH_LOOKUPS
+from app.models import Follows, Users
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# строк follows за одно чтение при построении индекса
+BUILD_CHUNK_SIZE = 10_000
+# канал NOTIFY: триггер follows_notify шлёт в него follower_id после коммита
+# любой подписки или отписки (миграция b5e8c3f1d920)
+FOLLOWS_CHANNEL = "follows_changed"
+
+
+def row_size(row: array) -> int:
+    return sys.getsizeof(row)
+
+
+def csr_size(users: int, follows: int) -> int:
+    """Объём CSR на users пользователей и follows подписок"""
+    return array("q").itemsize * (users + 1) + array("i").itemsize * follows
+
+
+class FollowGraph:
+    """
+    Индекс подписок в памяти процесса: для пользователя - отсортированные
+    id тех, на кого он подписан.
+
+    Основа - CSR (compressed sparse row): все списки подряд в одном
+    массиве targets, а список пользователя u - targets[offsets[u]:
+    offsets[u + 1]]. Индекс строится из follows по первичному ключу
+    (follower_id, followed_id), пока занимает не больше трёх четвертей
+    max_bytes (остальное - изменённым и холодным спискам); пользователи
+    с id от covered и дальше - «холодные»: их списки читаются из БД и
+    хранятся в LRU cold в пределах оставшегося бюджета.
+
+    Массивы CSR после построения не меняются, поэтому поиск отдаёт
+    memoryview без копирования. Подписки и отписки пишут изменённый
+    список целиком в overrides (копирование при записи); когда overrides
+    занимают больше восьмой части бюджета, индекс уплотняется в новый CSR.
+    События, пришедшие во время построения или чтения холодного списка,
+    не теряются: построение применяет их к новому индексу, а прочитанный
+    холодный список с таким событием не сохраняется.
+
+    Индекс у каждого процесса свой. Изменения из других процессов приходят
+    через LISTEN/NOTIFY (maintain_follow_graph): список подписчика
+    помечается устаревшим (stale) и при следующем обращении читается из БД.
+    Уведомления, потерянные при обрыве соединения, покрывает перестроение
+    индекса после переподключения и раз в интервал
+    """
+
+    def __init__(self, max_bytes: int = FOLLOW_GRAPH_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.clear()
+
+    def clear(self) -> None:
+        self.offsets = array("q", [0])
+        self.targets = array("i")
+        self._targets_view = memoryview(self.targets)
+        self.covered = 0
+        self.overrides: dict[int, array] = {}
+        self.overrides_bytes = 0
+        self.cold: OrderedDict[int, array] = OrderedDict()
+        self.cold_bytes = 0
+        self.stale: set[int] = set()
+        self._building = False
+        self._pending_events: list[tuple[int, int, bool]] = []
+        self._pending_stale: set[int] = set()
+        self._loading: Counter[int] = Counter()
+        self._dirty: set[int] = set()
+        self._report_size()
+
+    @property
+    def csr_bytes(self) -> int:
+        return csr_size(len(self.offsets) - 1, len(self.targets))
+
+    @property
+    def size_bytes(self) -> int:
+        return self.csr_bytes + self.overrides_bytes + self.cold_bytes
+
+    def _report_size(self) -> None:
+        FOLLOW_GRAPH_BYTES.set(self.size_bytes)
+
+    def following(self, user_id: int) -> Optional[Sequence[int]]:
+        """
+        Отсортированные id тех, на кого подписан пользователь, или None,
+        если пользователь холодный и его списка нет в памяти
+        """
+        row = self.overrides.get(user_id)
+        if row is not None:
+            return row
+        if user_id in self.stale:
+            return None
+        if user_id < self.covered:
+            return self._targets_view[self.offsets[user_id] : self.offsets[user_id + 1]]
+        row = self.cold.get(user_id)
+        if row is not None:
+            self.cold.move_to_end(user_id)
+        return row
+
+    async def get_following(self, session: AsyncSession, user_id: int):
+        """Список из индекса, а для холодного пользователя - из БД"""
+        row = self.following(user_id)
+        if row is not None:
+            FOLLOW_GRAPH_LOOKUPS.labels("hit").inc()
+            return row
+        FOLLOW_GRAPH_LOOKUPS.labels("cold").inc()
+        self._loading[user_id] += 1
+        try:
+            result = await session.execute(
+                select(Follows.followed_id)
+                .where(Follows.follower_id == user_id)
+                .order_by(Follows.followed_id)
+            )
+            row = array("i", result.scalars().all())
+        finally:
+            self._loading[user_id] -= 1
+            if not self._loading[user_id]:
+                del self._loading[user_id]
+                dirty = user_id in self._dirty
+                self._dirty.discard(user_id)
+            else:
+                dirty = user_id in self._dirty
+        if not dirty:
+            if user_id < self.covered:
+                self.stale.discard(user_id)
+                self._store_override(user_id, row)
+            else:
+                self._store_cold(user_id, row)
+        return row
+
+    def _store_override(self, user_id: int, row: array) -> None:
+        old = self.overrides.get(user_id)
+        if old is not None:
+            self.overrides_bytes -= row_size(old)
+        self.overrides[user_id] = row
+        self.overrides_bytes += row_size(row)
+        if self.overrides_bytes > self.max_bytes // 8:
+            self.compact()
+        self._report_size()
+
+    def _store_cold(self, user_id: int, row: array) -> None:
+        old = self.cold.pop(user_id, None)
+        if old is not None:
+            self.cold_bytes -= row_size(old)
+        budget = self.max_bytes - self.csr_bytes - self.overrides_bytes
+        if row_size(row) > budget:
+            self._report_size()
+            return
+        self.cold[user_id] = row
+        self.cold_bytes += row_size(row)
+        while self.cold_bytes > budget:
+            _, evicted = self.cold.popitem(last=False)
+            self.cold_bytes -= row_size(evicted)
+        self._report_size()
+
+    def follow(self, follower_id: int, followed_id: int) -> None:
+        self._apply(follower_id, followed_id, True)
+
+    def unfollow(self, follower_id: int, followed_id: int) -> None:
+        self._apply(follower_id, followed_id, False)
+
+    def _apply(self, follower_id: int, followed_id: int, add: bool) -> None:
+        if self._building:
+            self._pending_events.append((follower_id, followed_id, add))
+        if follower_id in self._loading:
+            self._dirty.add(follower_id)
+        current = self.following(follower_id)
+        if current is None:
+            # холодный список прочитается из БД уже с этим изменением
+            return
+        index = bisect.bisect_left(current, followed_id)
+        present = index < len(current) and current[index] == followed_id
+        if present == add:
+            return
+        row = array("i", current)
+        if add:
+            row.insert(index, followed_id)
+        else:
+            del row[index]
+        if follower_id < self.covered:
+            self._store_override(follower_id, row)
+        else:
+            self._store_cold(follower_id, row)
+
+    def invalidate(self, follower_id: int) -> None:
+        """
+        Подписки пользователя изменил другой процесс: список из памяти больше
+        не используется и при следующем обращении читается из БД
+        """
+        if self._building:
+            self._pending_stale.add(follower_id)
+        if follower_id in self._loading:
+            self._dirty.add(follower_id)
+        old = self.overrides.pop(follower_id, None)
+        if old is not None:
+            self.overrides_bytes -= row_size(old)
+        old = self.cold.pop(follower_id, None)
+        if old is not None:
+            self.cold_bytes -= row_size(old)
+        if follower_id < self.covered:
+            self.stale.add(follower_id)
+        self._report_size()
+
+    def on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        """Обработчик уведомлений канала FOLLOWS_CHANNEL (asyncpg)"""
+        self.invalidate(int(payload))
+
+    def compact(self) -> None:
+        """Переносит overrides в новый CSR, устаревшие списки остаются stale"""
+        offsets = array("q", [0])
+        targets = array("i")
+        for user_id in range(self.covered):
+            row = self.following(user_id)
+            if row is None:
+                row = self._targets_view[
+                    self.offsets[user_id] : self.offsets[user_id + 1]
+                ]
+            targets.extend(row)
+            offsets.append(len(targets))
+        self._swap(offsets, targets, self.covered)
+
+    def _swap(self, offsets: array, targets: array, covered: int) -> None:
+        self.offsets = offsets
+        self.targets = targets
+        self._targets_view = memoryview(targets)
+        self.covered = covered
+        self.overrides = {}
+        self.overrides_bytes = 0
+        # холодные списки пользователей, попавших в CSR, больше не нужны
+        for user_id in [user_id for user_id in self.cold if user_id < covered]:
+            self.cold_bytes -= row_size(self.cold.pop(user_id))
+        self._report_size()
+
+    async def build(self, engine: AsyncEngine) -> None:
+        """
+        Строит CSR из follows в порядке первичного ключа. Если индекс не
+        помещается в свою долю бюджета, последние по id пользователи
+        остаются холодными. События и уведомления, пришедшие во время
+        построения, применяются к готовому индексу
+        """
+        self._building = True
+        self._pending_events = []
+        self._pending_stale = set()
+        try:
+            offsets = array("q", [0])
+            targets = array("i")
+            covered = 0
+            limit = self.max_bytes * 3 // 4
+            async with engine.connect() as conn:
+                max_user_id = (
+                    await conn.execute(select(func.max(Users.id)))
+                ).scalar() or 0
+                result = await conn.stream(
+                    select(Follows.follower_id, Follows.followed_id)
+                    .order_by(Follows.follower_id, Follows.followed_id)
+                    .execution_options(yield_per=BUILD_CHUNK_SIZE)
+                )
+                async for chunk in result.partitions():
+                    for follower_id, followed_id in chunk:
+                        if follower_id >= covered:
+                            # список предыдущего пользователя закончился
+                            if csr_size(follower_id + 1, len(targets)) > limit:
+                                break
+                            while covered <= follower_id:
+                                offsets.append(len(targets))
+                                covered += 1
+                        targets.append(followed_id)
+                        offsets[covered] = len(targets)
+                    else:
+                        continue
+                    # бюджет исчерпан: пользователи с id от covered холодные
+                    logger.warning(
+                        f"follow graph exceeds {limit} bytes, "
+                        f"users from id {covered} are read from the database"
+                    )
+                    break
+                else:
+                    # пустые списки пользователей без подписок тоже в CSR
+                    if csr_size(max_user_id + 1, len(targets)) <= limit:
+                        while covered <= max_user_id:
+                            offsets.append(len(targets))
+                            covered += 1
+                await result.close()
+            self._swap(offsets, targets, covered)
+            self.stale = set()
+            for follower_id, followed_id, add in self._pending_events:
+                self._apply(follower_id, followed_id, add)
+            for follower_id in self._pending_stale:
+                self.invalidate(follower_id)
+        finally:
+            self._building = False
+            self._pending_events = []
+            self._pending_stale = set()
+        logger.info(
+            f"follow graph built: {covered} users, {len(targets)} follows, "
+            f"{self.size_bytes} bytes"
+        )
+
+
+follow_graph = FollowGraph()
+
+
+async def maintain_follow_graph(
+    engine: AsyncEngine,
+    interval: int = FOLLOW_GRAPH_REFRESH_INTERVAL,
+    graph: FollowGraph = follow_graph,
+) -> None:
+    """
+    Фоновая задача: держит соединение с LISTEN на FOLLOWS_CHANNEL, строит
+    индекс подписок и перестраивает его каждые interval секунд. Подписка
+    начинается до построения, поэтому изменения между чтением follows и
+    началом LISTEN не теряются; после обрыва соединения индекс строится заново
+    """
+    while True:
+        try:
+            async with engine.connect() as conn:
+                # соединение asyncpg: add_listener и уведомления
+                listener: Any = (await conn.get_raw_connection()).driver_connection
+                lost = asyncio.Event()
+
+                def on_lost(connection) -> None:
+                    lost.set()
+
+                listener.add_termination_listener(on_lost)
+                await listener.add_listener(FOLLOWS_CHANNEL, graph.on_notify)
+                try:
+                    while not lost.is_set():
+                        await graph.build(engine)
+                        try:
+                            await asyncio.wait_for(lost.wait(), interval)
+                        except asyncio.TimeoutError:
+                            pass
+                    logger.warning("Follow graph listener connection lost")
+                finally:
+                    await listener.remove_listener(FOLLOWS_CHANNEL, graph.on_notify)
+                    listener.remove_termination_listener(on_lost)
+        except Exception:
+            logger.exception("Failed to build follow graph")
+            await asyncio.sleep(interval)
@@ -1,36 +1,147 @@
+import asyncio
+import csv
+import io
 import logging
+import time
 from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 from pathlib import Path as PathlibPath
+from typing import AsyncIterator, Literal, Optional
 
 import aiofiles
-from fastapi import Depends, FastAPI, File, Path, Request, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import Depends, FastAPI, File, Path, Query, Request, UploadFile
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import delete, insert, update
+from sqlalchemy import (
+    and_,
+    case,
+    delete,
+    func,
+    literal,
+    literal_column,
+    or_,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import joinedload, selectinload
+from starlette.routing import Match
+
+from app import cache as app_cache
 
 # импорт для теста
-from app.config import MEDIA_DIR
-from app.database import AsyncSession, Base, async_session, engine, get_session
-from app.dependencies import get_current_user
-from app.models import Follows, Likes, Medias, Tweets, Users
+from app.admission import AdmissionMiddleware
+from app.cache import Cache
+from app.config import (
+    FEED_CACHE_TTL,
+    FEED_INVALIDATION_MAX_READERS,
+    FEED_MIN_TWEETS,
+    FEED_WINDOW_DAYS,
+    FOLLOWS_EXPORT_CHUNK_SIZE,
+    MEDIA_DIR,
+    MEMORY_ROUTE_STATS,
+    PROFILE_CACHE_TTL,
+    PROFILE_PREVIEW_SIZE,
+    TRENDS_TOP_K,
+    TWEET_SEARCH_MAX_LIMIT,
+    UPLOAD_CHUNK_SIZE,
+    USER_SEARCH_MAX_LIMIT,
+)
+from app.database import (
+    AsyncSession,
+    Base,
+    async_session,
+    engine,
+    get_session,
+    get_session_factory,
+)
+from app.dependencies import get_admin_user, get_current_user
+from app.exclusions import blocked_between, get_exclusions, invalidate_exclusions
+from app.follow_graph import follow_graph, maintain_follow_graph
+from app.memory import (
+    MemoryStatsMiddleware,
+    ensure_tracing,
+    route_memory_stats,
+    snapshots,
+    stop_tracing,
+    traced_memory,
+)
+from app.metrics import (
+    REQUEST_LATENCY,
+    REQUESTS,
+    REQUESTS_IN_FLIGHT,
+    monitor_event_loop_lag,
+    render_metrics,
+)
+from app.models import (
+    Blocks,
+    Follows,
+    Likes,
+    Medias,
+    Mutes,
+    Suggestions,
+    Tweets,
+    Users,
+    UserStats,
+)
+from app.partitions import ensure_partitions, maintain_partitions
+from app.profiling import ProfilerMiddleware
+from app.query_stats import collect_queries, log_query_stats
+from app.rate_limit import RateLimitMiddleware
+from app.schemas.api_admin_memory import (
+    ResponseMemory,
+    ResponseMemoryDiff,
+    ResponseMemorySnapshot,
+    ResponseMemoryStopped,
+)
+from app.schemas.api_admin_slow_queries import (
+    ResponseSlowQueries,
+    ResponseSlowQueriesCleared,
+)
+from app.schemas.api_admin_traces import ResponseTraces
 from app.schemas.api_likes_add_and_delete import (
     ResponseApiAddLike,
     ResponseApiDeleteLike,
 )
 from app.schemas.api_medias import ResponseApiMedias
+from app.schemas.api_trends import ResponseTrends
 from app.schemas.api_tweets import TweetListResponse
+from app.schemas.api_tweets_search import ResponseTweetSearch
 from app.schemas.api_users_me import UserMeResponse
+from app.schemas.api_users_me_follows import FollowsImport, ResponseFollowsImport
+from app.schemas.api_users_me_suggestions import ResponseSuggestions
+from app.schemas.api_users_search import ResponseUserSearch
 from app.schemas.api_users_user_id_follow_delete import Response
+from app.schemas.api_users_user_id_follows import ResponseUsersPage
 from app.schemas.get_api_users_user_id_schemas import ResponseWithUserData
 from app.schemas.post_api_tweets import AnswerApiTweets, TweetData
 from app.schemas.tweet_delete_schemas import ResponseTweetDelete
+from app.singleflight import SingleFlight
+from app.slow_queries import slow_query_log
+from app.stale_cache import StaleWhileRevalidateMiddleware
+from app.suggestions import maintain_suggestions
+from app.tracing import TracedRoute, TracingMiddleware, memory_exporter, span
+from app.trends import maintain_trends, save_hashtags_and_mentions, trend_counters
+from app.tweet_search import search_tweets
+from app.user_search import search_users
+from app.user_stats import bump_counters, follow_counters_cte, maintain_user_stats
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# коды ошибок PostgreSQL (SQLSTATE), которые эндпоинты превращают в ответы 400
+FOREIGN_KEY_VIOLATION = "23503"
+CHECK_VIOLATION = "23514"
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -41,6 +152,8 @@ async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         # Создаём все таблицы, определённые в моделях, если они ещё не созданы
         await conn.run_sync(Base.metadata.create_all)
+        # Создаём партиции tweets и likes (create_all создаёт только родителей)
+        await ensure_partitions(conn)
     # Проверяем есть ли записи в таблицах
     async with async_session() as session:
         async with session.begin():
@@ -116,13 +229,41 @@ async def lifespan(app: FastAPI):
                 )
                 logger.info("Added default likes to the database.")
 
+    # Пиковые аллокации по маршрутам считаются через tracemalloc
+    if MEMORY_ROUTE_STATS:
+        ensure_tracing()
+    # Фоновая задача заранее создаёт партиции tweets на будущие месяцы
+    partitions_task = asyncio.create_task(maintain_partitions(engine))
+    # Фоновая задача измеряет опоздание event loop для /metrics
+    loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+    # Фоновая задача строит и обновляет индекс подписок для лент
+    follow_graph_task = asyncio.create_task(maintain_follow_graph(engine))
+    # Фоновая задача пересчитывает рекомендации «кого читать»
+    suggestions_task = asyncio.create_task(maintain_suggestions(engine))
+    # Фоновая задача сверяет счётчики подписчиков, подписок и твитов
+    user_stats_task = asyncio.create_task(
+        maintain_user_stats(engine, on_corrected=invalidate_profiles)
+    )
+    # Фоновая задача сбрасывает счётчики хештегов в БД и обновляет тренды
+    trends_task = asyncio.create_task(maintain_trends(engine))
     # yield ставит точку паузы. Весь код до yield выполняется при старте
     yield
+    partitions_task.cancel()
+    loop_lag_task.cancel()
+    user_stats_task.cancel()
+    follow_graph_task.cancel()
+    suggestions_task.cancel()
+    trends_task.cancel()
+    # счётчики хештегов, накопленные после последнего сброса
+    await trend_counters.flush(engine)
+    await app_cache.cache_backend.close()
     await engine.dispose()  # Очищаем ресурсы и закрываем соединения
 
 
 # Создаём экземпляр приложения FastAPI и передаём ему механизм жизненного цикла
 app = FastAPI(lifespan=lifespan)
+# Эндпоинты и кодирование ответа попадают в трассу отдельными спанами
+app.router.route_class = TracedRoute
 # Монтируем статику для js, css
 app.mount("/css", StaticFiles(directory="app/templates/static/css"), name="css")
 app.mount("/js", StaticFiles(directory="app/templates/static/js"), name="js")
@@ -130,6 +271,86 @@ app.mount("/favicon.ico", StaticFiles(directory="app/templates"), name="favicon"
 app.mount("/media", StaticFiles(directory="media"), name="media")
 
 templates = Jinja2Templates(directory="app/templates")
+# Профилировщик подключается первым, то есть самым внутренним middleware
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MemoryStatsMiddleware)
+# Отдача сохранённых ответов и автомат защиты БД - ближе всего к эндпоинтам,
+# чтобы ответы в деградированном режиме учитывались внешними middleware
+app.add_middleware(
+    StaleWhileRevalidateMiddleware,
+    route_of=lambda scope: route_template(Request(scope)),
+)
+
+
+@app.middleware("http")
+async def count_queries(request: Request, call_next):
+    """
+    Считает SQL-выражения, полученные строки и время в БД для каждого запроса
+    и отдаёт их в заголовках X-DB-Query-Count, X-DB-Rows и X-DB-Time-Ms
+    """
+    with collect_queries() as stats:
+        response = await call_next(request)
+    response.headers["X-DB-Query-Count"] = str(stats.statements)
+    response.headers["X-DB-Rows"] = str(stats.rows)
+    response.headers["X-DB-Time-Ms"] = f"{stats.db_time * 1000:.2f}"
+    # в логе маршрут указывается шаблоном, чтобы статистику можно было группировать
+    route = request.scope.get("route")
+    path = route.path if route is not None else request.url.path
+    log_query_stats(f"{request.method} {path}", stats)
+    return response
+
+
+def route_template(request: Request) -> str:
+    """
+    Шаблон маршрута запроса (/api/users/{user_id}) для меток метрик.
+    Запросы мимо маршрутов сводятся к одной метке, чтобы не плодить ряды
+    """
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+# Допуск запросов стоит снаружи подсчёта SQL, но внутри метрик и трассировки,
+# чтобы отказы 503 попадали в них
+app.add_middleware(
+    AdmissionMiddleware, route_of=lambda scope: route_template(Request(scope))
+)
+# Ограничение частоты - снаружи допуска: отклонённый запрос не ждёт в очереди
+app.add_middleware(
+    RateLimitMiddleware, route_of=lambda scope: route_template(Request(scope))
+)
+
+
+@app.middleware("http")
+async def collect_metrics(request: Request, call_next):
+    """Считает запросы, время их обработки и запросы в работе по маршрутам"""
+    method = request.method
+    route = route_template(request)
+    in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+    in_flight.inc()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+        REQUESTS.labels(method, route, str(status_code)).inc()
+        in_flight.dec()
+
+
+# Трассировка подключается последней, то есть самым внешним middleware
+app.add_middleware(TracingMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики приложения в формате Prometheus, не требует API key"""
+    content, content_type = render_metrics()
+    return PlainTextResponse(content=content, media_type=content_type)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -141,30 +362,283 @@ async def root(request: Request):
     return templates.TemplateResponse(request, "index.html", {"request": request})
 
 
+# Профили (с подписчиками и подписками) по id пользователя и ленты по id
+# читателя. Новый твит, лайк или удаление сбрасывают ленты автора твита и его
+# подписчиков (invalidate_feeds), остальные ленты остаются в кэше
+profile_cache = Cache("profile", ttl=PROFILE_CACHE_TTL)
+feed_cache = Cache("feed", ttl=FEED_CACHE_TTL)
+user_profile_flight = SingleFlight("user_profile")
+
+
+def select_follows(
+    user_id: int,
+    direction: Literal["followers", "following"],
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    with_total: bool = False,
+):
+    """
+    Подписчики или подписки пользователя по возрастанию id второго участника.
+    Идёт по индексам follows: подписчики - (followed_id, follower_id),
+    подписки - первичный ключ (follower_id, followed_id). after - keyset-курсор,
+    with_total добавляет total - число всех строк до LIMIT
+    """
+    if direction == "followers":
+        own, other = Follows.followed_id, Follows.follower_id
+    else:
+        own, other = Follows.follower_id, Follows.followed_id
+    total = func.count().over() if with_total else literal(None)
+    query = (
+        select(
+            literal(direction).label("direction"),
+            Users.id,
+            Users.name,
+            total.label("total"),
+        )
+        .join(Follows, other == Users.id)
+        .where(own == user_id)
+        .order_by(other)
+    )
+    if after is not None:
+        query = query.where(other > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def load_user_profile(
+    session_factory: async_sessionmaker, user_id: int, preview: bool = False
+):
+    """
+    Профиль пользователя со счётчиками в виде словаря, None - пользователя
+    нет. В режиме preview списки содержат только первые PROFILE_PREVIEW_SIZE
+    пользователей. Читает в своей сессии, т.к. результат делят между собой
+    одновременные запросы (см. user_profile_flight)
+    """
+    limit = PROFILE_PREVIEW_SIZE if preview else None
+    async with session_factory() as session, session.begin():
+        with span("orm.load", entity="Users"):
+            result = await session.execute(
+                select(
+                    Users.name,
+                    UserStats.followers_count,
+                    UserStats.following_count,
+                    UserStats.tweets_count,
+                )
+                .outerjoin(UserStats, UserStats.user_id == Users.id)
+                .where(Users.id == user_id)
+            )
+            row = result.one_or_none()
+            if row is None:
+                return None
+            # строки счётчиков ещё нет (её создаст сверка) - числа
+            # подписчиков и подписок считаются в запросе списков
+            with_total = row.followers_count is None
+            # подписчики и подписки одним запросом
+            result = await session.execute(
+                union_all(
+                    select_follows(user_id, "followers", None, limit, with_total),
+                    select_follows(user_id, "following", None, limit, with_total),
+                )
+            )
+            rows = result.all()
+    profile = {
+        "id": user_id,
+        "name": row.name,
+        "followers_count": row.followers_count or 0,
+        "following_count": row.following_count or 0,
+        "tweets_count": row.tweets_count or 0,
+        "followers": [],
+        "following": [],
+    }
+    for direction, other_id, other_name, total in rows:
+        profile[direction].append({"id": other_id, "name": other_name})
+        if with_total:
+            profile[f"{direction}_count"] = total
+    logger.info(f"followers: {profile['followers']}")
+    logger.info(f"following: {profile['following']}")
+    return profile
+
+
+async def get_user_profile(
+    session_factory: async_sessionmaker, user_id: int, preview: bool = False
+):
+    """Профиль из кэша; при промахе одновременные запросы ждут одно чтение"""
+    key = f"{user_id}:preview" if preview else user_id
+    return await profile_cache.get_or_load(
+        key,
+        lambda: user_profile_flight.do(
+            key, lambda: load_user_profile(session_factory, user_id, preview)
+        ),
+    )
+
+
+async def invalidate_profiles(user_ids: list[int]) -> None:
+    await profile_cache.delete(
+        *user_ids, *(f"{user_id}:preview" for user_id in user_ids)
+    )
+
+
+async def invalidate_follow_caches(follower_id: int, followed_id: int) -> None:
+    """Подписка или отписка меняет оба профиля и ленту подписчика"""
+    await invalidate_profiles([follower_id, followed_id])
+    await feed_cache.delete(follower_id)
+
+
+async def invalidate_feeds(session: AsyncSession, author_id: int) -> None:
+    """
+    Твит автора попадает только в ленты самого автора и его подписчиков.
+    Вызывается после фиксации транзакции: подписчик, подписавшийся позже
+    чтения списка, сбрасывает свою ленту сам при подписке. Подписчиков
+    читается не больше FEED_INVALIDATION_MAX_READERS + 1: у популярного
+    автора вместо удаления ключа каждого подписчика сбрасываются все ленты
+    """
+    async with session.begin():
+        result = await session.execute(
+            select(Follows.follower_id)
+            .where(Follows.followed_id == author_id)
+            .limit(FEED_INVALIDATION_MAX_READERS + 1)
+        )
+        readers = result.scalars().all()
+    if len(readers) > FEED_INVALIDATION_MAX_READERS:
+        await feed_cache.invalidate()
+    else:
+        await feed_cache.delete(author_id, *readers)
+
+
+PREVIEW_DESCRIPTION = (
+    "Вернуть только первых подписчиков и подписки (остальные - через "
+    "/api/users/{id}/followers и /following)"
+)
+
+
 @app.get("/api/users/me", response_model=UserMeResponse)
-async def get_api_user_me(user: Users = Depends(get_current_user)):
+async def get_api_user_me(
+    preview: bool = Query(False, description=PREVIEW_DESCRIPTION),
+    user: Users = Depends(get_current_user),
+    session_factory: async_sessionmaker = Depends(get_session_factory),
+):
     """
     конечная точка где пользователю отдается информация
     о его профиле
     """
-    # Получаем список подписчиков
-    followers = [{"id": f.follower.id, "name": f.follower.name} for f in user.followers]
-    logger.info(f"followers: {followers}")
-    # Получаем список подписок (на кого подписан пользователь)
-    following = [{"id": f.followed.id, "name": f.followed.name} for f in user.following]
-    logger.info(f"following: {following}")
-
+    profile = await get_user_profile(session_factory, user.id, preview)
     return {
         "result": "true",
         "user": {
             "id": user.id,
             "name": user.name,
-            "followers": followers,
-            "following": following,
+            "followers_count": profile["followers_count"] if profile else 0,
+            "following_count": profile["following_count"] if profile else 0,
+            "tweets_count": profile["tweets_count"] if profile else 0,
+            "followers": profile["followers"] if profile else [],
+            "following": profile["following"] if profile else [],
         },
     }
 
 
+@app.get("/api/users/me/suggestions", response_model=ResponseSuggestions)
+async def get_suggestions(
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Конечная точка для рекомендаций «кого читать». Рекомендации считает
+    фоновая задача; те, на кого пользователь подписался после расчёта,
+    отбрасываются по индексу подписок, скрытые и заблокированные в обе
+    стороны - по исключениям, как в ленте
+    """
+    async with session.begin():
+        result = await session.execute(
+            select(
+                Suggestions.suggested_id,
+                Users.name,
+                Suggestions.mutual_count,
+                Suggestions.follows_you,
+            )
+            .join(Users, Users.id == Suggestions.suggested_id)
+            .where(Suggestions.user_id == user.id)
+            .order_by(Suggestions.rank)
+        )
+        rows = result.all()
+        following = await follow_graph.get_following(session, user.id)
+        hidden = (await get_exclusions(session, user.id)).hidden
+    skipped = hidden.union(following)
+    return {
+        "result": True,
+        "users": [
+            {
+                "id": row.suggested_id,
+                "name": row.name,
+                "mutual_count": row.mutual_count,
+                "follows_you": row.follows_you,
+            }
+            for row in rows
+            if row.suggested_id not in skipped
+        ],
+    }
+
+
+# объявлен раньше /api/users/{user_id}, иначе "search" разбирался бы как id
+@app.get("/api/users/search", response_model=ResponseUserSearch)
+async def get_users_found(
+    q: str = Query(
+        ..., min_length=1, max_length=100, description="часть имени пользователя"
+    ),
+    limit: int = Query(
+        10, ge=1, le=USER_SEARCH_MAX_LIMIT, description="сколько вернуть"
+    ),
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Поиск и автодополнение пользователей по имени. С трёх символов ищется
+    подстрока, короче - начало имени; оба запроса идут по триграммному
+    индексу. Частые запросы и их продолжения отдаются из кэша префиксов
+    процесса без обращения к БД
+    """
+    return {"result": True, "users": await search_users(session, q, limit)}
+
+
+def feed_lower_bound(author_ids: list[int], feed_since: datetime):
+    """
+    Нижняя граница created_at ленты скалярным подзапросом: начало окна
+    FEED_WINDOW_DAYS, а если в окне меньше FEED_MIN_TWEETS твитов - дата
+    FEED_MIN_TWEETS-го по новизне твита до окна (все старые твиты, если
+    их меньше). Подзапросы выполняются как InitPlan до чтения ленты: твиты
+    до окна читаются только для редкой ленты, а лишние партиции основного
+    запроса отсекаются уже при выполнении по готовой границе
+    """
+    authors = Tweets.user_id.in_(author_ids)
+    in_window = (
+        select(func.count())
+        .select_from(
+            select(Tweets.id)
+            .where(authors, Tweets.created_at >= feed_since)
+            .limit(FEED_MIN_TWEETS)
+            .subquery()
+        )
+        .scalar_subquery()
+    )
+    older = (
+        select(Tweets.created_at)
+        .where(authors, Tweets.created_at < feed_since)
+        .order_by(Tweets.created_at.desc())
+        .offset(FEED_MIN_TWEETS - 1)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return select(
+        case(
+            (
+                in_window < FEED_MIN_TWEETS,
+                func.coalesce(older, literal_column("'-infinity'::timestamptz")),
+            ),
+            else_=feed_since,
+        )
+    ).scalar_subquery()
+
+
 @app.get("/api/tweets", response_model=TweetListResponse)
 async def get_twitter_feed(
     user: Users = Depends(get_current_user),
@@ -174,55 +648,125 @@ async def get_twitter_feed(
     конечная точка, где на клиент отдается лента твиттера
     """
     logger.info(f"Обьект юзера: {user}")
-    # возвращаем список id всех пользователей, на которых подписан текущий пользователь [2,3]
-    following_ids = [f.followed_id for f in user.following]
-    logger.info(
-        f"список id всех пользователей, на которых подписан текущий пользователь: {following_ids}"
-    )
-    author_ids = [user.id] + following_ids
-    logger.info(f"Список id юзеров для ленты, кого показывать: {author_ids}")
-    # Запрос на получение всех твитов указанных пользователей
-    tweets_query = (
-        select(Tweets)
-        .where(Tweets.user_id.in_(author_ids))
-        .options(
-            selectinload(Tweets.likes).joinedload(Likes.user),
-            selectinload(Tweets.medias),
-        )
-        .order_by(Tweets.created_at.desc())
-    )
 
-    async with session.begin():
-        result = await session.execute(tweets_query)
-        tweets = result.scalars().all()
-        for tweet in tweets:
-            logger.info(
+    async def load_feed():
+        # Ограничение по дате позволяет отсечь старые партиции tweets;
+        # редкая лента дополняется твитами до окна (feed_lower_bound)
+        feed_since = datetime.now(timezone.utc) - timedelta(days=FEED_WINDOW_DAYS)
+        async with session.begin():
+            # id всех пользователей, на которых подписан текущий пользователь,
+            # из индекса подписок (для холодного пользователя - из БД)
+            following_ids = await follow_graph.get_following(session, user.id)
+            # скрытые и заблокированные авторы отсекаются до запроса твитов
+            hidden = (await get_exclusions(session, user.id)).hidden
+            author_ids = [
+                user.id,
+                *(author_id for author_id in following_ids if author_id not in hidden),
+            ]
+            logger.info(f"Список id юзеров для ленты, кого показывать: {author_ids}")
+            # Запрос на получение всех твитов указанных пользователей
+            tweets_query = (
+                select(Tweets)
+                .where(
+                    Tweets.user_id.in_(author_ids),
+                    Tweets.created_at >= feed_lower_bound(author_ids, feed_since),
+                )
+                .options(
+                    # лайки читаются из hash-партиций likes, их авторы - по первичному ключу
+                    selectinload(Tweets.likes).selectinload(Likes.user),
+                    selectinload(Tweets.medias),
+                    # автор - many-to-one, присоединяется к той же выборке
+                    joinedload(Tweets.user),
+                )
+                .order_by(Tweets.created_at.desc())
+            )
+            # собственное время спана orm.load - разбор строк в объекты ORM
+            with span("orm.load", entity="Tweets"):
+                result = await session.execute(tweets_query)
+                tweets = result.scalars().all()
+            for tweet in tweets:
+                logger.info(
+                    {
+                        "id": tweet.id,
+                        "content": tweet.content,
+                        "user_id": tweet.user_id,
+                        "created_at": tweet.created_at,
+                        "media_links": tweet.medias,
+                        "likes": tweet.likes,
+                    }
+                )
+
+        with span("response.build", tweets=len(tweets)):
+            return [
                 {
                     "id": tweet.id,
                     "content": tweet.content,
-                    "user_id": tweet.user_id,
-                    "created_at": tweet.created_at,
-                    "media_links": tweet.medias,
-                    "likes": tweet.likes,
+                    "attachments": [
+                        f"media/{media.path_url}" for media in tweet.medias
+                    ],
+                    "author": {"id": tweet.user.id, "name": tweet.user.name},
+                    "likes": [
+                        {"user_id": like.user.id, "name": like.user.name}
+                        for like in tweet.likes
+                    ],
                 }
+                for tweet in tweets
+            ]
+
+    feed = await feed_cache.get_or_load(user.id, load_feed)
+    return {"result": True, "tweets": feed}
+
+
+@app.get("/api/tweets/search", response_model=ResponseTweetSearch)
+async def get_tweets_found(
+    q: str = Query(
+        ...,
+        min_length=1,
+        max_length=200,
+        description='запрос: слова, "фраза", -исключить, OR',
+    ),
+    limit: int = Query(
+        20, ge=1, le=TWEET_SEARCH_MAX_LIMIT, description="размер страницы"
+    ),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    network: bool = Query(False, description="только свои твиты и твиты подписок"),
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Полнотекстовый поиск твитов по русской и английской морфологии,
+    по убыванию релевантности, затем даты, с подсвеченными фрагментами.
+    Скрытые и заблокированные авторы не попадают в выдачу
+    """
+    async with session.begin():
+        hidden = (await get_exclusions(session, user.id)).hidden
+        author_ids = None
+        if network:
+            following_ids = await follow_graph.get_following(session, user.id)
+            author_ids = [user.id, *following_ids]
+        try:
+            return await search_tweets(session, q, limit, cursor, author_ids, hidden)
+        except ValueError as error:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "result": False,
+                    "error_type": "BadRequest",
+                    "error_message": str(error),
+                },
             )
 
-    return {
-        "result": True,
-        "tweets": [
-            {
-                "id": tweet.id,
-                "content": tweet.content,
-                "attachments": [f"media/{media.path_url}" for media in tweet.medias],
-                "author": {"id": tweet.user.id, "name": tweet.user.name},
-                "likes": [
-                    {"user_id": like.user.id, "name": like.user.name}
-                    for like in tweet.likes
-                ],
-            }
-            for tweet in tweets
-        ],
-    }
+
+@app.get("/api/trends", response_model=ResponseTrends)
+async def get_trends(
+    limit: int = Query(10, ge=1, le=TRENDS_TOP_K, description="сколько вернуть"),
+    user: Users = Depends(get_current_user),
+):
+    """
+    Тренды хештегов: готовый top процесса, который фоновая задача
+    обновляет по поминутным счётчикам, без запросов к tweets
+    """
+    return {"result": True, "trends": trend_counters.trends(limit)}
 
 
 @app.post("/api/medias", response_model=ResponseApiMedias)
@@ -245,11 +789,11 @@ async def get_media_download(
                 "error_message": "Missing mandatory parameter," " file in request body",
             },
         )
-    # читаем входящий файл и пишем его в нисходящий файл в директорию media
-    # async with aiofiles.open(f"media/{file.filename}", 'wb') as out_file:
+    # читаем входящий файл блоками и пишем его в директорию media,
+    # чтобы не держать в памяти весь файл целиком
     async with aiofiles.open(MEDIA_DIR / file.filename, "wb") as out_file:
-        content = await file.read()
-        await out_file.write(content)
+        while content := await file.read(UPLOAD_CHUNK_SIZE):
+            await out_file.write(content)
 
     # вносим данные в бд(ссылку на файл, id)
     async with session.begin():
@@ -275,6 +819,11 @@ async def get_create_tweet(
             await session.flush()
             tweet_id = new_tweet.id
             logger.info(f"tweet_id: {tweet_id}")
+            tags = await save_hashtags_and_mentions(session, new_tweet)
+            await bump_counters(session, {user.id: {"tweets_count": 1}})
+        trend_counters.record(tags, new_tweet.created_at)
+        await invalidate_feeds(session, user.id)
+        await invalidate_profiles([user.id])
         return {"result": True, "tweet_id": tweet_id}
     # если же список идентификаторов медиафайлов не пустой
     else:
@@ -290,7 +839,12 @@ async def get_create_tweet(
                 .values(tweet_id=tweet_id)
             )
             await session.execute(update_query)
+            tags = await save_hashtags_and_mentions(session, new_tweet)
+            await bump_counters(session, {user.id: {"tweets_count": 1}})
 
+        trend_counters.record(tags, new_tweet.created_at)
+        await invalidate_feeds(session, user.id)
+        await invalidate_profiles([user.id])
         return AnswerApiTweets(result=True, tweet_id=tweet_id)  # type: ignore[arg-type]
 
 
@@ -320,12 +874,9 @@ async def get_tweet_deleted(
                     "error_message": "Tweet not found",
                 },
             )
-        # Сравниваем api-key текущего юзера с api-key юзера удаляемого твита
-        api_key_weaving_user = (
-            user.api_key
-        )  # API-ключ текущего пользователя (автор запроса)
-        api_key_of_tweet_to_be_removed = tweet.user.api_key  # API-ключ владельца твита
-        if api_key_weaving_user != api_key_of_tweet_to_be_removed:
+        # Сравниваем текущего юзера с автором удаляемого твита по id,
+        # без ленивой загрузки tweet.user (лишний запрос к users)
+        if tweet.user_id != user.id:
             return JSONResponse(
                 status_code=403,
                 content={
@@ -335,9 +886,13 @@ async def get_tweet_deleted(
                 },
             )
         # если все окей, удаляем сам твит, и каскад удалит все связные данные
-        if tweet:
-            await session.delete(tweet)
-            return {"result": True}
+        await session.delete(tweet)
+        await bump_counters(session, {user.id: {"tweets_count": -1}})
+    # кэш сбрасывается после фиксации транзакции, иначе его успеют
+    # заполнить прежними данными
+    await invalidate_feeds(session, user.id)
+    await invalidate_profiles([user.id])
+    return {"result": True}
 
 
 @app.post("/api/tweets/{tweet_id}/likes", response_model=ResponseApiAddLike)
@@ -367,8 +922,8 @@ async def get_like_mark(
                     "error_message": "Tweet not found",
                 },
             )
-        # Проверка: уже ли поставлен лайк этим пользователем
         current_user_id = user.id
+        # Проверка: уже ли поставлен лайк этим пользователем
         # Запрос на получение записи о лайке юзера переданному id твита
         result = await session.execute(
             select(Likes).where(
@@ -386,10 +941,25 @@ async def get_like_mark(
                     "error_message": "Already liked",
                 },
             )
-        # Если все проверки пройдены, создаем лайк
-        new_like = Likes(user_id=user.id, tweet_id=tweet_id)
-        session.add(new_like)
+        # Если все проверки пройдены, создаем лайк. Твиты заблокированных
+        # и заблокировавших пользователей лайкать нельзя: блокировка
+        # проверяется самой вставкой
+        result = await session.execute(
+            insert(Likes)
+            .from_select(
+                ["user_id", "tweet_id"],
+                select(literal(current_user_id), literal(tweet_id)).where(
+                    ~blocked_between(current_user_id, tweet.user_id)
+                ),
+            )
+            .returning(Likes.tweet_id)
+        )
+        if result.scalar_one_or_none() is None:
+            return user_blocked()
 
+    # твит без автора не попадает ни в одну ленту
+    if tweet.user_id is not None:
+        await invalidate_feeds(session, tweet.user_id)
     return {"result": True}
 
 
@@ -446,6 +1016,9 @@ async def get_delete_like(
             )
         )
 
+    # твит без автора не попадает ни в одну ленту
+    if tweet.user_id is not None:
+        await invalidate_feeds(session, tweet.user_id)
     return {"result": True}
 
 
@@ -457,55 +1030,236 @@ async def get_user_data_by_id(
         description="ID произвольного пользователя",
         ge=1,  # значение больше или равно 1
     ),
+    preview: bool = Query(False, description=PREVIEW_DESCRIPTION),
     user: Users = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session),
+    session_factory: async_sessionmaker = Depends(get_session_factory),
 ):
     """
     Конечная точка для получения информации о
     произвольном профиле по его id
     """
-    # Получаем запрашиваемого юзера
+    profile = await get_user_profile(session_factory, user_id, preview)
+    if profile is None:
+        return user_not_found()
+    return {"result": True, "user": profile}
+
+
+def user_not_found() -> JSONResponse:
+    return JSONResponse(
+        status_code=404,
+        content={
+            "result": False,
+            "error_type": "NotFound",
+            "error_message": "User not found",
+        },
+    )
+
+
+def user_blocked() -> JSONResponse:
+    return JSONResponse(
+        status_code=403,
+        content={
+            "result": False,
+            "error_type": "Forbidden",
+            "error_message": "User is blocked",
+        },
+    )
+
+
+def constraint_violation(error: IntegrityError, self_message: str) -> JSONResponse:
+    """
+    Ответ 400 на нарушение ограничения при связи с другим пользователем:
+    связь с собой (CHECK) или несуществующий пользователь (внешний ключ).
+    Прочие ошибки пробрасываются
+    """
+    sqlstate = getattr(error.orig, "sqlstate", None)
+    if sqlstate == CHECK_VIOLATION:
+        message = self_message
+    elif sqlstate == FOREIGN_KEY_VIOLATION:
+        message = "User not found"
+    else:
+        raise error
+    return JSONResponse(
+        status_code=400,
+        content={
+            "result": False,
+            "error_type": "BadRequest",
+            "error_message": message,
+        },
+    )
+
+
+async def get_follows_page(
+    session: AsyncSession,
+    user_id: int,
+    direction: Literal["followers", "following"],
+    cursor: Optional[int],
+    limit: int,
+):
+    """
+    Страница подписчиков или подписок. Курсор - id последнего пользователя
+    предыдущей страницы, поэтому страница читается по индексу без OFFSET
+    """
+    result = await session.execute(
+        select_follows(user_id, direction, after=cursor, limit=limit + 1)
+    )
+    rows = result.all()
+    if not rows and cursor is None:
+        # пустой список или нет пользователя - различаем только здесь
+        result = await session.execute(select(Users.id).where(Users.id == user_id))
+        if result.scalar_one_or_none() is None:
+            return user_not_found()
+    users = [{"id": row.id, "name": row.name} for row in rows[:limit]]
+    return {
+        "result": True,
+        "users": users,
+        "next_cursor": users[-1]["id"] if len(rows) > limit else None,
+    }
+
+
+@app.get("/api/users/{user_id}/followers", response_model=ResponseUsersPage)
+async def get_user_followers(
+    user_id: int = Path(..., title="User id", ge=1),
+    cursor: Optional[int] = Query(
+        None, ge=1, description="next_cursor предыдущей страницы"
+    ),
+    limit: int = Query(20, ge=1, le=100, description="размер страницы"),
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """Подписчики пользователя постранично, по возрастанию id"""
+    return await get_follows_page(session, user_id, "followers", cursor, limit)
+
+
+@app.get("/api/users/{user_id}/following", response_model=ResponseUsersPage)
+async def get_user_following(
+    user_id: int = Path(..., title="User id", ge=1),
+    cursor: Optional[int] = Query(
+        None, ge=1, description="next_cursor предыдущей страницы"
+    ),
+    limit: int = Query(20, ge=1, le=100, description="размер страницы"),
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """Подписки пользователя постранично, по возрастанию id"""
+    return await get_follows_page(session, user_id, "following", cursor, limit)
+
+
+async def stream_following_csv(
+    session_factory: async_sessionmaker, user_id: int
+) -> AsyncIterator[str]:
+    """
+    Подписки пользователя в CSV (id,name): строки читаются курсором
+    пачками по FOLLOWS_EXPORT_CHUNK_SIZE и отдаются по мере чтения
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["id", "name"])
+    async with session_factory() as session:
+        result = await session.stream(
+            select_follows(user_id, "following").execution_options(
+                yield_per=FOLLOWS_EXPORT_CHUNK_SIZE
+            )
+        )
+        async for rows in result.partitions():
+            writer.writerows((row.id, row.name) for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+@app.get("/api/users/{user_id}/following/export", response_class=StreamingResponse)
+async def get_following_exported(
+    user_id: int = Path(..., title="User id", ge=1),
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    session_factory: async_sessionmaker = Depends(get_session_factory),
+):
+    """
+    Выгрузка всех подписок пользователя в CSV. Ответ передаётся потоком,
+    список не собирается в памяти целиком; формат подходит для
+    POST /api/users/me/follows после разбора id
+    """
     async with session.begin():
+        result = await session.execute(select(Users.id).where(Users.id == user_id))
+        if result.scalar_one_or_none() is None:
+            return user_not_found()
+    return StreamingResponse(
+        stream_following_csv(session_factory, user_id),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f'attachment; filename="following-{user_id}.csv"'
+        },
+    )
+
+
+@app.post("/api/users/me/follows", response_model=ResponseFollowsImport)
+async def get_subscriptions_imported(
+    follows: FollowsImport,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Массовая подписка на список пользователей. Одно выражение: CTE found
+    проверяет, какие id существуют, inserted вставляет подписки на них одним
+    многострочным INSERT ... ON CONFLICT DO NOTHING, а счётчики меняются
+    тем же выражением. Заблокированные в любую сторону id отсеиваются той же
+    вставкой. Кэши профилей и лента сбрасываются один раз на запрос
+    """
+    current_user_id = user.id
+    user_ids = list(dict.fromkeys(follows.user_ids))
+    async with session.begin():
+        found = select(Users.id).where(Users.id.in_(user_ids)).cte("found")
+        blocked = blocked_between(current_user_id, found.c.id)
+        inserted = (
+            insert(Follows)
+            .from_select(
+                ["follower_id", "followed_id"],
+                select(literal(current_user_id), found.c.id).where(
+                    found.c.id != current_user_id, ~blocked
+                )
+                # строки блокируются по возрастанию id, как в счётчиках
+                .order_by(found.c.id),
+            )
+            .on_conflict_do_nothing()
+            .returning(Follows.follower_id, Follows.followed_id)
+            .cte("inserted")
+        )
         result = await session.execute(
-            select(Users)
-            .options(
-                selectinload(Users.followers).joinedload(Follows.follower),
-                selectinload(Users.following).joinedload(Follows.followed),
+            select(
+                found.c.id,
+                inserted.c.followed_id.is_not(None).label("created"),
+                blocked.label("blocked"),
             )
-            .where(Users.id == user_id)
+            .outerjoin(inserted, inserted.c.followed_id == found.c.id)
+            .add_cte(follow_counters_cte(inserted, 1))
         )
+        rows = result.all()
+    created = {row.id: row.created for row in rows}
+    blocked_ids = {row.id for row in rows if row.blocked}
 
-        requested_user = result.scalars().first()
-        if requested_user is None:
-            return JSONResponse(
-                status_code=404,
-                content={
-                    "result": False,
-                    "error_type": "NotFound",
-                    "error_message": "User not found",
-                },
-            )
-        # Получаем список подписчиков
-        followers = [
-            {"id": f.follower.id, "name": f.follower.name}
-            for f in requested_user.followers
-        ]
-        logger.info(f"followers: {followers}")
-        # Получаем список подписок (на кого подписан пользователь)
-        following = [
-            {"id": f.followed.id, "name": f.followed.name}
-            for f in requested_user.following
-        ]
-        logger.info(f"following: {following}")
+    followed = [user_id for user_id, is_new in created.items() if is_new]
+    for followed_id in followed:
+        follow_graph.follow(current_user_id, followed_id)
+    if followed:
+        await invalidate_profiles([current_user_id, *followed])
+        await feed_cache.delete(current_user_id)
+
+    def status_of(user_id: int) -> str:
+        if user_id not in created:
+            return "not_found"
+        if user_id in blocked_ids:
+            return "blocked"
+        if user_id == current_user_id:
+            return "self"
+        return "followed" if created[user_id] else "already_following"
 
     return {
         "result": True,
-        "user": {
-            "id": user_id,
-            "name": requested_user.name,
-            "followers": followers,
-            "following": following,
-        },
+        "results": [
+            {"id": user_id, "status": status_of(user_id)} for user_id in user_ids
+        ],
     }
 
 
@@ -520,18 +1274,25 @@ async def get_unsubscribe(
     user: Users = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
-    """Конечная точка для отписки от другого пользователя"""
-    # сперва проверяем существует ли такая подписка
+    """
+    Конечная точка для отписки от другого пользователя. Удаление подписки
+    и счётчики - одно выражение DELETE ... RETURNING
+    """
     current_user_id = user.id
+    deleted = (
+        delete(Follows)
+        .where(Follows.follower_id == current_user_id, Follows.followed_id == user_id)
+        .returning(Follows.follower_id, Follows.followed_id)
+        .cte("deleted")
+    )
     async with session.begin():
         result = await session.execute(
-            select(Follows).where(
-                Follows.follower_id == current_user_id, Follows.followed_id == user_id
-            )
+            select(func.count())
+            .select_from(deleted)
+            .add_cte(follow_counters_cte(deleted, -1))
         )
-        subscription = result.scalar_one_or_none()
-
-        if subscription is None:
+        # одновременная отписка могла удалить строку раньше
+        if not result.scalar_one():
             return JSONResponse(
                 status_code=404,
                 content={
@@ -540,13 +1301,9 @@ async def get_unsubscribe(
                     "error_message": "Subscription not found",
                 },
             )
-        # Если все проверки пройдены и подписка найдена, то удаляем ее
-        await session.execute(
-            delete(Follows).where(
-                Follows.follower_id == current_user_id, Follows.followed_id == user_id
-            )
-        )
 
+    follow_graph.unfollow(current_user_id, user_id)
+    await invalidate_follow_caches(current_user_id, user_id)
     return {"result": True}
 
 
@@ -561,39 +1318,314 @@ async def get_subscription(
     user: Users = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
-    """Конечная точка для получения подписки на другого пользователя"""
-    # проверяем существует ли такой пользователь
-    async with session.begin():
-        result = await session.execute(select(Users).where(Users.id == user_id))
-        target_user = result.scalar_one_or_none()
-        if target_user is None:
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "result": False,
-                    "error_type": "BadRequest",
-                    "error_message": "User not found",
-                },
+    """
+    Конечная точка для получения подписки на другого пользователя.
+    Подписка и счётчики - одно выражение INSERT ... ON CONFLICT DO NOTHING
+    RETURNING: существующая подписка не возвращает строку, несуществующий
+    пользователь нарушает внешний ключ, подписка на себя - ограничение
+    ck_follows_not_self. Блокировку в любую сторону проверяет сама вставка
+    """
+    current_user_id = user.id
+    blocked = blocked_between(current_user_id, user_id)
+    inserted = (
+        insert(Follows)
+        .from_select(
+            ["follower_id", "followed_id"],
+            select(literal(current_user_id), literal(user_id)).where(~blocked),
+        )
+        .on_conflict_do_nothing()
+        .returning(Follows.follower_id, Follows.followed_id)
+        .cte("inserted")
+    )
+    try:
+        async with session.begin():
+            result = await session.execute(
+                select(
+                    select(func.count())
+                    .select_from(inserted)
+                    .scalar_subquery()
+                    .label("created"),
+                    blocked.label("blocked"),
+                ).add_cte(follow_counters_cte(inserted, 1))
+            )
+            created, is_blocked = result.one()
+    except IntegrityError as error:
+        return constraint_violation(error, "Cannot follow yourself")
+    if is_blocked:
+        return user_blocked()
+    if not created:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "result": False,
+                "error_type": "BadRequest",
+                "error_message": "Subscription already made",
+            },
+        )
+
+    follow_graph.follow(current_user_id, user_id)
+    await invalidate_follow_caches(current_user_id, user_id)
+    return {"result": True}
+
+
+@app.post("/api/users/{user_id}/mute", response_model=Response)
+async def get_user_muted(
+    user_id: int = Path(..., title="User id", ge=1),
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Скрыть твиты пользователя из ленты, не отписываясь. Одно выражение
+    INSERT ... ON CONFLICT DO NOTHING RETURNING, ошибки - как у подписки
+    """
+    current_user_id = user.id
+    try:
+        async with session.begin():
+            result = await session.execute(
+                insert(Mutes)
+                .values(muter_id=current_user_id, muted_id=user_id)
+                .on_conflict_do_nothing()
+                .returning(Mutes.muted_id)
             )
-    # проверяем существует ли такая подписка
+            created = result.scalar_one_or_none() is not None
+    except IntegrityError as error:
+        return constraint_violation(error, "Cannot mute yourself")
+    if not created:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "result": False,
+                "error_type": "BadRequest",
+                "error_message": "User already muted",
+            },
+        )
+
+    await invalidate_exclusions(current_user_id)
+    await feed_cache.delete(current_user_id)
+    return {"result": True}
+
+
+@app.delete("/api/users/{user_id}/mute", response_model=Response)
+async def get_user_unmuted(
+    user_id: int = Path(..., title="User id", ge=1),
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """Вернуть твиты пользователя в ленту"""
     current_user_id = user.id
     async with session.begin():
         result = await session.execute(
-            select(Follows).where(
-                Follows.follower_id == current_user_id, Follows.followed_id == user_id
+            delete(Mutes)
+            .where(Mutes.muter_id == current_user_id, Mutes.muted_id == user_id)
+            .returning(Mutes.muted_id)
+        )
+        deleted = result.scalar_one_or_none() is not None
+    if not deleted:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "result": False,
+                "error_type": "NotFound",
+                "error_message": "Mute not found",
+            },
+        )
+
+    await invalidate_exclusions(current_user_id)
+    await feed_cache.delete(current_user_id)
+    return {"result": True}
+
+
+@app.post("/api/users/{user_id}/block", response_model=Response)
+async def get_user_blocked(
+    user_id: int = Path(..., title="User id", ge=1),
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Заблокировать пользователя. Одно выражение: вставка в blocks, удаление
+    подписок в обе стороны и изменение счётчиков. Подписки удаляются и при
+    повторной блокировке - на случай подписки из транзакции, шедшей
+    одновременно с первой блокировкой
+    """
+    current_user_id = user.id
+    inserted = (
+        insert(Blocks)
+        .values(blocker_id=current_user_id, blocked_id=user_id)
+        .on_conflict_do_nothing()
+        .returning(Blocks.blocked_id)
+        .cte("inserted")
+    )
+    deleted = (
+        delete(Follows)
+        .where(
+            or_(
+                and_(
+                    Follows.follower_id == current_user_id,
+                    Follows.followed_id == user_id,
+                ),
+                and_(
+                    Follows.follower_id == user_id,
+                    Follows.followed_id == current_user_id,
+                ),
             )
         )
-        subscription = result.scalar_one_or_none()
-        if subscription is not None:
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "result": False,
-                    "error_type": "BadRequest",
-                    "error_message": "Subscription already made",
-                },
+        .returning(Follows.follower_id, Follows.followed_id)
+        .cte("deleted")
+    )
+    try:
+        async with session.begin():
+            result = await session.execute(
+                select(
+                    select(func.count())
+                    .select_from(inserted)
+                    .scalar_subquery()
+                    .label("created"),
+                    select(func.array_agg(deleted.c.follower_id))
+                    .scalar_subquery()
+                    .label("unfollowers"),
+                ).add_cte(follow_counters_cte(deleted, -1))
             )
-        else:
-            new_follow = Follows(follower_id=user.id, followed_id=user_id)
-            session.add(new_follow)
-            return {"result": True}
+            created, unfollowers = result.one()
+    except IntegrityError as error:
+        return constraint_violation(error, "Cannot block yourself")
+
+    for follower_id in unfollowers or []:
+        other_id = user_id if follower_id == current_user_id else current_user_id
+        follow_graph.unfollow(follower_id, other_id)
+    if unfollowers:
+        await invalidate_profiles([current_user_id, user_id])
+    await invalidate_exclusions(current_user_id, user_id)
+    await feed_cache.delete(current_user_id, user_id)
+    if not created:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "result": False,
+                "error_type": "BadRequest",
+                "error_message": "User already blocked",
+            },
+        )
+    return {"result": True}
+
+
+@app.delete("/api/users/{user_id}/block", response_model=Response)
+async def get_user_unblocked(
+    user_id: int = Path(..., title="User id", ge=1),
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """Снять блокировку; удалённые при блокировке подписки не возвращаются"""
+    current_user_id = user.id
+    async with session.begin():
+        result = await session.execute(
+            delete(Blocks)
+            .where(Blocks.blocker_id == current_user_id, Blocks.blocked_id == user_id)
+            .returning(Blocks.blocked_id)
+        )
+        deleted = result.scalar_one_or_none() is not None
+    if not deleted:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "result": False,
+                "error_type": "NotFound",
+                "error_message": "Block not found",
+            },
+        )
+
+    await invalidate_exclusions(current_user_id, user_id)
+    await feed_cache.delete(current_user_id, user_id)
+    return {"result": True}
+
+
+@app.get("/api/admin/traces", response_model=ResponseTraces)
+async def get_traces(
+    trace_id: str | None = Query(None, description="trace_id из заголовка traceparent"),
+    min_duration_ms: float = Query(0, ge=0, description="Минимальная длительность"),
+    limit: int = Query(50, ge=1, le=1000, description="Сколько трасс вернуть"),
+    user: Users = Depends(get_admin_user),
+):
+    """
+    Конечная точка для просмотра сохранённых трасс запросов
+    (медленных и выбранных сэмплированием), доступна администраторам
+    """
+    traces = memory_exporter.find(trace_id, min_duration_ms)[:limit]
+    return {"result": True, "traces": traces}
+
+
+@app.get("/api/admin/slow-queries", response_model=ResponseSlowQueries)
+async def get_slow_queries(user: Users = Depends(get_admin_user)):
+    """
+    Конечная точка для просмотра журнала медленных SQL-выражений
+    текущего процесса, доступна администраторам
+    """
+    return {"result": True, "slow_queries": slow_query_log.report()}
+
+
+@app.delete("/api/admin/slow-queries", response_model=ResponseSlowQueriesCleared)
+async def get_slow_queries_cleared(user: Users = Depends(get_admin_user)):
+    """Конечная точка для очистки журнала медленных SQL-выражений"""
+    slow_query_log.clear()
+    return {"result": True}
+
+
+@app.get("/api/admin/memory", response_model=ResponseMemory)
+async def get_memory_status(user: Users = Depends(get_admin_user)):
+    """
+    Конечная точка для просмотра состояния tracemalloc, сохранённых снимков
+    и пиковых аллокаций по маршрутам, доступна администраторам
+    """
+    return {
+        "result": True,
+        "memory": traced_memory(),
+        "snapshots": snapshots.list(),
+        "routes": route_memory_stats.report(),
+    }
+
+
+@app.post("/api/admin/memory/snapshots", response_model=ResponseMemorySnapshot)
+async def get_memory_snapshot(
+    limit: int = Query(20, ge=1, le=500, description="Сколько мест вернуть"),
+    group_by: Literal["lineno", "filename", "traceback"] = Query("lineno"),
+    user: Users = Depends(get_admin_user),
+):
+    """
+    Конечная точка для снятия снимка памяти. Первый вызов включает
+    tracemalloc, поэтому первый снимок служит точкой отсчёта
+    """
+    return {"result": True, "snapshot": snapshots.take(limit, group_by)}
+
+
+@app.get(
+    "/api/admin/memory/snapshots/{snapshot_id}/diff",
+    response_model=ResponseMemoryDiff,
+)
+async def get_memory_diff(
+    snapshot_id: int = Path(..., ge=1, description="ID снимка"),
+    base_id: int | None = Query(None, ge=1, description="ID базового снимка"),
+    limit: int = Query(20, ge=1, le=500, description="Сколько мест вернуть"),
+    group_by: Literal["lineno", "filename", "traceback"] = Query("lineno"),
+    user: Users = Depends(get_admin_user),
+):
+    """
+    Конечная точка для сравнения снимка памяти с базовым
+    (по умолчанию - с предыдущим): места с наибольшим ростом памяти
+    """
+    diff = snapshots.diff(snapshot_id, base_id, limit, group_by)
+    if diff is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "result": False,
+                "error_type": "NotFound",
+                "error_message": "Snapshot not found",
+            },
+        )
+    return {"result": True, "diff": diff}
+
+
+@app.delete("/api/admin/memory", response_model=ResponseMemoryStopped)
+async def get_memory_tracing_stopped(user: Users = Depends(get_admin_user)):
+    """Конечная точка для выключения tracemalloc и удаления снимков"""
+    stop_tracing()
+    return {"result": True}
@@ -0,0 +1,223 @@
+import itertools
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.config import MEMORY_ROUTE_STATS, MEMORY_SNAPSHOTS_KEPT, MEMORY_TRACE_FRAMES
+
+KB = 1024
+# аллокации самого tracemalloc и импорта модулей в отчётах не интересны
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def ensure_tracing() -> None:
+    """Включает tracemalloc, если он ещё не включён"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(MEMORY_TRACE_FRAMES)
+
+
+def stop_tracing() -> None:
+    """Выключает tracemalloc и удаляет снимки и статистику маршрутов"""
+    tracemalloc.stop()
+    snapshots.clear()
+    route_memory_stats.clear()
+
+
+def traced_memory() -> dict:
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "current_kb": round(current / KB, 1),
+        "peak_kb": round(peak / KB, 1),
+    }
+
+
+def location(stat, group_by: str) -> str:
+    """Место аллокации: строка кода, файл или стек целиком"""
+    if group_by == "traceback":
+        return " <- ".join(
+            f"{frame.filename}:{frame.lineno}" for frame in stat.traceback
+        )
+    frame = stat.traceback[0]
+    if group_by == "filename":
+        return frame.filename
+    return f"{frame.filename}:{frame.lineno}"
+
+
+class SnapshotStore:
+    """Последние снимки tracemalloc, старые вытесняются"""
+
+    def __init__(self, size: int = MEMORY_SNAPSHOTS_KEPT):
+        self.size = size
+        self.snapshots: OrderedDict[int, tuple[tracemalloc.Snapshot, dict]] = (
+            OrderedDict()
+        )
+        self._ids = itertools.count(1)
+
+    def take(self, limit: int, group_by: str) -> dict:
+        """Снимает снимок и возвращает его описание с самыми крупными местами"""
+        ensure_tracing()
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        info = {
+            "id": next(self._ids),
+            "taken_at": datetime.now(timezone.utc).isoformat(),
+            **traced_memory(),
+        }
+        self.snapshots[info["id"]] = (snapshot, info)
+        while len(self.snapshots) > self.size:
+            self.snapshots.popitem(last=False)
+        top = [
+            {
+                "location": location(stat, group_by),
+                "size_kb": round(stat.size / KB, 1),
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics(group_by)[:limit]
+        ]
+        return {**info, "top": top}
+
+    def list(self) -> list[dict]:
+        return [info for _, info in self.snapshots.values()]
+
+    def diff(
+        self, snapshot_id: int, base_id: Optional[int], limit: int, group_by: str
+    ) -> Optional[dict]:
+        """
+        Разница между снимком и базовым (по умолчанию - предыдущим),
+        отсортированная по росту занятой памяти. None - снимка нет
+        """
+        ids = list(self.snapshots)
+        if snapshot_id not in self.snapshots:
+            return None
+        if base_id is None:
+            position = ids.index(snapshot_id)
+            if position == 0:
+                return None
+            base_id = ids[position - 1]
+        if base_id not in self.snapshots:
+            return None
+        snapshot, _ = self.snapshots[snapshot_id]
+        base, _ = self.snapshots[base_id]
+        stats = snapshot.compare_to(base, group_by)
+        return {
+            "snapshot_id": snapshot_id,
+            "base_id": base_id,
+            "size_diff_kb": round(sum(stat.size_diff for stat in stats) / KB, 1),
+            "top": [
+                {
+                    "location": location(stat, group_by),
+                    "size_kb": round(stat.size / KB, 1),
+                    "size_diff_kb": round(stat.size_diff / KB, 1),
+                    "count": stat.count,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in stats[:limit]
+            ],
+        }
+
+    def clear(self) -> None:
+        self.snapshots.clear()
+
+
+class RouteMemoryStats:
+    """
+    Пиковые и оставшиеся после запроса аллокации по маршрутам.
+    tracemalloc считает память процесса целиком, поэтому у запросов,
+    шедших одновременно с другими (overlapped), цифры приблизительные
+    """
+
+    def __init__(self):
+        self.routes: dict[str, dict] = {}
+        self.in_flight = 0
+
+    def start(self) -> tuple[int, bool]:
+        """Текущий объём памяти и признак, что запрос идёт один"""
+        alone = self.in_flight == 0
+        self.in_flight += 1
+        if alone:
+            tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        return current, alone
+
+    def finish(self, route: str, started_at: int, alone: bool) -> None:
+        self.in_flight -= 1
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        stats = self.routes.setdefault(
+            route,
+            {
+                "requests": 0,
+                "overlapped": 0,
+                "max_peak_kb": 0.0,
+                "total_peak_kb": 0.0,
+                "total_retained_kb": 0.0,
+            },
+        )
+        peak_kb = max(peak - started_at, 0) / KB
+        stats["requests"] += 1
+        stats["overlapped"] += 0 if alone else 1
+        stats["max_peak_kb"] = max(stats["max_peak_kb"], peak_kb)
+        stats["total_peak_kb"] += peak_kb
+        stats["total_retained_kb"] += (current - started_at) / KB
+
+    def report(self) -> list[dict]:
+        """Маршруты по убыванию максимального пика"""
+        return sorted(
+            (
+                {
+                    "route": route,
+                    "requests": stats["requests"],
+                    "overlapped": stats["overlapped"],
+                    "max_peak_kb": round(stats["max_peak_kb"], 1),
+                    "mean_peak_kb": round(
+                        stats["total_peak_kb"] / stats["requests"], 1
+                    ),
+                    "mean_retained_kb": round(
+                        stats["total_retained_kb"] / stats["requests"], 1
+                    ),
+                }
+                for route, stats in self.routes.items()
+            ),
+            key=lambda row: row["max_peak_kb"],
+            reverse=True,
+        )
+
+    def clear(self) -> None:
+        self.routes.clear()
+
+
+snapshots = SnapshotStore()
+route_memory_stats = RouteMemoryStats()
+
+
+class MemoryStatsMiddleware:
+    """
+    ASGI middleware, учитывающее аллокации запроса по шаблону маршрута.
+    Работает при MEMORY_ROUTE_STATS=1 и включённом tracemalloc
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not MEMORY_ROUTE_STATS
+            or not tracemalloc.is_tracing()
+        ):
+            await self.app(scope, receive, send)
+            return
+        started_at, alone = route_memory_stats.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            route_memory_stats.finish(f"{scope['method']} {path}", started_at, alone)
@@ -0,0 +1,224 @@
+import asyncio
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, default
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.config import EVENT_LOOP_LAG_INTERVAL
+
+# Метрики пишутся в память своего процесса без общих блокировок. Если задана
+# переменная PROMETHEUS_MULTIPROC_DIR (см. gunicorn.conf.py), каждый воркер
+# пишет значения в свои файлы в этой папке, а /metrics суммирует их по воркерам
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "Количество HTTP-запросов",
+    ["method", "route", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Запросы, обрабатываемые в данный момент",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CAPACITY = Gauge(
+    "db_pool_capacity",
+    "Максимум соединений пула (размер пула плюс overflow)",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Соединения пула, выданные в работу",
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Ожидание соединения из пула (включая открытие нового соединения)",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Обращения к кэшам: result=hit|miss",
+    ["cache", "result"],
+)
+
+SINGLEFLIGHT_CALLS = Counter(
+    "singleflight_calls_total",
+    "Чтения через single-flight: role=leader (вычислял) или shared (дождался)",
+    ["name", "role"],
+)
+
+ADMISSION_DECISIONS = Counter(
+    "admission_decisions_total",
+    "Решения о допуске запросов: admitted, queued, rejected, evicted, timeout",
+    ["priority", "decision"],
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "Запросы, ждущие допуска",
+    multiprocess_mode="livesum",
+)
+ADMISSION_LIMIT = Gauge(
+    "admission_concurrency_limit",
+    "Текущий лимит одновременных запросов с учётом ожидания пула",
+    multiprocess_mode="livesum",
+)
+
+RATE_LIMITED = Counter(
+    "rate_limited_total",
+    "Запросы, отклонённые ограничением частоты (429)",
+    ["route"],
+)
+
+DEGRADED_RESPONSES = Counter(
+    "degraded_responses_total",
+    "Ответы в деградированном режиме: сохранённые (stale) или отказ",
+    ["route", "reason"],
+)
+CIRCUIT_OPEN = Gauge(
+    "db_circuit_open",
+    "Автомат защиты БД: 1 - запросы к БД прекращены, 0 - работают",
+    multiprocess_mode="livemax",
+)
+
+USER_STATS_CORRECTIONS = Counter(
+    "user_stats_corrections_total",
+    "Пользователи, чьи счётчики исправила фоновая сверка",
+)
+
+FOLLOW_GRAPH_LOOKUPS = Counter(
+    "follow_graph_lookups_total",
+    "Поиск подписок в индексе: result=hit или cold (чтение из БД)",
+    ["result"],
+)
+FOLLOW_GRAPH_BYTES = Gauge(
+    "follow_graph_bytes",
+    "Объём индекса подписок в памяти процесса",
+    multiprocess_mode="livesum",
+)
+
+USER_SEARCH_LOOKUPS = Counter(
+    "user_search_lookups_total",
+    "Поиск пользователей: source=cache (запрос в кэше), prefix (отобран из "
+    "полного результата более короткого запроса) или db",
+    ["source"],
+)
+
+TRENDS_TAGS = Gauge(
+    "trends_tags",
+    "Хештеги в окне трендов процесса",
+    multiprocess_mode="livemax",
+)
+
+SUGGESTIONS_USERS = Counter(
+    "suggestions_users_total",
+    "Пользователи, для которых пересчитаны рекомендации: mode=full|incremental",
+    ["mode"],
+)
+
+EVENT_LOOP_LAG = Gauge(
+    "event_loop_lag_seconds",
+    "Последнее измеренное опоздание event loop",
+    multiprocess_mode="livemax",
+)
+EVENT_LOOP_LAG_HISTOGRAM = Histogram(
+    "event_loop_lag_seconds_distribution",
+    "Распределение опозданий event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    """Учитывает обращение к кэшу, доля попаданий считается в Prometheus"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _count_compiled_cache(conn, cursor, statement, parameters, context, executemany):
+    """Попадания в кэш скомпилированных выражений SQLAlchemy"""
+    if context.cache_hit == default.CACHE_HIT:
+        record_cache_lookup("sqlalchemy_compiled", True)
+    elif context.cache_hit == default.CACHE_MISS:
+        record_cache_lookup("sqlalchemy_compiled", False)
+
+
+class PoolWaitAverage:
+    """
+    Экспоненциальное скользящее среднее ожидания соединения из пула
+    процесса: по нему управление допуском подстраивает лимит запросов
+    """
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.value = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.value += self.alpha * (seconds - self.value)
+
+
+pool_wait = PoolWaitAverage()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который отдаёт в метрики загрузку и время ожидания"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        DB_POOL_CAPACITY.set(self.size() + max(self._max_overflow, 0))
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            DB_POOL_WAIT.observe(waited)
+            pool_wait.observe(waited)
+            DB_POOL_CHECKED_OUT.set(self.checkedout())
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        DB_POOL_CHECKED_OUT.set(self.checkedout())
+
+
+async def monitor_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL) -> None:
+    """
+    Фоновая задача: засыпает на interval и измеряет, насколько позже
+    event loop её разбудил. Опоздание - время, занятое чужими корутинами
+    без передачи управления
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Метрики в текстовом формате Prometheus, суммированные по воркерам"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,7 +1,22 @@
 from datetime import datetime, timezone
+from typing import Optional
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Boolean,
+    CheckConstraint,
+    Column,
+    Computed,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    SmallInteger,
+    String,
+    func,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import Mapped, deferred, mapped_column, relationship
 
 from app.database import Base
 
@@ -11,9 +26,9 @@ class Users(Base):
 
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String(50), nullable=False)
-    api_key = Column(String(100), nullable=False, unique=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(50), nullable=False)
+    api_key: Mapped[str] = mapped_column(String(100), nullable=False, unique=True)
     tweets = relationship("Tweets", back_populates="user", cascade="all, delete-orphan")
     likes = relationship("Likes", back_populates="user", cascade="all, delete-orphan")
     following = relationship(
@@ -29,24 +44,86 @@ class Users(Base):
         cascade="all, delete-orphan",
     )
 
+    __table_args__ = (
+        # упоминания @имя в твитах ищут пользователей по имени без учёта
+        # регистра, поиск короче трёх символов - по началу имени (LIKE 'ab%'):
+        # text_pattern_ops нужен LIKE при любой collation базы
+        Index(
+            "ix_users_name_lower_pattern",
+            func.lower(name).label("name_lower"),
+            postgresql_ops={"name_lower": "text_pattern_ops"},
+        ),
+    )
+
 
 class Tweets(Base):
-    """Класс - модель описывающий таблицу твитов с внешним ключом к таблице users"""
+    """
+    Класс - модель описывающий таблицу твитов с внешним ключом к таблице users.
+    Таблица партиционирована по created_at (RANGE), поэтому дата создания
+    входит в первичный ключ, а ORM идентифицирует твит только по id
+    """
 
     __tablename__ = "tweets"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
-    content = Column(String(280), nullable=False)
-    created_at = Column(
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE")
+    )
+    content: Mapped[str] = mapped_column(String(280), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         default=lambda: datetime.now(timezone.utc),
+        primary_key=True,
         nullable=False,
     )
-    medias = relationship("Medias", backref="tweet", cascade="all, delete-orphan")
-    likes = relationship("Likes", backref="tweet", cascade="all, delete-orphan")
+    # полнотекстовый поиск: лексемы русской и английской конфигураций в одном
+    # векторе, тексты смешивают оба языка. Вычисляется базой при записи,
+    # ORM его не читает (deferred)
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                "to_tsvector('russian', content) || to_tsvector('english', content)",
+                persisted=True,
+            ),
+        )
+    )
+    # внешних ключей на tweets нет, связь задаётся явно,
+    # а в базе каскадное удаление выполняет триггер tweets_cascade_delete,
+    # поэтому при удалении твита ORM не подгружает медиа и лайки (passive_deletes)
+    medias = relationship(
+        "Medias",
+        primaryjoin="Tweets.id == foreign(Medias.tweet_id)",
+        backref="tweet",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    likes = relationship(
+        "Likes",
+        primaryjoin="Tweets.id == foreign(Likes.tweet_id)",
+        backref="tweet",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
     user = relationship("Users", back_populates="tweets")
 
+    __table_args__ = (
+        # лента: фильтр по автору и сортировка по дате создания
+        Index("ix_tweets_user_id_created_at", user_id, created_at.desc()),
+        # поиск частых слов среди самых новых твитов
+        Index("ix_tweets_created_at", created_at.desc()),
+        # поиск: без fastupdate новые твиты сразу попадают в дерево индекса,
+        # а не в список ожидания, который каждый поиск просматривает целиком
+        Index(
+            "ix_tweets_search_vector",
+            "search_vector",
+            postgresql_using="gin",
+            postgresql_with={"fastupdate": "off"},
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
 
 class Medias(Base):
     """Класс - модель описывающий таблицу с медиафайлами(картинками)"""
@@ -54,12 +131,20 @@ class Medias(Base):
     __tablename__ = "medias"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    tweet_id = Column(Integer, ForeignKey("tweets.id", ondelete="CASCADE"))
+    tweet_id = Column(Integer)
     path_url = Column(String(255), nullable=False, index=True, unique=True)
 
+    __table_args__ = (
+        # selectinload(Tweets.medias) читает медиа только из индекса
+        Index("ix_medias_tweet_id", tweet_id, postgresql_include=["id", "path_url"]),
+    )
+
 
 class Likes(Base):
-    """Класс - модель описывающий таблицу лайков с двумя внешними ключами к users и tweets"""
+    """
+    Класс - модель описывающий таблицу лайков с внешним ключом к users.
+    Таблица партиционирована по хешу tweet_id
+    """
 
     __tablename__ = "likes"
 
@@ -71,25 +156,30 @@ class Likes(Base):
     )
     tweet_id = Column(
         Integer,
-        ForeignKey("tweets.id", ondelete="CASCADE"),
         primary_key=True,
         nullable=False,
     )
     user = relationship("Users", back_populates="likes")
 
+    __table_args__ = (
+        # первичный ключ начинается с user_id, а лайки твита ищутся по tweet_id
+        Index("ix_likes_tweet_id_user_id", tweet_id, user_id),
+        {"postgresql_partition_by": "HASH (tweet_id)"},
+    )
+
 
 class Follows(Base):
     """Класс модель описывающая таблицу подписок (follower и followed - пользователи)"""
 
     __tablename__ = "follows"
 
-    follower_id = Column(
+    follower_id: Mapped[int] = mapped_column(
         Integer,
         ForeignKey("users.id", ondelete="CASCADE"),
         primary_key=True,
         nullable=False,
     )
-    followed_id = Column(
+    followed_id: Mapped[int] = mapped_column(
         Integer,
         ForeignKey("users.id", ondelete="CASCADE"),
         primary_key=True,
@@ -102,3 +192,189 @@ class Follows(Base):
     followed = relationship(
         "Users", foreign_keys=[followed_id], back_populates="followers"
     )
+
+    __table_args__ = (
+        # подписчики пользователя ищутся по followed_id
+        Index("ix_follows_followed_id_follower_id", followed_id, follower_id),
+        CheckConstraint("follower_id <> followed_id", name="ck_follows_not_self"),
+    )
+
+
+class UserStats(Base):
+    """
+    Класс модель описывающая таблицу счётчиков пользователя. Счётчики
+    меняются в одной транзакции с подписками и твитами, а расхождения
+    исправляет фоновая сверка (app.user_stats). Отдельная таблица, чтобы
+    частые обновления счётчиков не трогали строки users
+    """
+
+    __tablename__ = "user_stats"
+
+    user_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+        nullable=False,
+    )
+    followers_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    following_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    tweets_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    # когда менялись подписки или подписчики пользователя и когда для него
+    # последний раз считались рекомендации (app.suggestions)
+    graph_changed_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True)
+    )
+    suggestions_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+
+
+class Suggestions(Base):
+    """
+    Класс модель описывающая таблицу рекомендаций «кого читать»: для
+    пользователя - лучшие кандидаты по порядку rank. Заполняется фоновым
+    расчётом (app.suggestions), читается одним поиском по первичному ключу
+    """
+
+    __tablename__ = "suggestions"
+
+    user_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+        nullable=False,
+    )
+    rank: Mapped[int] = mapped_column(SmallInteger, primary_key=True, nullable=False)
+    suggested_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+    # сколько подписок пользователя подписаны на кандидата
+    mutual_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    # кандидат подписан на пользователя
+    follows_you: Mapped[bool] = mapped_column(Boolean, nullable=False)
+
+    __table_args__ = (
+        # каскадное удаление кандидата не должно читать всю таблицу
+        Index("ix_suggestions_suggested_id", suggested_id),
+    )
+
+
+class Mutes(Base):
+    """
+    Класс модель описывающая таблицу скрытых авторов: твиты muted_id не
+    попадают в ленту muter_id, подписка при этом сохраняется
+    """
+
+    __tablename__ = "mutes"
+
+    muter_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+        nullable=False,
+    )
+    muted_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        # каскадное удаление скрытого пользователя не должно читать всю таблицу
+        Index("ix_mutes_muted_id", muted_id),
+        CheckConstraint("muter_id <> muted_id", name="ck_mutes_not_self"),
+    )
+
+
+class Blocks(Base):
+    """
+    Класс модель описывающая таблицу блокировок: заблокированный и
+    заблокировавший не видят твитов друг друга в ленте, не могут
+    подписываться друг на друга и ставить лайки твитам друг друга
+    """
+
+    __tablename__ = "blocks"
+
+    blocker_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+        nullable=False,
+    )
+    blocked_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        # кто заблокировал пользователя ищется по blocked_id
+        Index("ix_blocks_blocked_id_blocker_id", blocked_id, blocker_id),
+        CheckConstraint("blocker_id <> blocked_id", name="ck_blocks_not_self"),
+    )
+
+
+class TweetHashtags(Base):
+    """
+    Класс модель описывающая таблицу хештегов твитов (в нижнем регистре).
+    Заполняется при создании твита, удаляется триггером tweets_cascade_delete
+    """
+
+    __tablename__ = "tweet_hashtags"
+
+    tweet_id: Mapped[int] = mapped_column(Integer, primary_key=True, nullable=False)
+    tag: Mapped[str] = mapped_column(String(100), primary_key=True, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+
+    __table_args__ = (
+        # новые твиты с хештегом
+        Index("ix_tweet_hashtags_tag_created_at", tag, created_at.desc()),
+    )
+
+
+class TweetMentions(Base):
+    """
+    Класс модель описывающая таблицу упоминаний: пользователи, упомянутые
+    в твите как @имя. Заполняется при создании твита, удаляется триггером
+    tweets_cascade_delete
+    """
+
+    __tablename__ = "tweet_mentions"
+
+    tweet_id: Mapped[int] = mapped_column(Integer, primary_key=True, nullable=False)
+    user_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        # твиты, в которых упомянут пользователь
+        Index("ix_tweet_mentions_user_id_tweet_id", user_id, tweet_id.desc()),
+    )
+
+
+class TrendBuckets(Base):
+    """
+    Класс модель описывающая таблицу поминутных счётчиков хештегов для
+    трендов. Процессы копят счётчики в памяти и периодически прибавляют их
+    сюда (app.trends); строки старше окна трендов удаляются
+    """
+
+    __tablename__ = "trend_buckets"
+
+    bucket_start: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), primary_key=True, nullable=False
+    )
+    tag: Mapped[str] = mapped_column(String(100), primary_key=True, nullable=False)
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.config import (
+    LIKES_PARTITIONS,
+    PARTITION_MAINTENANCE_INTERVAL,
+    TWEETS_PARTITION_MONTHS_AHEAD,
+)
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# ключ advisory lock, чтобы воркеры не создавали партиции одновременно
+PARTITIONS_LOCK_KEY = 7_310_027
+
+# Внешних ключей на партиционированную tweets нет (уникальный ключ обязан
+# включать created_at), поэтому каскадное удаление лайков, медиа, хештегов
+# и упоминаний выполняет триггер
+CASCADE_TRIGGER_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION tweets_cascade_delete() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM likes WHERE tweet_id = OLD.id;
+        DELETE FROM medias WHERE tweet_id = OLD.id;
+        DELETE FROM tweet_hashtags WHERE tweet_id = OLD.id;
+        DELETE FROM tweet_mentions WHERE tweet_id = OLD.id;
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_trigger
+            WHERE tgname = 'tweets_cascade_delete'
+              AND tgrelid = 'tweets'::regclass
+        ) THEN
+            CREATE TRIGGER tweets_cascade_delete
+            AFTER DELETE ON tweets
+            FOR EACH ROW EXECUTE FUNCTION tweets_cascade_delete();
+        END IF;
+    END
+    $$
+    """,
+]
+
+
+def month_start(moment: datetime) -> datetime:
+    """Возвращает начало месяца (UTC), в который попадает moment"""
+    moment = moment.astimezone(timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    """Сдвигает начало месяца на указанное число месяцев"""
+    index = moment.year * 12 + moment.month - 1 + months
+    return moment.replace(year=index // 12, month=index % 12 + 1)
+
+
+def tweets_partition_name(start: datetime) -> str:
+    """Имя месячной партиции tweets, например tweets_y2026m10"""
+    return f"tweets_y{start.year:04d}m{start.month:02d}"
+
+
+def tweets_partition_sql(start: datetime) -> str:
+    """DDL месячной партиции tweets, начинающейся с start"""
+    end = add_months(start, 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {tweets_partition_name(start)} "
+        f"PARTITION OF tweets FOR VALUES "
+        f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+def likes_partition_sql(remainder: int, modulus: int = LIKES_PARTITIONS) -> str:
+    """DDL hash-партиции likes с указанным остатком"""
+    return (
+        f"CREATE TABLE IF NOT EXISTS likes_p{remainder} PARTITION OF likes "
+        f"FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder})"
+    )
+
+
+async def is_partitioned(conn: AsyncConnection, table: str) -> bool:
+    """Проверяет, что таблица в базе объявлена партиционированной"""
+    result = await conn.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(:table))"
+        ),
+        {"table": table},
+    )
+    return bool(result.scalar())
+
+
+async def ensure_partitions(
+    conn: AsyncConnection,
+    start: datetime | None = None,
+    months_ahead: int = TWEETS_PARTITION_MONTHS_AHEAD,
+) -> None:
+    """
+    Создаёт недостающие партиции:
+    месячные партиции tweets с месяца start (по умолчанию текущего)
+    на months_ahead месяцев вперёд, партицию по умолчанию,
+    hash-партиции likes и триггер каскадного удаления.
+    Вызывается внутри транзакции, повторный вызов ничего не меняет.
+    """
+    await conn.execute(
+        text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITIONS_LOCK_KEY}
+    )
+    now = datetime.now(timezone.utc)
+    if await is_partitioned(conn, "tweets"):
+        first = month_start(min(start, now) if start else now)
+        last = add_months(month_start(now), months_ahead)
+        current = first
+        while current <= last:
+            await conn.execute(text(tweets_partition_sql(current)))
+            current = add_months(current, 1)
+        await conn.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS tweets_default PARTITION OF tweets DEFAULT"
+            )
+        )
+        for statement in CASCADE_TRIGGER_SQL:
+            await conn.execute(text(statement))
+    else:
+        logger.warning("Table tweets is not partitioned, run alembic upgrade head")
+    if await is_partitioned(conn, "likes"):
+        for remainder in range(LIKES_PARTITIONS):
+            await conn.execute(text(likes_partition_sql(remainder)))
+
+
+async def maintain_partitions(
+    engine: AsyncEngine, interval: int = PARTITION_MAINTENANCE_INTERVAL
+) -> None:
+    """
+    Фоновая задача: периодически создаёт партиции tweets на будущие месяцы,
+    чтобы новые твиты никогда не попадали в партицию по умолчанию
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with engine.begin() as conn:
+                await ensure_partitions(conn)
+        except Exception:
+            logger.exception("Failed to create future partitions")
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import random
+import re
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import aiofiles
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.config import (
+    ADMIN_API_KEYS,
+    BASE_DIR,
+    PROFILE_DIR,
+    PROFILE_INTERVAL,
+    PROFILE_SAMPLE_RATE,
+)
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# метка вершины стека, когда задача запроса ждёт (БД, сеть, другие задачи)
+AWAIT_LABEL = "<await>"
+
+STDLIB_DIR = sysconfig.get_paths()["stdlib"]
+
+_labels: dict = {}
+
+
+def frame_label(code) -> str:
+    """Имя функции с коротким путём к файлу, одно на объект кода"""
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if "site-packages/" in filename:
+            filename = filename.rsplit("site-packages/", 1)[1]
+        elif filename.startswith(str(BASE_DIR.parent)):
+            filename = filename[len(str(BASE_DIR.parent)) + 1 :]
+        elif filename.startswith(STDLIB_DIR):
+            filename = filename[len(STDLIB_DIR) + 1 :]
+        # co_qualname появился в Python 3.11, в CI - 3.10
+        name = getattr(code, "co_qualname", code.co_name)
+        label = f"{name} ({filename}:{code.co_firstlineno})"
+        _labels[code] = label
+    return label
+
+
+def awaiting_stack(coro) -> list[str]:
+    """Стек приостановленной корутины по цепочке await, от корня к вершине"""
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None)
+        frame = frame or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(frame_label(frame.f_code))
+        coro = (
+            getattr(coro, "cr_await", None)
+            or getattr(coro, "ag_await", None)
+            or getattr(coro, "gi_yieldfrom", None)
+        )
+    return stack
+
+
+class RequestProfile:
+    """
+    Статистический профиль одной задачи asyncio. Отдельный поток раз в interval
+    снимает стек потока event loop, если в нём выполняется задача запроса,
+    или цепочку await задачи, если она ждёт
+    """
+
+    def __init__(self, loop, task, interval: float = PROFILE_INTERVAL):
+        self.loop = loop
+        self.task = task
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def total(self) -> int:
+        return sum(self.samples.values())
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self._sample()
+            except Exception:
+                # стек меняется под ногами, битый снимок просто пропускаем
+                continue
+
+    def _sample(self) -> None:
+        if asyncio.current_task(self.loop) is self.task:
+            stack = self._running_stack(sys._current_frames().get(self.thread_id))
+        else:
+            stack = awaiting_stack(self.task.get_coro()) + [AWAIT_LABEL]
+        if stack:
+            self.samples[";".join(stack)] += 1
+
+    def _running_stack(self, frame) -> list[str]:
+        root = self.task.get_coro().cr_frame
+        stack = []
+        while frame is not None:
+            stack.append(frame_label(frame.f_code))
+            if frame is root:
+                return stack[::-1]
+            frame = frame.f_back
+        # код внутри greenlet SQLAlchemy (выполнение и загрузка ORM) не связан
+        # с кадрами корутин, поэтому его стек приставляется к корню задачи
+        return [frame_label(root.f_code)] + stack[::-1]
+
+    def folded(self) -> str:
+        """Профиль в формате folded stacks: "корень;...;вершина число" """
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.items())
+
+
+def should_profile(scope) -> bool:
+    """
+    Профилируется запрос администратора с заголовком X-Profile
+    и случайная доля PROFILE_SAMPLE_RATE всех запросов
+    """
+    if ADMIN_API_KEYS:
+        headers = Headers(scope=scope)
+        if headers.get("x-profile") and headers.get("api-key") in ADMIN_API_KEYS:
+            return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def profile_path(scope) -> Path:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    return (
+        PROFILE_DIR / f"{stamp}_{scope['method']}_{slug}_{uuid.uuid4().hex[:8]}.folded"
+    )
+
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware профилирования запросов. Подключается самым внутренним,
+    чтобы эндпоинт с зависимостями выполнялся в той же задаче, что и оно.
+    Имя файла с профилем возвращается в заголовке X-Profile-File
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(asyncio.get_running_loop(), asyncio.current_task())
+        path = profile_path(scope)
+
+        async def send_with_profile(message):
+            # профиль охватывает обработку до отправки заголовков ответа
+            if message["type"] == "http.response.start":
+                profile.stop()
+                headers = MutableHeaders(scope=message)
+                headers["X-Profile-File"] = path.name
+                headers["X-Profile-Samples"] = str(profile.total)
+            await send(message)
+
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            profile.stop()
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            async with aiofiles.open(path, "w") as out_file:
+                await out_file.write(profile.folded())
+            logger.info(f"profile saved: {path} ({profile.total} samples)")
@@ -0,0 +1,87 @@
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import N_PLUS_ONE_THRESHOLD, QUERY_COUNT_WARNING
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryStats:
+    """Статистика SQL-выражений, выполненных за время сбора"""
+
+    statements: int = 0
+    rows: int = 0
+    db_time: float = 0.0
+    sql: list[str] = field(default_factory=list)
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> dict[str, int]:
+        """Выражения, повторившиеся не меньше threshold раз - признак N+1"""
+        counts = Counter(self.sql)
+        return {sql: count for sql, count in counts.items() if count >= threshold}
+
+
+# Активные сборщики текущего контекста. Их может быть несколько:
+# middleware считает запрос, а тест поверх него проверяет бюджет
+_collectors: ContextVar[tuple[QueryStats, ...]] = ContextVar(
+    "query_collectors", default=()
+)
+
+
+@contextmanager
+def collect_queries() -> Iterator[QueryStats]:
+    """Собирает статистику всех SQL-выражений, выполненных внутри блока"""
+    stats = QueryStats()
+    token = _collectors.set(_collectors.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+
+# Слушатели вешаются на класс Engine, поэтому считают выражения
+# любого движка, в том числе тестового
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    collectors = _collectors.get()
+    if not collectors:
+        return
+    elapsed = time.perf_counter() - context._query_started
+    # asyncpg берёт число строк из статуса команды ("SELECT 3", "DELETE 1")
+    rows = max(cursor.rowcount, 0)
+    for stats in collectors:
+        stats.statements += 1
+        stats.rows += rows
+        stats.db_time += elapsed
+        stats.sql.append(statement)
+
+
+def log_query_stats(route: str, stats: QueryStats) -> None:
+    """Пишет статистику запроса в лог и предупреждает о подозрении на N+1"""
+    logger.info(
+        f"{route}: {stats.statements} SQL, {stats.rows} rows, "
+        f"{stats.db_time * 1000:.1f} ms in DB"
+    )
+    if stats.statements > QUERY_COUNT_WARNING:
+        logger.warning(
+            f"{route}: {stats.statements} SQL за запрос "
+            f"(порог {QUERY_COUNT_WARNING})"
+        )
+    for sql, count in stats.repeated().items():
+        logger.warning(
+            f"{route}: возможный N+1, выражение выполнено {count} раз: {sql}"
+        )
@@ -0,0 +1,258 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from fastapi.responses import JSONResponse
+
+from app.config import (
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_FEED_BURST,
+    RATE_LIMIT_FEED_RATE,
+    RATE_LIMIT_IDLE_TTL,
+    RATE_LIMIT_IP_BURST,
+    RATE_LIMIT_IP_RATE,
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_MEDIA_BURST,
+    RATE_LIMIT_MEDIA_RATE,
+    RATE_LIMIT_RATE,
+    RATE_LIMIT_SHARDS,
+)
+from app.metrics import RATE_LIMITED
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Параметры корзины токенов"""
+
+    rate: float  # токенов в секунду
+    burst: int  # ёмкость корзины
+
+
+@dataclass
+class Decision:
+    """Результат проверки по самой строгой из корзин запроса"""
+
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # секунд до полного восстановления корзины
+    retry_after: float = 0.0  # секунд до появления токена, если запрос отклонён
+
+
+class RateLimitBackend(ABC):
+    """
+    Хранилище корзин. Корзины одного запроса проверяются вместе: токены
+    списываются, только если их хватает во всех. Общее для воркеров
+    хранилище подключается реализацией take и передачей в RateLimiter
+    """
+
+    @abstractmethod
+    async def take(self, buckets: list[tuple[str, Limit]]) -> Decision: ...
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+
+class MemoryBackend(RateLimitBackend):
+    """
+    Корзины в памяти процесса. Ключи распределены по частям, в каждой
+    порядок от давно не использованных к недавним, поэтому проверка и
+    удаление простаивающих ключей - O(1) в среднем. Простаивающая дольше
+    idle_ttl корзина успевает наполниться, и удалить её - то же, что
+    оставить полной. Корзин не больше max_keys: в заполненной части новая
+    корзина вытесняет давно не использованную
+    """
+
+    def __init__(
+        self,
+        shards: int = RATE_LIMIT_SHARDS,
+        idle_ttl: float = RATE_LIMIT_IDLE_TTL,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.shards: list[OrderedDict[str, tuple[float, float]]] = [
+            OrderedDict() for _ in range(shards)
+        ]
+        self.idle_ttl = idle_ttl
+        self.shard_max_keys = max(max_keys // shards, 1)
+        self.clock = clock
+
+    def _shard(self, key: str) -> OrderedDict:
+        return self.shards[hash(key) % len(self.shards)]
+
+    def _evict_idle(self, shard: OrderedDict, now: float) -> None:
+        while shard:
+            key, (_, updated_at) = next(iter(shard.items()))
+            if now - updated_at < self.idle_ttl:
+                break
+            del shard[key]
+
+    async def take(self, buckets: list[tuple[str, Limit]]) -> Decision:
+        now = self.clock()
+        states = []
+        for key, limit in buckets:
+            shard = self._shard(key)
+            self._evict_idle(shard, now)
+            tokens, updated_at = shard.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+            states.append((shard, key, limit, tokens))
+
+        allowed = all(tokens >= 1 for *_, tokens in states)
+        decisions = []
+        for shard, key, limit, tokens in states:
+            if allowed:
+                tokens -= 1
+            shard[key] = (tokens, now)
+            shard.move_to_end(key)
+            if len(shard) > self.shard_max_keys:
+                shard.popitem(last=False)
+            decisions.append(
+                Decision(
+                    allowed=allowed,
+                    limit=limit.burst,
+                    remaining=int(tokens),
+                    reset_after=(limit.burst - tokens) / limit.rate,
+                    retry_after=0.0 if tokens >= 1 else (1 - tokens) / limit.rate,
+                )
+            )
+        # самая строгая корзина: дольше ждать токена, меньше осталось
+        return max(decisions, key=lambda d: (d.retry_after, -d.remaining))
+
+    async def clear(self) -> None:
+        for shard in self.shards:
+            shard.clear()
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+
+class RateLimiter:
+    """
+    Корзина на ключ по всем маршрутам и отдельные корзины дорогих маршрутов.
+    Пока API key не прошёл проверку в этом процессе (remember), запрос
+    тратит ещё и корзину IP клиента: перебор случайных ключей с одного
+    адреса упирается в неё. Проверенных ключей хранится не больше
+    max_known_keys, давно не встречавшиеся забываются
+    """
+
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        default: Limit = Limit(RATE_LIMIT_RATE, RATE_LIMIT_BURST),
+        routes: Optional[dict[str, Limit]] = None,
+        unverified: Limit = Limit(RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST),
+        max_known_keys: int = RATE_LIMIT_MAX_KEYS,
+    ):
+        self.backend = backend
+        self.default = default
+        self.unverified = unverified
+        self.max_known_keys = max_known_keys
+        self.known_keys: OrderedDict[str, None] = OrderedDict()
+        self.routes = (
+            {
+                "GET /api/tweets": Limit(RATE_LIMIT_FEED_RATE, RATE_LIMIT_FEED_BURST),
+                "POST /api/medias": Limit(
+                    RATE_LIMIT_MEDIA_RATE, RATE_LIMIT_MEDIA_BURST
+                ),
+            }
+            if routes is None
+            else routes
+        )
+
+    def remember(self, client: str) -> None:
+        """Ключ прошёл проверку: его запросы больше не тратят корзину IP"""
+        self.known_keys[client] = None
+        self.known_keys.move_to_end(client)
+        if len(self.known_keys) > self.max_known_keys:
+            self.known_keys.popitem(last=False)
+
+    async def check(
+        self, client: str, route: str, ip: Optional[str] = None
+    ) -> Decision:
+        buckets = [(client, self.default)]
+        route_limit = self.routes.get(route)
+        if route_limit is not None:
+            buckets.append((f"{client}|{route}", route_limit))
+        if ip is not None and ip != client and client not in self.known_keys:
+            buckets.append((ip, self.unverified))
+        return await self.backend.take(buckets)
+
+
+rate_limiter = RateLimiter(MemoryBackend())
+
+
+def rate_limit_headers(decision: Decision) -> dict[str, str]:
+    """Заголовки RateLimit-* (draft-ietf-httpapi-ratelimit-headers)"""
+    headers = {
+        "RateLimit-Limit": str(decision.limit),
+        "RateLimit-Remaining": str(max(decision.remaining, 0)),
+        "RateLimit-Reset": str(math.ceil(decision.reset_after)),
+    }
+    if not decision.allowed:
+        headers["Retry-After"] = str(max(math.ceil(decision.retry_after), 1))
+    return headers
+
+
+def client_ip(scope) -> str:
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def client_key(scope) -> str:
+    """API key запроса, а без него - адрес клиента"""
+    for name, value in scope["headers"]:
+        if name == b"api-key":
+            return "key:" + value.decode("latin-1")
+    return client_ip(scope)
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware, ограничивающее частоту запросов к /api/. Стоит снаружи
+    проверки API key и допуска запросов, поэтому отклонённый запрос не
+    делает ни одного SQL-запроса и не занимает место в очереди. Ключ,
+    по которому get_current_user нашёл пользователя (request.state.user_id),
+    запоминается как проверенный
+    """
+
+    def __init__(self, app, route_of: Callable[[dict], str]):
+        self.app = app
+        self.route_of = route_of
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope.get("path", "").startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+        route = f"{scope['method']} {self.route_of(scope)}"
+        client = client_key(scope)
+        limiter = rate_limiter
+        decision = await limiter.check(client, route, client_ip(scope))
+        headers = rate_limit_headers(decision)
+        if not decision.allowed:
+            RATE_LIMITED.labels(route).inc()
+            response = JSONResponse(
+                status_code=429,
+                content={
+                    "result": False,
+                    "error_type": "TooManyRequests",
+                    "error_message": "Rate limit exceeded",
+                },
+                headers=headers,
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (name.lower().encode(), value.encode())
+                    for name, value in headers.items()
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+        if scope.get("state", {}).get("user_id") is not None:
+            limiter.remember(client)
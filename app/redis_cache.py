@@ -0,0 +1,158 @@
+import asyncio
+from typing import Optional
+from urllib.parse import urlparse
+
+from app.cache import CacheBackend, CacheError
+from app.config import (
+    CACHE_KEY_PREFIX,
+    CACHE_REDIS_POOL_SIZE,
+    CACHE_REDIS_TIMEOUT,
+    CACHE_REDIS_URL,
+)
+
+
+def encode_command(*args) -> bytes:
+    """Команда в протоколе RESP: массив bulk-строк"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """
+    Читает один ответ RESP. Ошибка сервера возвращается как CacheError,
+    а не выбрасывается, чтобы не сбить чтение остальных ответов конвейера
+    """
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("connection to cache server closed")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        return CacheError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise CacheError(f"unexpected reply {line!r}")
+
+
+class RedisConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def execute(self, *commands: tuple) -> list:
+        """Отправляет команды конвейером и возвращает ответы по порядку"""
+        self.writer.write(b"".join(encode_command(*command) for command in commands))
+        await self.writer.drain()
+        return [await read_reply(self.reader) for _ in commands]
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Кэш на сервере с протоколом Redis (RESP2), общий для воркеров.
+    Соединения берутся из небольшого пула; соединение, на котором
+    случилась ошибка или таймаут, закрывается
+    """
+
+    def __init__(
+        self,
+        url: str = CACHE_REDIS_URL,
+        pool_size: int = CACHE_REDIS_POOL_SIZE,
+        timeout: float = CACHE_REDIS_TIMEOUT,
+    ):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(pool_size)
+        self._idle: list[RedisConnection] = []
+
+    async def _connect(self) -> RedisConnection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        connection = RedisConnection(reader, writer)
+        setup: list[tuple] = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in await connection.execute(*setup):
+                if isinstance(reply, CacheError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    async def execute(self, *commands: tuple) -> list:
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(self._connect(), self.timeout)
+                replies = await asyncio.wait_for(
+                    connection.execute(*commands), self.timeout
+                )
+            except BaseException:
+                if connection is not None:
+                    connection.close()
+                raise
+            self._idle.append(connection)
+        for reply in replies:
+            if isinstance(reply, CacheError):
+                raise reply
+        return replies
+
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        (values,) = await self.execute(("MGET", *keys))
+        return values
+
+    async def set_many(self, items: dict[str, bytes], ttl: Optional[float]) -> None:
+        if not items:
+            return
+        expiry = () if ttl is None else ("PX", max(int(ttl * 1000), 1))
+        await self.execute(
+            *(("SET", key, value, *expiry) for key, value in items.items())
+        )
+
+    async def add(self, key: str, value: bytes) -> bool:
+        (reply,) = await self.execute(("SET", key, value, "NX"))
+        return reply == "OK"
+
+    async def delete_many(self, keys: list[str]) -> None:
+        if keys:
+            await self.execute(("DEL", *keys))
+
+    async def clear(self) -> None:
+        cursor = b"0"
+        while True:
+            ((cursor, keys),) = await self.execute(
+                ("SCAN", cursor, "MATCH", f"{CACHE_KEY_PREFIX}*", "COUNT", 1000)
+            )
+            await self.delete_many(keys)
+            if cursor in (b"0", "0"):
+                return
+
+    async def close(self) -> None:
+        while self._idle:
+            self._idle.pop().close()
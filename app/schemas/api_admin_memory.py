@@ -0,0 +1,83 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class MemoryStatus(BaseModel):
+    """Схема описывающая состояние tracemalloc"""
+
+    tracing: bool = Field(..., title="включён ли tracemalloc")
+    current_kb: float = Field(..., title="память, занятая отслеживаемыми блоками, КБ")
+    peak_kb: float = Field(..., title="пик отслеживаемой памяти, КБ")
+
+
+class MemoryTopStat(BaseModel):
+    """Схема описывающая место аллокации в снимке"""
+
+    location: str = Field(..., title="строка кода, файл или стек")
+    size_kb: float = Field(..., title="занятая память, КБ")
+    count: int = Field(..., title="количество блоков")
+
+
+class MemorySnapshot(MemoryStatus):
+    """Схема описывающая снимок памяти"""
+
+    id: int = Field(..., title="идентификатор снимка")
+    taken_at: str = Field(..., title="время снятия снимка")
+    top: list[MemoryTopStat] = Field([], title="самые крупные места аллокаций")
+
+
+class RouteMemory(BaseModel):
+    """Схема описывающая аллокации запросов маршрута"""
+
+    route: str = Field(..., title="метод и шаблон маршрута")
+    requests: int = Field(..., title="количество учтённых запросов")
+    overlapped: int = Field(..., title="запросы, шедшие одновременно с другими")
+    max_peak_kb: float = Field(..., title="максимальный пик аллокаций запроса, КБ")
+    mean_peak_kb: float = Field(..., title="средний пик аллокаций запроса, КБ")
+    mean_retained_kb: float = Field(..., title="в среднем осталось после запроса, КБ")
+
+
+class ResponseMemory(BaseModel):
+    """Схема ответа с состоянием памяти, снимками и статистикой маршрутов"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
+    memory: MemoryStatus = Field(..., title="состояние tracemalloc")
+    snapshots: list[MemorySnapshot] = Field(title="сохранённые снимки")
+    routes: list[RouteMemory] = Field(title="аллокации по маршрутам")
+
+
+class ResponseMemorySnapshot(BaseModel):
+    """Схема ответа на снятие снимка памяти"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
+    snapshot: MemorySnapshot = Field(..., title="снятый снимок")
+
+
+class MemoryDiffStat(MemoryTopStat):
+    """Схема описывающая изменение аллокаций места между снимками"""
+
+    size_diff_kb: float = Field(..., title="изменение занятой памяти, КБ")
+    count_diff: int = Field(..., title="изменение количества блоков")
+
+
+class MemoryDiff(BaseModel):
+    """Схема описывающая разницу двух снимков"""
+
+    snapshot_id: int = Field(..., title="идентификатор снимка")
+    base_id: Optional[int] = Field(None, title="идентификатор базового снимка")
+    size_diff_kb: float = Field(..., title="общее изменение памяти, КБ")
+    top: list[MemoryDiffStat] = Field(title="места с наибольшим ростом памяти")
+
+
+class ResponseMemoryDiff(BaseModel):
+    """Схема ответа со сравнением снимков памяти"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
+    diff: MemoryDiff = Field(..., title="разница снимков")
+
+
+class ResponseMemoryStopped(BaseModel):
+    """Схема ответа на выключение tracemalloc"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
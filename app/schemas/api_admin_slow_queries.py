@@ -0,0 +1,33 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class SlowQuery(BaseModel):
+    """Схема описывающая запись журнала медленных запросов"""
+
+    statement: str = Field(..., title="нормализованный текст выражения")
+    example: str = Field(..., title="текст выражения при первом появлении")
+    count: int = Field(..., title="сколько раз выражение оказалось медленным")
+    total_ms: float = Field(..., title="суммарное время, мс")
+    max_ms: float = Field(..., title="максимальное время, мс")
+    last_ms: float = Field(..., title="время последнего выполнения, мс")
+    parameter_shapes: list[str] = Field(title="формы параметров: число и типы")
+    endpoints: dict[str, int] = Field(title="эндпоинты, выполнявшие выражение")
+    first_seen: str = Field(..., title="время первого появления")
+    last_seen: str = Field(..., title="время последнего появления")
+    plan: Optional[str] = Field(None, title="план EXPLAIN (ANALYZE, BUFFERS)")
+    plan_captured_at: Optional[str] = Field(None, title="когда снят план")
+
+
+class ResponseSlowQueries(BaseModel):
+    """Схема ответа с журналом медленных запросов"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
+    slow_queries: list[SlowQuery] = Field(title="записи по убыванию суммарного времени")
+
+
+class ResponseSlowQueriesCleared(BaseModel):
+    """Схема ответа на очистку журнала медленных запросов"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
@@ -0,0 +1,32 @@
+from typing import Any, Optional
+
+from pydantic import BaseModel, Field
+
+
+class TraceSpan(BaseModel):
+    """Схема описывающая спан трассы"""
+
+    span_id: str = Field(..., title="идентификатор спана")
+    parent_id: Optional[str] = Field(None, title="идентификатор родительского спана")
+    name: str = Field(..., title="название спана: auth, sql, orm.load, ...")
+    start_ms: float = Field(..., title="начало спана от начала запроса, мс")
+    duration_ms: float = Field(..., title="длительность спана, мс")
+    self_ms: float = Field(..., title="длительность без дочерних спанов, мс")
+    attributes: dict[str, Any] = Field(title="атрибуты спана (SQL, число строк)")
+
+
+class Trace(BaseModel):
+    """Схема описывающая трассу одного запроса"""
+
+    trace_id: str = Field(..., title="идентификатор трассы W3C")
+    name: str = Field(..., title="метод и шаблон маршрута")
+    started_at: str = Field(..., title="время начала запроса")
+    duration_ms: float = Field(..., title="длительность запроса, мс")
+    spans: list[TraceSpan] = Field(title="спаны трассы, корневой первый")
+
+
+class ResponseTraces(BaseModel):
+    """Схема ответа со списком сохранённых трасс"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
+    traces: list[Trace] = Field(title="трассы от новых к старым")
@@ -0,0 +1,26 @@
+from pydantic import BaseModel, Field
+
+
+class Trend(BaseModel):
+    """Схема описывающая хештег в трендах"""
+
+    tag: str = Field(..., title="хештег без # в нижнем регистре")
+    score: float = Field(
+        ...,
+        title="счёт тренда",
+        description=(
+            "число твитов с хештегом, где каждый твит весит вдвое меньше "
+            "каждые TRENDS_HALF_LIFE секунд"
+        ),
+    )
+    tweets_last_hour: int = Field(..., title="твитов с хештегом за последний час")
+    tweets_in_window: int = Field(
+        ..., title="твитов с хештегом за TRENDS_WINDOW_HOURS часов"
+    )
+
+
+class ResponseTrends(BaseModel):
+    """Схема описывающая тренды хештегов"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
+    trends: list[Trend] = Field(..., title="хештеги по убыванию счёта")
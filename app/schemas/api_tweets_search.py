@@ -0,0 +1,35 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from app.schemas.api_tweets import TweetAuthor
+
+
+class TweetFound(BaseModel):
+    """Схема описывающая найденный твит"""
+
+    id: int = Field(..., title="идентификатор твита")
+    content: str = Field(..., title="текст твита")
+    snippet: str = Field(
+        ...,
+        title="фрагмент с подсветкой",
+        description="HTML: текст экранирован, найденные слова - в <mark>",
+    )
+    author: TweetAuthor = Field(..., title="данные автора поста")
+    created_at: datetime = Field(..., title="дата создания твита")
+    rank: float = Field(..., title="релевантность (ts_rank)")
+
+
+class ResponseTweetSearch(BaseModel):
+    """Схема описывающая страницу результатов поиска твитов"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
+    tweets: list[TweetFound] = Field(
+        ..., title="твиты по убыванию релевантности, затем даты"
+    )
+    next_cursor: Optional[str] = Field(
+        None,
+        title="курсор следующей страницы",
+        description="Передаётся в cursor следующего запроса, null - страниц больше нет",
+    )
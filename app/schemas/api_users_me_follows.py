@@ -0,0 +1,43 @@
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+from app.config import FOLLOWS_IMPORT_MAX_IDS
+
+
+class FollowsImport(BaseModel):
+    """Схема для валидации входных данных массовой подписки"""
+
+    user_ids: list[int] = Field(
+        ...,
+        title="Идентификаторы пользователей",
+        description="На кого подписаться; повторы учитываются один раз",
+        min_length=1,
+        max_length=FOLLOWS_IMPORT_MAX_IDS,
+        examples=[{"value": [2, 3, 5]}],
+    )
+
+
+FollowStatus = Literal["followed", "already_following", "not_found", "self", "blocked"]
+
+
+class FollowResult(BaseModel):
+    """Результат подписки на одного пользователя"""
+
+    id: int = Field(..., title="id пользователя")
+    status: FollowStatus = Field(
+        ...,
+        title="результат",
+        description=(
+            "followed - подписка создана, already_following - уже была, "
+            "not_found - пользователя нет, self - подписка на себя, "
+            "blocked - блокировка в одну из сторон"
+        ),
+    )
+
+
+class ResponseFollowsImport(BaseModel):
+    """Схема ответа массовой подписки, результаты в порядке запроса"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
+    results: list[FollowResult] = Field(..., title="результаты по каждому id")
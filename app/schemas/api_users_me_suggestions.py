@@ -0,0 +1,19 @@
+from pydantic import BaseModel, Field
+
+
+class Suggestion(BaseModel):
+    """Схема описывающая рекомендованного пользователя"""
+
+    id: int = Field(..., title="уникальный идентификатор пользователя")
+    name: str = Field(..., title="имя пользователя")
+    mutual_count: int = Field(
+        ..., title="сколько ваших подписок подписаны на этого пользователя"
+    )
+    follows_you: bool = Field(..., title="пользователь подписан на вас")
+
+
+class ResponseSuggestions(BaseModel):
+    """Схема описывающая рекомендации «кого читать»"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
+    users: list[Suggestion] = Field(..., title="рекомендации, от лучшей к худшей")
@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+
+
+class UserFound(BaseModel):
+    """Схема описывающая найденного пользователя"""
+
+    id: int = Field(..., title="уникальный идентификатор пользователя")
+    name: str = Field(..., title="имя пользователя")
+    followers_count: int = Field(..., title="число подписчиков")
+
+
+class ResponseUserSearch(BaseModel):
+    """Схема описывающая результаты поиска пользователей"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
+    users: list[UserFound] = Field(
+        ...,
+        title="найденные пользователи",
+        description=(
+            "сначала те, чьё имя начинается с запроса, дальше - по убыванию "
+            "числа подписчиков"
+        ),
+    )
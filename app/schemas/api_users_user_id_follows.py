@@ -0,0 +1,17 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from app.schemas.get_api_users_user_id_schemas import UserShort
+
+
+class ResponseUsersPage(BaseModel):
+    """Схема описывающая страницу подписчиков или подписок"""
+
+    result: bool = Field(..., title="булево значения, результат выполнения запроса")
+    users: list[UserShort] = Field(..., title="пользователи по возрастанию id")
+    next_cursor: Optional[int] = Field(
+        None,
+        title="курсор следующей страницы",
+        description="Передаётся в cursor следующего запроса, null - страниц больше нет",
+    )
@@ -26,14 +26,13 @@ class UserData(BaseModel):
         description="Имя пользователя",
         examples=[{"value": "Alexander"}],
     )
-    followers: list[UserShort] = Field(
-        title="(подписчики) - это пользователи,\
-         которые подписались на ваш аккаунт и следят за вашими обновлениями"
-    )
-    following: list[UserShort] = Field(
-        title="(подписки) - это список пользователей,\
-         на которых подписаны вы, и чьи обновления вы видите в своей ленте"
-    )
+    followers_count: int = Field(..., title="количество подписчиков")
+    following_count: int = Field(..., title="количество подписок")
+    tweets_count: int = Field(..., title="количество твитов")
+    followers: list[UserShort] = Field(title="(подписчики) - это пользователи,\
+         которые подписались на ваш аккаунт и следят за вашими обновлениями")
+    following: list[UserShort] = Field(title="(подписки) - это список пользователей,\
+         на которых подписаны вы, и чьи обновления вы видите в своей ленте")
 
 
 class ResponseWithUserData(BaseModel):
@@ -0,0 +1,60 @@
+import asyncio
+from typing import Any, Callable, Coroutine, Hashable
+
+from app.metrics import SINGLEFLIGHT_CALLS
+
+
+class _Call:
+    """Выполняющееся вычисление и число ожидающих его запросов"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных чтений: первый запрос с ключом
+    запускает вычисление, остальные ждут его результат. Результат не
+    кэшируется - следующий запрос после завершения вычисляет заново.
+
+    Вычисление идёт в отдельной задаче: отмена одного ожидающего её не
+    прерывает, а когда отменились все ожидающие - отменяется и вычисление.
+    Исключение вычисления получают все ожидающие
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[Hashable, _Call] = {}
+
+    async def do(
+        self, key: Hashable, fn: Callable[[], Coroutine[Any, Any, Any]]
+    ) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            SINGLEFLIGHT_CALLS.labels(self.name, "leader").inc()
+        else:
+            SINGLEFLIGHT_CALLS.labels(self.name, "shared").inc()
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # больше никто не ждёт: освобождаем соединение с БД, а новые
+                # запросы с этим ключом начнут вычисление заново
+                self._forget(key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
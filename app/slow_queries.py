@@ -0,0 +1,200 @@
+import asyncio
+import contextvars
+import logging
+import re
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import (
+    SLOW_QUERY_EXPLAIN,
+    SLOW_QUERY_EXPLAIN_TIMEOUT_MS,
+    SLOW_QUERY_LOG_SIZE,
+    SLOW_QUERY_MS,
+)
+from app.tracing import current_request_name
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# список плейсхолдеров "($1::INTEGER, $2::INTEGER, ...)" из IN и selectinload
+PLACEHOLDER_LIST_RE = re.compile(
+    r"\(\s*\$\d+(?:::[\w ]+?)?(?:\s*,\s*\$\d+(?:::[\w ]+?)?)*\s*\)"
+)
+PLACEHOLDER_RE = re.compile(r"\$\d+")
+# выражения, которые меняют данные или берут блокировки строк: для них
+# EXPLAIN ANALYZE выполнил бы запись или ждал бы блокировок исходной транзакции
+WRITE_RE = re.compile(
+    r"\b(?:INSERT|UPDATE|DELETE|MERGE)\b|\bFOR\s+(?:NO\s+KEY\s+|KEY\s+)?SHARE\b",
+    re.IGNORECASE,
+)
+SELECT_RE = re.compile(r"^\s*(?:SELECT|WITH)\b", re.IGNORECASE)
+WHITESPACE_RE = re.compile(r"\s+")
+# сколько разных форм параметров и эндпоинтов хранится на одно выражение
+MAX_SHAPES = 10
+
+
+def normalize_statement(statement: str) -> str:
+    """
+    Приводит выражение к виду, не зависящему от числа параметров:
+    IN ($1, $2, $3) и IN ($1) дают одну запись журнала
+    """
+    statement = PLACEHOLDER_LIST_RE.sub("(...)", statement)
+    statement = PLACEHOLDER_RE.sub("$?", statement)
+    return WHITESPACE_RE.sub(" ", statement).strip()
+
+
+def explain_sql(statement: str) -> str:
+    """
+    EXPLAIN (ANALYZE, BUFFERS) только для чтения: ANALYZE выполняет
+    выражение, поэтому для записи и SELECT ... FOR UPDATE снимается план
+    без выполнения
+    """
+    if SELECT_RE.match(statement) and not WRITE_RE.search(statement):
+        return f"EXPLAIN (ANALYZE, BUFFERS) {statement}"
+    return f"EXPLAIN {statement}"
+
+
+def parameters_shape(parameters) -> str:
+    """Форма параметров без значений: число и типы, например 12 x int, 1 x datetime"""
+    if not parameters:
+        return "no parameters"
+    if isinstance(parameters, dict):
+        parameters = list(parameters.values())
+    counts = Counter(type(value).__name__ for value in parameters)
+    return ", ".join(f"{count} x {name}" for name, count in sorted(counts.items()))
+
+
+class SlowQueryLog:
+    """
+    Журнал медленных выражений процесса. Записи дедуплицируются по
+    нормализованному тексту, самые давно не встречавшиеся вытесняются
+    """
+
+    def __init__(self, size: int = SLOW_QUERY_LOG_SIZE):
+        self.size = size
+        self.entries: OrderedDict[str, dict] = OrderedDict()
+        self._explain_tasks: set[asyncio.Task] = set()
+
+    def record(self, statement, parameters, duration_ms, endpoint) -> dict:
+        key = normalize_statement(statement)
+        now = datetime.now(timezone.utc).isoformat()
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = {
+                "statement": key,
+                "example": statement,
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "parameter_shapes": [],
+                "endpoints": {},
+                "first_seen": now,
+                "plan": None,
+                "plan_captured_at": None,
+            }
+            self.entries[key] = entry
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        self.entries.move_to_end(key)
+        entry["count"] += 1
+        entry["total_ms"] += duration_ms
+        entry["max_ms"] = max(entry["max_ms"], duration_ms)
+        entry["last_ms"] = duration_ms
+        entry["last_seen"] = now
+        shape = parameters_shape(parameters)
+        if shape not in entry["parameter_shapes"] and (
+            len(entry["parameter_shapes"]) < MAX_SHAPES
+        ):
+            entry["parameter_shapes"].append(shape)
+        endpoint = endpoint or "background"
+        if endpoint in entry["endpoints"] or len(entry["endpoints"]) < MAX_SHAPES:
+            entry["endpoints"][endpoint] = entry["endpoints"].get(endpoint, 0) + 1
+        return entry
+
+    def report(self) -> list[dict]:
+        """Записи по убыванию суммарного времени"""
+        return sorted(
+            (
+                {**entry, "total_ms": round(entry["total_ms"], 3)}
+                for entry in self.entries.values()
+            ),
+            key=lambda entry: entry["total_ms"],
+            reverse=True,
+        )
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def schedule_explain(self, entry: dict, engine: Engine, statement, parameters):
+        """
+        Запускает снятие плана в отдельной задаче с пустым контекстом,
+        чтобы EXPLAIN не задерживал запрос и не попадал в его статистику
+        """
+        if entry["plan"] is not None or entry.get("plan_pending"):
+            return
+        entry["plan_pending"] = True
+        loop = asyncio.get_running_loop()
+        # create_task(context=...) есть только с Python 3.11
+        task = contextvars.Context().run(
+            loop.create_task, self._capture_plan(entry, engine, statement, parameters)
+        )
+        self._explain_tasks.add(task)
+        task.add_done_callback(self._explain_tasks.discard)
+
+    async def _capture_plan(self, entry, engine, statement, parameters) -> None:
+        _explaining.set(True)
+        try:
+            async with AsyncEngine(engine).connect() as conn:
+                # EXPLAIN ANALYZE выполняет выражение (только чтение, см.
+                # explain_sql), транзакция откатывается при закрытии соединения
+                await conn.exec_driver_sql(
+                    f"SET LOCAL statement_timeout = {SLOW_QUERY_EXPLAIN_TIMEOUT_MS}"
+                )
+                result = await conn.exec_driver_sql(explain_sql(statement), parameters)
+                entry["plan"] = "\n".join(row[0] for row in result)
+                entry["plan_captured_at"] = datetime.now(timezone.utc).isoformat()
+        except Exception as error:
+            logger.warning(f"EXPLAIN for slow query failed: {error!r}")
+        finally:
+            entry.pop("plan_pending", None)
+
+    async def wait_for_plans(self) -> None:
+        """Дожидается снятия запланированных планов"""
+        if self._explain_tasks:
+            await asyncio.gather(*self._explain_tasks, return_exceptions=True)
+
+
+slow_query_log = SlowQueryLog()
+# выставляется в задаче EXPLAIN, чтобы сам EXPLAIN не попадал в журнал
+_explaining: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "explaining", default=False
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._slow_query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration_ms = (time.perf_counter() - context._slow_query_started) * 1000
+    if duration_ms < SLOW_QUERY_MS or _explaining.get():
+        return
+    endpoint: Optional[str] = current_request_name()
+    entry = slow_query_log.record(statement, parameters, duration_ms, endpoint)
+    logger.warning(
+        f"slow query {duration_ms:.1f} ms ({endpoint}): {entry['statement'][:500]}"
+    )
+    if SLOW_QUERY_EXPLAIN and not executemany:
+        try:
+            slow_query_log.schedule_explain(entry, conn.engine, statement, parameters)
+        except RuntimeError:
+            # вне event loop (синхронный движок миграций) план не снимаем
+            pass
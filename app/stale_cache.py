@@ -0,0 +1,234 @@
+import asyncio
+import base64
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from fastapi.responses import JSONResponse
+
+from app.cache import Cache
+from app.circuit_breaker import DB_UNAVAILABLE_ERRORS, db_circuit
+from app.config import STALE_DEADLINE, STALE_TTL
+from app.metrics import DEGRADED_RESPONSES
+from app.query_stats import collect_queries
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Маршруты, последний удачный ответ которых отдаётся, когда БД не справляется
+STALE_ROUTES = {"GET /api/tweets", "GET /api/users/me", "GET /api/users/{user_id}"}
+
+
+@dataclass
+class StoredResponse:
+    """Ответ, собранный из сообщений ASGI"""
+
+    status: int = 500
+    headers: list[tuple[bytes, bytes]] = field(default_factory=list)
+    body: bytes = b""
+    stored_at: float = 0.0
+
+    async def send(self, send, extra_headers: Optional[dict[str, str]] = None):
+        headers = list(self.headers)
+        for name, value in (extra_headers or {}).items():
+            headers.append((name.lower().encode(), value.encode()))
+        await send(
+            {"type": "http.response.start", "status": self.status, "headers": headers}
+        )
+        await send({"type": "http.response.body", "body": self.body})
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "headers": [
+                [name.decode("latin-1"), value.decode("latin-1")]
+                for name, value in self.headers
+            ],
+            "body": base64.b64encode(self.body).decode(),
+            "stored_at": self.stored_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StoredResponse":
+        return cls(
+            status=data["status"],
+            headers=[
+                (name.encode("latin-1"), value.encode("latin-1"))
+                for name, value in data["headers"]
+            ],
+            body=base64.b64decode(data["body"]),
+            stored_at=data["stored_at"],
+        )
+
+
+async def capture_response(app, scope, receive) -> StoredResponse:
+    """Выполняет запрос и собирает ответ в память вместо отправки клиенту"""
+    response = StoredResponse()
+    chunks = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response.status = message["status"]
+            response.headers = list(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    response.body = b"".join(chunks)
+    return response
+
+
+class StaleResponseStore:
+    """
+    Последние удачные ответы в кэше (пространство stale, не старше ttl)
+    и обновления, идущие в этом процессе
+    """
+
+    def __init__(self, ttl: float = STALE_TTL):
+        self.cache = Cache("stale", ttl=ttl)
+        self.refreshing: dict[str, asyncio.Task] = {}
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        data = await self.cache.get(key)
+        return None if data is None else StoredResponse.from_dict(data)
+
+    async def put(self, key: str, response: StoredResponse) -> None:
+        response.stored_at = time.time()
+        await self.cache.set(key, response.to_dict())
+
+    async def clear(self) -> None:
+        await self.cache.invalidate()
+
+    async def wait_for_refreshes(self) -> None:
+        """Дожидается фоновых обновлений"""
+        if self.refreshing:
+            await asyncio.gather(*self.refreshing.values(), return_exceptions=True)
+
+
+stale_responses = StaleResponseStore()
+
+
+def unavailable_response(retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={
+            "result": False,
+            "error_type": "ServiceUnavailable",
+            "error_message": "Database is unavailable, retry later",
+        },
+        headers={
+            "Retry-After": str(max(int(retry_after + 0.999), 1)),
+            "X-Degraded": "circuit-open",
+        },
+    )
+
+
+class StaleWhileRevalidateMiddleware:
+    """
+    ASGI middleware деградированного режима для запросов к /api/.
+
+    Для STALE_ROUTES сохраняется последний удачный ответ (отдельно для
+    каждого API key). Если свежий ответ не готов за STALE_DEADLINE секунд или
+    завершился ошибкой, клиент получает сохранённый, а обновление
+    продолжается в фоне; пока оно идёт, такие же запросы сразу получают
+    сохранённый ответ и не нагружают БД. Такие ответы помечены заголовком
+    X-Degraded (причина) и Age.
+
+    Ошибки недоступности БД размыкают автомат db_circuit: пока он разомкнут,
+    STALE_ROUTES отвечают сохранённым, а остальные запросы - быстрым 503.
+    Замыкает автомат только запрос, в котором выполнилось хотя бы одно
+    SQL-выражение: ответ из кэша ничего не говорит о доступности БД
+    """
+
+    def __init__(self, app, route_of: Callable[[dict], str]):
+        self.app = app
+        self.route_of = route_of
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or not path.startswith("/api/")
+            or path.startswith("/api/admin/")
+        ):
+            await self.app(scope, receive, send)
+            return
+        route = f"{scope['method']} {self.route_of(scope)}"
+        if route in STALE_ROUTES:
+            await self._serve_with_stale(scope, receive, send, route)
+        else:
+            await self._serve_guarded(scope, receive, send, route)
+
+    async def _serve_guarded(self, scope, receive, send, route):
+        if not db_circuit.allow():
+            DEGRADED_RESPONSES.labels(route, "circuit-open").inc()
+            await unavailable_response(db_circuit.retry_after())(scope, receive, send)
+            return
+        try:
+            with collect_queries() as stats:
+                await self.app(scope, receive, send)
+        except DB_UNAVAILABLE_ERRORS:
+            db_circuit.record_failure()
+            raise
+        if stats.statements:
+            db_circuit.record_success()
+
+    async def _serve_with_stale(self, scope, receive, send, route):
+        api_key = dict(scope["headers"]).get(b"api-key", b"").decode("latin-1")
+        query = scope.get("query_string", b"").decode("latin-1")
+        key = f"{api_key}|{scope['path']}?{query}"
+        stale = await stale_responses.get(key)
+
+        if stale is not None and key in stale_responses.refreshing:
+            await self._send_stale(stale, send, route, "refreshing")
+            return
+        if not db_circuit.allow():
+            if stale is None:
+                DEGRADED_RESPONSES.labels(route, "circuit-open").inc()
+                await unavailable_response(db_circuit.retry_after())(
+                    scope, receive, send
+                )
+            else:
+                await self._send_stale(stale, send, route, "circuit-open")
+            return
+
+        task = asyncio.create_task(self._refresh(key, scope, receive))
+        stale_responses.refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshed(key, task))
+        if stale is None:
+            response = await task
+            await response.send(send)
+            return
+
+        done, _ = await asyncio.wait({task}, timeout=STALE_DEADLINE)
+        if not done:
+            await self._send_stale(stale, send, route, "timeout")
+        elif task.exception() is not None or task.result().status >= 500:
+            await self._send_stale(stale, send, route, "error")
+        else:
+            await task.result().send(send)
+
+    async def _refresh(self, key: str, scope, receive) -> StoredResponse:
+        try:
+            with collect_queries() as stats:
+                response = await capture_response(self.app, scope, receive)
+        except DB_UNAVAILABLE_ERRORS:
+            db_circuit.record_failure()
+            raise
+        if stats.statements:
+            db_circuit.record_success()
+        if response.status == 200:
+            await stale_responses.put(key, response)
+        return response
+
+    def _refreshed(self, key: str, task: asyncio.Task) -> None:
+        if stale_responses.refreshing.get(key) is task:
+            del stale_responses.refreshing[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"refresh of {key} failed: {task.exception()!r}")
+
+    async def _send_stale(self, stale: StoredResponse, send, route, reason) -> None:
+        DEGRADED_RESPONSES.labels(route, reason).inc()
+        age = max(int(time.time() - stale.stored_at), 0)
+        await stale.send(send, {"X-Degraded": reason, "Age": str(age)})
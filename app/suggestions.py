@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import delete, func, insert, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.config import (
+    SUGGESTIONS_BATCH_SIZE,
+    SUGGESTIONS_COUNT,
+    SUGGESTIONS_FOLLOWS_YOU_WEIGHT,
+    SUGGESTIONS_FULL_INTERVAL,
+    SUGGESTIONS_INTERVAL,
+)
+from app.metrics import SUGGESTIONS_USERS
+from app.models import Follows, Suggestions, Users, UserStats
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# ключ advisory lock, чтобы рекомендации считал только один процесс
+SUGGESTIONS_LOCK_KEY = 7_310_044
+
+# строк follows за одно чтение при загрузке графа
+LOAD_CHUNK_SIZE = 50_000
+
+
+@dataclass
+class ScoredRows:
+    """Лучшие кандидаты пачки пользователей, по rank внутри пользователя"""
+
+    user_ids: np.ndarray
+    ranks: np.ndarray
+    suggested_ids: np.ndarray
+    scores: np.ndarray
+    mutual_counts: np.ndarray
+    follows_you: np.ndarray
+
+
+def adjacency(
+    follower_ids: np.ndarray, followed_ids: np.ndarray, size: int
+) -> sparse.csr_matrix:
+    """Матрица смежности: A[u, v] = 1, если u подписан на v"""
+    return sparse.csr_matrix(
+        (np.ones(len(follower_ids), dtype=np.float32), (follower_ids, followed_ids)),
+        shape=(size, size),
+    )
+
+
+def score_users(
+    graph: sparse.csr_matrix,
+    graph_t: sparse.csr_matrix,
+    user_ids: np.ndarray,
+    limit: int = SUGGESTIONS_COUNT,
+    follows_you_weight: float = SUGGESTIONS_FOLLOWS_YOU_WEIGHT,
+) -> ScoredRows:
+    """
+    Кандидаты для пачки пользователей. mutual - (A·A)[u, w], сколько
+    подписок u подписаны на w (друзья друзей); follows_you - A[w, u].
+    score = mutual + follows_you_weight * follows_you; кандидаты, на которых
+    u уже подписан, и сам u исключаются. Все шаги - операции над
+    разреженными матрицами пачки, без цикла по пользователям
+    """
+    block = graph[user_ids]
+    mutual = (block @ graph).tocsr()
+    follows_you = graph_t[user_ids]
+    scores = (mutual + follows_you_weight * follows_you).tocsr()
+    # уже подписан или сам пользователь - не кандидат
+    own = sparse.csr_matrix(
+        (
+            np.ones(len(user_ids), dtype=np.float32),
+            (np.arange(len(user_ids)), user_ids),
+        ),
+        shape=scores.shape,
+    )
+    scores = (scores - scores.multiply(block) - scores.multiply(own)).tocsr()
+    scores.eliminate_zeros()
+    scores.sort_indices()
+
+    # лучшие limit в каждой строке: сортировка по (строка, -score, id)
+    rows = np.repeat(np.arange(len(user_ids)), np.diff(scores.indptr))
+    order = np.lexsort((scores.indices, -scores.data, rows))
+    rows, cols, data = rows[order], scores.indices[order], scores.data[order]
+    ranks = np.arange(len(rows)) - scores.indptr[rows]
+    keep = ranks < limit
+    rows, cols, data, ranks = rows[keep], cols[keep], data[keep], ranks[keep]
+    return ScoredRows(
+        user_ids=user_ids[rows],
+        ranks=ranks,
+        suggested_ids=cols,
+        scores=data,
+        mutual_counts=np.asarray(mutual[rows, cols]).ravel().astype(np.int64),
+        follows_you=np.asarray(follows_you[rows, cols]).ravel() > 0,
+    )
+
+
+async def load_graph(engine: AsyncEngine) -> sparse.csr_matrix:
+    """Граф подписок из follows, размер - максимальный id пользователя + 1"""
+    followers, followed = [], []
+    async with engine.connect() as conn:
+        size = (await conn.execute(select(func.max(Users.id)))).scalar() or 0
+        result = await conn.stream(
+            select(Follows.follower_id, Follows.followed_id).execution_options(
+                yield_per=LOAD_CHUNK_SIZE
+            )
+        )
+        async for chunk in result.partitions():
+            pairs = np.array(chunk, dtype=np.int64).reshape(-1, 2)
+            followers.append(pairs[:, 0])
+            followed.append(pairs[:, 1])
+        await result.close()
+    follower_ids = np.concatenate(followers) if followers else np.empty(0, np.int64)
+    followed_ids = np.concatenate(followed) if followed else np.empty(0, np.int64)
+    if len(follower_ids):
+        size = max(size, int(follower_ids.max()), int(followed_ids.max()))
+    return adjacency(follower_ids, followed_ids, size + 1)
+
+
+async def changed_users(engine: AsyncEngine) -> np.ndarray:
+    """Пользователи, чьи подписки менялись после расчёта их рекомендаций"""
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            select(UserStats.user_id).where(
+                or_(
+                    UserStats.suggestions_at.is_(None),
+                    UserStats.graph_changed_at > UserStats.suggestions_at,
+                )
+            )
+        )
+        return np.array(result.scalars().all(), dtype=np.int64)
+
+
+def affected_users(graph_t: sparse.csr_matrix, changed: np.ndarray) -> np.ndarray:
+    """
+    Изменённые пользователи и их подписчики: рекомендации u зависят от
+    подписок u и подписок тех, на кого подписан u
+    """
+    changed = changed[changed < graph_t.shape[0]]
+    followers = graph_t[changed].indices
+    return np.union1d(changed, followers).astype(np.int64)
+
+
+async def store_batch(
+    engine: AsyncEngine,
+    user_ids: np.ndarray,
+    scored: ScoredRows,
+    computed_at: datetime,
+    changed: Optional[np.ndarray],
+) -> None:
+    """
+    Заменяет рекомендации пачки одной транзакцией и отмечает, для каких
+    пользователей они посчитаны (changed; None - для всей пачки)
+    """
+    ids = user_ids.tolist()
+    rows = [
+        {
+            "user_id": int(user_id),
+            "rank": int(rank),
+            "suggested_id": int(suggested_id),
+            "score": float(score),
+            "mutual_count": int(mutual_count),
+            "follows_you": bool(follows_you),
+        }
+        for user_id, rank, suggested_id, score, mutual_count, follows_you in zip(
+            scored.user_ids,
+            scored.ranks,
+            scored.suggested_ids,
+            scored.scores,
+            scored.mutual_counts,
+            scored.follows_you,
+        )
+    ]
+    marked = ids if changed is None else np.intersect1d(changed, user_ids).tolist()
+    async with engine.begin() as conn:
+        await conn.execute(delete(Suggestions).where(Suggestions.user_id.in_(ids)))
+        if rows:
+            await conn.execute(insert(Suggestions), rows)
+        if marked:
+            await conn.execute(
+                update(UserStats)
+                .where(UserStats.user_id.in_(marked))
+                .values(suggestions_at=computed_at)
+            )
+
+
+async def refresh_suggestions(
+    engine: AsyncEngine,
+    full: bool = False,
+    batch_size: int = SUGGESTIONS_BATCH_SIZE,
+) -> int:
+    """
+    Пересчитывает рекомендации: всем пользователям (full) или только
+    затронутым изменениями подписок. Граф загружается один раз, пачки по
+    batch_size пользователей считаются в отдельном потоке, чтобы не
+    занимать event loop, и записываются каждая своей транзакцией.
+    Возвращает число пересчитанных пользователей
+    """
+    async with engine.connect() as conn:
+        # изменения после этого момента попадут в следующий расчёт
+        computed_at = (await conn.execute(select(func.now()))).scalar_one()
+    graph = await load_graph(engine)
+    graph_t = graph.T.tocsr()
+    if full:
+        changed = None
+        user_ids = np.arange(1, graph.shape[0], dtype=np.int64)
+    else:
+        changed = await changed_users(engine)
+        user_ids = affected_users(graph_t, changed)
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start : start + batch_size]
+        scored = await asyncio.to_thread(score_users, graph, graph_t, batch)
+        await store_batch(engine, batch, scored, computed_at, changed)
+    SUGGESTIONS_USERS.labels("full" if full else "incremental").inc(len(user_ids))
+    logger.info(
+        f"suggestions refreshed for {len(user_ids)} users "
+        f"({'full' if full else 'incremental'})"
+    )
+    return len(user_ids)
+
+
+async def refresh_suggestions_locked(engine: AsyncEngine, full: bool) -> bool:
+    """
+    refresh_suggestions под advisory lock: если расчёт уже идёт в другом
+    процессе, ничего не делает и возвращает False
+    """
+    async with engine.connect() as conn:
+        locked = (
+            await conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"),
+                {"key": SUGGESTIONS_LOCK_KEY},
+            )
+        ).scalar()
+        await conn.commit()
+        if not locked:
+            return False
+        try:
+            await refresh_suggestions(engine, full=full)
+        finally:
+            await conn.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": SUGGESTIONS_LOCK_KEY}
+            )
+            await conn.commit()
+    return True
+
+
+async def maintain_suggestions(
+    engine: AsyncEngine,
+    interval: int = SUGGESTIONS_INTERVAL,
+    full_interval: int = SUGGESTIONS_FULL_INTERVAL,
+) -> None:
+    """
+    Фоновая задача: каждые interval секунд пересчитывает рекомендации
+    пользователей с изменившимися подписками, а раз в full_interval -
+    всех (изменения в обход API, например удаление пользователей)
+    """
+    full_at = time.monotonic() + full_interval
+    while True:
+        await asyncio.sleep(interval)
+        full = time.monotonic() >= full_at
+        try:
+            if await refresh_suggestions_locked(engine, full) and full:
+                full_at = time.monotonic() + full_interval
+        except Exception:
+            logger.exception("Failed to refresh suggestions")
+
+
+def main(argv: list[str] | None = None) -> None:
+    from app.database import DATABASE_URL
+
+    parser = argparse.ArgumentParser(description="Пересчёт рекомендаций «кого читать»")
+    parser.add_argument("--full", action="store_true", help="для всех пользователей")
+    args = parser.parse_args(argv)
+
+    async def run():
+        engine = create_async_engine(DATABASE_URL)
+        try:
+            if not await refresh_suggestions_locked(engine, args.full):
+                logger.warning("suggestions are being refreshed by another process")
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import json
+import logging
+import random
+import re
+import secrets
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+import aiofiles
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.config import (
+    TRACE_BUFFER_SIZE,
+    TRACE_FILE,
+    TRACE_SAMPLE_RATE,
+    TRACE_SLOW_MS,
+)
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Заголовок W3C Trace Context: версия-trace_id-parent_id-флаги
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+# SQL в атрибутах спана обрезается до этой длины
+SQL_ATTRIBUTE_LIMIT = 1000
+
+
+class Trace:
+    """Трасса одного HTTP-запроса: дерево спанов с общим trace_id"""
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], sampled: bool):
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.started_at = datetime.now(timezone.utc)
+        self.spans: list[Span] = []
+
+    @property
+    def root(self) -> "Span":
+        return self.spans[0]
+
+    def to_dict(self) -> dict:
+        root = self.root
+        children_ms: dict[str, float] = {}
+        for span in self.spans:
+            if span.parent_id is not None:
+                children_ms[span.parent_id] = (
+                    children_ms.get(span.parent_id, 0.0) + span.duration_ms
+                )
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(root.duration_ms, 3),
+            "spans": [
+                {
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "name": span.name,
+                    "start_ms": round((span.start - root.start) * 1000, 3),
+                    "duration_ms": round(span.duration_ms, 3),
+                    # собственное время без дочерних спанов: у orm.load
+                    # это разбор строк в объекты ORM
+                    "self_ms": round(
+                        span.duration_ms - children_ms.get(span.span_id, 0.0), 3
+                    ),
+                    "attributes": span.attributes,
+                }
+                for span in self.spans
+            ],
+        }
+
+
+class Span:
+    """Отрезок работы внутри трассы"""
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], **attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        trace.spans.append(self)
+
+    def finish(self) -> None:
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def child(self, name: str, **attributes) -> "Span":
+        return Span(self.trace, name, self.span_id, **attributes)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+# момент завершения эндпоинта, с него начинается спан response.encode
+_encode_started: ContextVar[Optional[float]] = ContextVar(
+    "encode_started", default=None
+)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Дочерний спан текущего спана. Вне трассируемого запроса
+    (фоновые задачи, тесты без middleware) ничего не делает
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    current = parent.child(name, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.finish()
+        _current_span.reset(token)
+
+
+def current_request_name() -> Optional[str]:
+    """Метод и шаблон маршрута трассируемого запроса, например GET /api/tweets"""
+    current = _current_span.get()
+    return current.trace.root.name if current is not None else None
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple[str, str, bool]]:
+    """trace_id, parent_id и флаг sampled из заголовка traceparent"""
+    match = TRACEPARENT_RE.match((value or "").strip().lower())
+    if match is None:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+class InMemoryExporter:
+    """Последние сохранённые трассы в памяти процесса"""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE):
+        self.traces: deque = deque(maxlen=size)
+
+    async def export(self, trace: dict) -> None:
+        self.traces.append(trace)
+
+    def find(self, trace_id: Optional[str] = None, min_duration_ms: float = 0):
+        """Трассы от новых к старым с фильтром по trace_id и длительности"""
+        return [
+            trace
+            for trace in reversed(self.traces)
+            if (trace_id is None or trace["trace_id"] == trace_id)
+            and trace["duration_ms"] >= min_duration_ms
+        ]
+
+
+class FileExporter:
+    """Дописывает трассы в файл, по одной JSON-строке на трассу"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def export(self, trace: dict) -> None:
+        async with aiofiles.open(self.path, "a") as out_file:
+            await out_file.write(json.dumps(trace, ensure_ascii=False) + "\n")
+
+
+memory_exporter = InMemoryExporter()
+exporters: list = [memory_exporter]
+if TRACE_FILE:
+    exporters.append(FileExporter(TRACE_FILE))
+
+
+def should_keep(trace: Trace, status_code: int) -> bool:
+    """Tail sampling: решение принимается после завершения запроса"""
+    return (
+        trace.sampled
+        or status_code >= 500
+        or trace.root.duration_ms >= TRACE_SLOW_MS
+        or (TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE)
+    )
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware, открывающее корневой спан запроса. Продолжает трассу
+    из входящего traceparent и возвращает traceparent в ответе,
+    чтобы сохранённую трассу можно было найти по trace_id
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = parse_traceparent(Headers(scope=scope).get("traceparent"))
+        if incoming is None:
+            trace = Trace(secrets.token_hex(16), None, False)
+        else:
+            trace = Trace(*incoming)
+        root = Span(trace, f"{scope['method']} {scope['path']}", trace.parent_id)
+        status_code = 500
+
+        async def send_with_traceparent(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                flags = "01" if trace.sampled else "00"
+                headers = MutableHeaders(scope=message)
+                headers["traceparent"] = f"00-{trace.trace_id}-{root.span_id}-{flags}"
+            await send(message)
+
+        token = _current_span.set(root)
+        try:
+            await self.app(scope, receive, send_with_traceparent)
+        finally:
+            _current_span.reset(token)
+            root.finish()
+            route = scope.get("route")
+            if route is not None:
+                root.name = f"{scope['method']} {route.path}"
+            root.attributes["http.status_code"] = status_code
+            if should_keep(trace, status_code):
+                data = trace.to_dict()
+                for exporter in exporters:
+                    try:
+                        await exporter.export(data)
+                    except Exception:
+                        logger.exception("trace export failed")
+
+
+class TracedRoute(APIRoute):
+    """
+    Маршрут, который оборачивает эндпоинт в спан endpoint, а время от его
+    завершения до готового ответа (валидация response_model и JSON) -
+    в спан response.encode
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        endpoint = self.dependant.call
+
+        async def traced_endpoint(**kwargs):
+            with span("endpoint", handler=endpoint.__name__) as current:
+                result = await endpoint(**kwargs)
+            if current is not None:
+                _encode_started.set(current.end)
+            return result
+
+        # FastAPI вызывает dependant.call уже после разбора сигнатуры
+        self.dependant.call = traced_endpoint
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            parent = _current_span.get()
+            if parent is not None:
+                # маршрут известен: корневой спан получает шаблон пути
+                parent.trace.root.name = f"{request.method} {self.path}"
+            token = _encode_started.set(None)
+            try:
+                response = await handler(request)
+                encode_started = _encode_started.get()
+                if encode_started is not None and parent is not None:
+                    encode = parent.child("response.encode")
+                    encode.start = encode_started
+                    encode.finish()
+                return response
+            finally:
+                _encode_started.reset(token)
+
+        return traced_handler
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_sql_span(conn, cursor, statement, parameters, context, executemany):
+    parent = _current_span.get()
+    if parent is not None:
+        context._trace_span = parent.child(
+            "sql", statement=statement[:SQL_ATTRIBUTE_LIMIT]
+        )
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _finish_sql_span(conn, cursor, statement, parameters, context, executemany):
+    sql_span = getattr(context, "_trace_span", None)
+    if sql_span is not None:
+        sql_span.attributes["rows"] = max(cursor.rowcount, 0)
+        sql_span.finish()
+
+
+@event.listens_for(Engine, "handle_error")
+def _fail_sql_span(exception_context):
+    context = exception_context.execution_context
+    sql_span = getattr(context, "_trace_span", None) if context else None
+    if sql_span is not None:
+        sql_span.attributes["error"] = repr(exception_context.original_exception)
+        sql_span.finish()
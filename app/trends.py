@@ -0,0 +1,342 @@
+import asyncio
+import heapq
+import logging
+import re
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Mapping, Optional
+
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import (
+    TRENDS_FLUSH_INTERVAL,
+    TRENDS_HALF_LIFE,
+    TRENDS_TOP_K,
+    TRENDS_WINDOW_HOURS,
+)
+from app.database import AsyncSession
+from app.metrics import TRENDS_TAGS
+from app.models import TrendBuckets, TweetHashtags, TweetMentions, Tweets, Users
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+MINUTE = timedelta(minutes=1)
+HOUR = timedelta(hours=1)
+
+# хештег - слово после #, в котором есть хотя бы одна буква (#2026 - не хештег);
+# # и @ внутри слова (адрес почты, якорь ссылки) не считаются
+HASHTAG = re.compile(r"(?<!\w)#(\w*[^\W\d_]\w*)")
+MENTION = re.compile(r"(?<!\w)@(\w+)")
+HASHTAG_MAX_LENGTH = TweetHashtags.tag.type.length
+NAME_MAX_LENGTH = Users.name.type.length
+
+# после скольких периодов полураспада веса пересчитываются от нового начала
+# отсчёта, чтобы 2 ** (возраст / half_life) не росло без предела
+RENORMALIZE_HALF_LIVES = 32
+
+
+def unique_lower(words: Iterable[str], max_length: int) -> list[str]:
+    """Слова в нижнем регистре без повторов, в порядке появления"""
+    words = (word.lower() for word in words if len(word) <= max_length)
+    return list(dict.fromkeys(words))
+
+
+def extract_hashtags(text: str) -> list[str]:
+    return unique_lower(HASHTAG.findall(text), HASHTAG_MAX_LENGTH)
+
+
+def extract_mentions(text: str) -> list[str]:
+    return unique_lower(MENTION.findall(text), NAME_MAX_LENGTH)
+
+
+async def save_hashtags_and_mentions(session: AsyncSession, tweet: Tweets) -> list[str]:
+    """
+    Записывает хештеги и упоминания нового твита в tweet_hashtags и
+    tweet_mentions одним выражением (без запроса, если их нет) и возвращает
+    хештеги. @имя упоминает всех пользователей с таким именем без учёта
+    регистра, неизвестные имена пропускаются. Вызывается внутри транзакции
+    создания твита
+    """
+    tags = extract_hashtags(tweet.content)
+    names = extract_mentions(tweet.content)
+    statement = None
+    if tags:
+        statement = insert(TweetHashtags).values(
+            [
+                {"tweet_id": tweet.id, "tag": tag, "created_at": tweet.created_at}
+                for tag in tags
+            ]
+        )
+    if names:
+        mentions = insert(TweetMentions).from_select(
+            ["tweet_id", "user_id"],
+            select(literal(tweet.id), Users.id).where(
+                func.lower(Users.name).in_(names)
+            ),
+        )
+        if statement is not None:
+            mentions = mentions.add_cte(statement.cte("hashtags"))
+        statement = mentions
+    if statement is not None:
+        await session.execute(statement)
+    return tags
+
+
+def minute_start(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(second=0, microsecond=0)
+
+
+def hour_start(moment: datetime) -> datetime:
+    return minute_start(moment).replace(minute=0)
+
+
+class TrendCounters:
+    """
+    Тренды хештегов в памяти процесса.
+
+    Счётчики хештегов хранятся корзинами: поминутно за последний час и
+    почасово за window_hours. Минута старше часа сворачивается в свой час,
+    час, вышедший из окна, удаляется вместе со своим вкладом.
+
+    Счёт хештега - число твитов с ним, где твит весит вдвое меньше каждые
+    half_life секунд. Чтобы время не меняло все счёты сразу, затухание
+    прямое: корзина входит в счёт с весом 2 ** ((начало корзины - origin) /
+    half_life), который для новых корзин растёт. Делитель до текущего
+    момента одинаков для всех хештегов и порядка не меняет, поэтому счёт
+    хештега меняется, только когда меняются его корзины.
+
+    Лучшие top_k хештегов хранятся готовыми в top. Если счёты только росли,
+    новый top выбирается из прежнего и изменившихся хештегов; по всем
+    хештегам он отбирается только после уменьшений (свёртка минут в часы,
+    выход часа из окна).
+
+    Новые хештеги процесс копит в pending; фоновая задача (maintain_trends)
+    прибавляет их к поминутным счётчикам trend_buckets и перечитывает
+    оттуда последние минуты, поэтому тренды общие для всех процессов
+    """
+
+    def __init__(
+        self,
+        top_k: int = TRENDS_TOP_K,
+        window_hours: int = TRENDS_WINDOW_HOURS,
+        half_life: float = TRENDS_HALF_LIFE,
+        flush_interval: float = TRENDS_FLUSH_INTERVAL,
+    ):
+        self.top_k = top_k
+        self.window = timedelta(hours=window_hours)
+        self.half_life = half_life
+        # минуты, в которые другие процессы ещё могут дописать счётчики
+        self.settle = timedelta(seconds=3 * flush_interval)
+        self.clear()
+
+    def clear(self) -> None:
+        self.origin = minute_start(datetime.now(timezone.utc))
+        self.minutes: dict[datetime, Counter[str]] = {}
+        self.hours: dict[datetime, Counter[str]] = {}
+        self.minutes_from: Optional[datetime] = None
+        self.scores: dict[str, float] = {}
+        self.last_hour: Counter[str] = Counter()
+        self.in_window: Counter[str] = Counter()
+        self.pending: Counter[tuple[datetime, str]] = Counter()
+        self.top: list[tuple[str, float]] = []
+        self.loaded = False
+        self.purged_before: Optional[datetime] = None
+        self._changed: set[str] = set()
+        self._lowered = False
+        TRENDS_TAGS.set(0)
+
+    def record(self, tags: Iterable[str], at: datetime) -> None:
+        """Учитывает хештеги твита, созданного в момент at"""
+        minute = minute_start(at)
+        for tag in tags:
+            self.pending[minute, tag] += 1
+
+    def weight(self, bucket: datetime) -> float:
+        return 2 ** ((bucket - self.origin).total_seconds() / self.half_life)
+
+    def _change(self, tag: str, count: int, bucket: datetime, minute: bool) -> None:
+        """Добавляет к счётчикам хештега count твитов корзины bucket"""
+        if not count:
+            return
+        self.scores[tag] = self.scores.get(tag, 0.0) + count * self.weight(bucket)
+        self.in_window[tag] += count
+        if minute:
+            self.last_hour[tag] += count
+        self._changed.add(tag)
+        if count < 0:
+            self._lowered = True
+        if self.in_window[tag] <= 0:
+            # без остатка от сложения дробных весов
+            del self.scores[tag], self.in_window[tag]
+            self.last_hour.pop(tag, None)
+
+    def set_minute(self, minute: datetime, counts: Mapping[str, int]) -> None:
+        """Заменяет счётчики минуты значениями из trend_buckets"""
+        if self.minutes_from is None or minute < self.minutes_from:
+            # минута уже свёрнута в час
+            return
+        bucket = self.minutes.setdefault(minute, Counter())
+        for tag in set(bucket) | set(counts):
+            count = counts.get(tag, 0)
+            self._change(tag, count - bucket[tag], minute, minute=True)
+            bucket[tag] = count
+        bucket += Counter()  # без нулевых счётчиков
+        if not bucket:
+            del self.minutes[minute]
+
+    def add_hour(self, hour: datetime, tag: str, count: int) -> None:
+        self.hours.setdefault(hour, Counter())[tag] += count
+        self._change(tag, count, hour, minute=False)
+
+    def advance(self, now: datetime) -> datetime:
+        """
+        Сворачивает минуты старше часа в часы и удаляет часы вне окна.
+        Возвращает начало первой минутной корзины
+        """
+        minutes_from = minute_start(now) - HOUR + MINUTE
+        for minute in sorted(m for m in self.minutes if m < minutes_from):
+            hour = hour_start(minute)
+            for tag, count in self.minutes.pop(minute).items():
+                self._change(tag, -count, minute, minute=True)
+                self.add_hour(hour, tag, count)
+        self.minutes_from = minutes_from
+        for hour in [h for h in self.hours if h + HOUR <= now - self.window]:
+            for tag, count in self.hours.pop(hour).items():
+                self._change(tag, -count, hour, minute=False)
+        if now - self.origin > RENORMALIZE_HALF_LIVES * timedelta(
+            seconds=self.half_life
+        ):
+            origin = minute_start(now)
+            factor = 1 / self.weight(origin)
+            self.scores = {tag: score * factor for tag, score in self.scores.items()}
+            self.top = [(tag, score * factor) for tag, score in self.top]
+            self.origin = origin
+        TRENDS_TAGS.set(len(self.scores))
+        return minutes_from
+
+    def update_top(self) -> None:
+        """Обновляет top по изменившимся хештегам"""
+        candidates: Iterable[tuple[str, float]]
+        if self._lowered:
+            candidates = self.scores.items()
+        else:
+            tags = {tag for tag, _ in self.top} | self._changed
+            candidates = [(tag, self.scores[tag]) for tag in tags]
+        self.top = heapq.nsmallest(
+            self.top_k, candidates, key=lambda item: (-item[1], item[0])
+        )
+        self._changed = set()
+        self._lowered = False
+
+    def trends(self, limit: int, now: Optional[datetime] = None) -> list[dict]:
+        """Лучшие хештеги из готового top, счёт - на момент now"""
+        now = now or datetime.now(timezone.utc)
+        decay = 1 / self.weight(now)
+        return [
+            {
+                "tag": tag,
+                "score": score * decay,
+                "tweets_last_hour": self.last_hour[tag],
+                "tweets_in_window": self.in_window[tag],
+            }
+            for tag, score in self.top[:limit]
+        ]
+
+    async def flush(self, engine: AsyncEngine) -> None:
+        """
+        Прибавляет накопленные счётчики процесса к trend_buckets. Строки
+        идут в порядке первичного ключа, чтобы процессы блокировали их в
+        одном порядке и не попадали во взаимную блокировку. При ошибке
+        счётчики остаются в pending до следующего сброса
+        """
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, Counter()
+        rows = [
+            {"bucket_start": minute, "tag": tag, "count": count}
+            for (minute, tag), count in sorted(pending.items())
+        ]
+        statement = insert(TrendBuckets)
+        statement = statement.on_conflict_do_update(
+            index_elements=[TrendBuckets.bucket_start, TrendBuckets.tag],
+            set_={"count": TrendBuckets.count + statement.excluded.count},
+        )
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(statement, rows)
+        except BaseException:
+            self.pending.update(pending)
+            raise
+
+    async def refresh(self, engine: AsyncEngine, now: Optional[datetime] = None):
+        """
+        Сдвигает корзины к now и перечитывает из trend_buckets минуты, в
+        которые процессы ещё могут дописывать счётчики; при первом вызове -
+        всё окно, старше часа - сразу суммами по часам. Счётчики, сброшенные
+        другим процессом с опозданием больше settle, появятся в трендах
+        процесса только после перезапуска
+        """
+        now = now or datetime.now(timezone.utc)
+        minutes_from = self.advance(now)
+        async with engine.connect() as conn:
+            if not self.loaded:
+                hour = func.date_trunc("hour", TrendBuckets.bucket_start, "UTC")
+                result = await conn.execute(
+                    select(hour, TrendBuckets.tag, func.sum(TrendBuckets.count))
+                    .where(
+                        TrendBuckets.bucket_start >= hour_start(now - self.window),
+                        TrendBuckets.bucket_start < minutes_from,
+                    )
+                    .group_by(hour, TrendBuckets.tag)
+                )
+                for hour_value, tag, count in result:
+                    self.add_hour(hour_value.astimezone(timezone.utc), tag, count)
+            else:
+                minutes_from = max(minutes_from, minute_start(now - self.settle))
+            result = await conn.execute(
+                select(
+                    TrendBuckets.bucket_start, TrendBuckets.tag, TrendBuckets.count
+                ).where(TrendBuckets.bucket_start >= minutes_from)
+            )
+            counts: defaultdict[datetime, dict[str, int]] = defaultdict(dict)
+            for minute, tag, count in result:
+                counts[minute.astimezone(timezone.utc)][tag] = count
+        for minute in set(counts) | {m for m in self.minutes if m >= minutes_from}:
+            self.set_minute(minute, counts[minute])
+        self.loaded = True
+        self.update_top()
+
+    async def purge(self, engine: AsyncEngine, now: Optional[datetime] = None):
+        """Раз в час удаляет из trend_buckets строки, вышедшие из окна"""
+        now = now or datetime.now(timezone.utc)
+        before = hour_start(now - self.window)
+        if self.purged_before is not None and before <= self.purged_before:
+            return
+        async with engine.begin() as conn:
+            await conn.execute(
+                delete(TrendBuckets).where(TrendBuckets.bucket_start < before)
+            )
+        self.purged_before = before
+
+
+trend_counters = TrendCounters()
+
+
+async def maintain_trends(
+    engine: AsyncEngine, interval: float = TRENDS_FLUSH_INTERVAL
+) -> None:
+    """
+    Фоновая задача: загружает тренды при старте, затем каждые interval
+    секунд сбрасывает счётчики процесса в trend_buckets и обновляет тренды
+    """
+    while True:
+        try:
+            await trend_counters.flush(engine)
+            await trend_counters.refresh(engine)
+            await trend_counters.purge(engine)
+        except Exception:
+            logger.exception("Failed to update trends")
+        await asyncio.sleep(interval)
@@ -0,0 +1,273 @@
+import base64
+import html
+import json
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import ColumnElement, func, literal, select, tuple_
+from sqlalchemy.dialects.postgresql import TSQUERY
+
+from app.config import (
+    TWEET_SEARCH_CANDIDATES,
+    TWEET_SEARCH_SCAN_LIMIT,
+    TWEET_SEARCH_WINDOW_DAYS,
+)
+from app.database import AsyncSession
+from app.models import Tweets, Users
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# границы найденных слов во фрагменте ts_headline: символы из области
+# частного использования Unicode, которых нет в обычном тексте, чтобы
+# экранировать текст и только потом расставить <mark>
+START_SEL, STOP_SEL = "\ue000", "\ue001"
+HEADLINE_OPTIONS = f"StartSel={START_SEL}, StopSel={STOP_SEL}, MinWords=15, MaxWords=35"
+
+CYRILLIC = re.compile("[а-яё]", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class SearchCursor:
+    """
+    Позиция в выдаче: последний отданный твит (rank, created_at, id) и
+    момент первой страницы as_of - твиты новее него в выдачу не попадают,
+    поэтому страницы не сдвигаются при появлении новых твитов. indexed -
+    кандидаты первой страницы найдены по GIN-индексу: следующие страницы
+    ищутся сразу тем же способом, одним выражением
+    """
+
+    as_of: datetime
+    rank: Optional[float] = None
+    created_at: Optional[datetime] = None
+    id: Optional[int] = None
+    indexed: bool = False
+
+    def encode(self) -> str:
+        created_at = self.created_at.isoformat() if self.created_at else None
+        data = [self.as_of.isoformat(), self.rank, created_at, self.id, self.indexed]
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+    @classmethod
+    def decode(cls, value: str) -> "SearchCursor":
+        """ValueError, если курсор не выдан этим поиском"""
+        try:
+            as_of, rank, created_at, tweet_id, indexed = json.loads(
+                base64.urlsafe_b64decode(value.encode())
+            )
+            return cls(
+                as_of=datetime.fromisoformat(as_of),
+                rank=float(rank),
+                created_at=datetime.fromisoformat(created_at),
+                id=int(tweet_id),
+                indexed=bool(indexed),
+            )
+        except (TypeError, ValueError, UnicodeDecodeError) as error:
+            raise ValueError("Invalid cursor") from error
+
+
+def tweets_query(query: str):
+    """Запрос в синтаксисе поисковиков, разобранный обеими конфигурациями"""
+    return func.websearch_to_tsquery("russian", query).op("||", return_type=TSQUERY)(
+        func.websearch_to_tsquery("english", query)
+    )
+
+
+def headline_config(query: str) -> str:
+    """Конфигурация подсветки - по языку запроса"""
+    return "russian" if CYRILLIC.search(query) else "english"
+
+
+def highlight(snippet: str) -> str:
+    return (
+        html.escape(snippet).replace(START_SEL, "<mark>").replace(STOP_SEL, "</mark>")
+    )
+
+
+def select_tweets_matching(
+    query: str,
+    cursor: SearchCursor,
+    limit: int,
+    author_ids: Optional[list[int]] = None,
+    hidden: frozenset[int] = frozenset(),
+    scan_limit: Optional[int] = None,
+):
+    """
+    Одно выражение из трёх ступеней:
+    candidates - TWEET_SEARCH_CANDIDATES самых новых совпадений за
+    TWEET_SEARCH_WINDOW_DAYS до as_of; page - ранжирование только
+    кандидатов и keyset-курсор по (rank, created_at, id); подсветка
+    ts_headline считается только для строк страницы.
+
+    Кандидаты ищутся одним из двух способов. С scan_limit проверяются
+    только scan_limit самых новых твитов окна (индекс ix_tweets_created_at) -
+    быстро для частых слов, совпадения которых набираются среди новых
+    твитов; без него - по GIN-индексу ix_tweets_search_vector, быстро для
+    редких слов. Строки несут matched (сколько кандидатов) и scanned
+    (сколько твитов проверено), по ним search_tweets на первой странице
+    понимает, полон ли результат первого способа. matched считается после
+    условия курсора, поэтому на следующих страницах не годится
+    """
+    ts_query = tweets_query(query)
+    conditions = [
+        Tweets.created_at > cursor.as_of - timedelta(days=TWEET_SEARCH_WINDOW_DAYS),
+        Tweets.created_at <= cursor.as_of,
+    ]
+    if author_ids is not None:
+        conditions.append(Tweets.user_id.in_(author_ids))
+    if hidden:
+        conditions.append(Tweets.user_id.not_in(hidden))
+    columns = (
+        Tweets.id,
+        Tweets.user_id,
+        Tweets.content,
+        Tweets.created_at,
+        Tweets.search_vector,
+    )
+    if scan_limit is None:
+        # сортировка по выражению, а не по столбцу: иначе для слов, которых
+        # нет в статистике, планировщик выбирает обход ix_tweets_created_at
+        # по всему окну вместо GIN-индекса
+        candidates_query = (
+            select(*columns)
+            .where(Tweets.search_vector.bool_op("@@")(ts_query), *conditions)
+            .order_by((Tweets.created_at + timedelta(0)).desc())
+        )
+        scanned: ColumnElement[Optional[int]] = literal(None)
+    else:
+        # два независимых подзапроса, а не CTE: общий CTE материализуется
+        # целиком, а так обход новых твитов останавливается на
+        # TWEET_SEARCH_CANDIDATES совпадениях
+        recent = (
+            select(*columns)
+            .where(*conditions)
+            .order_by(Tweets.created_at.desc())
+            .limit(scan_limit)
+            .subquery("recent")
+        )
+        candidates_query = (
+            select(*recent.c)
+            .where(recent.c.search_vector.bool_op("@@")(ts_query))
+            .order_by(recent.c.created_at.desc())
+        )
+        window = (
+            select(Tweets.created_at)
+            .where(*conditions)
+            .order_by(Tweets.created_at.desc())
+            .limit(scan_limit)
+            .subquery()
+        )
+        scanned = select(func.count()).select_from(window).scalar_subquery()
+    candidates = candidates_query.limit(TWEET_SEARCH_CANDIDATES).subquery("candidates")
+    rank = func.ts_rank(candidates.c.search_vector, ts_query)
+    page_query = select(
+        candidates.c.id,
+        candidates.c.user_id,
+        candidates.c.content,
+        candidates.c.created_at,
+        rank.label("rank"),
+        func.count().over().label("matched"),
+        scanned.label("scanned"),
+    )
+    if cursor.id is not None:
+        page_query = page_query.where(
+            tuple_(rank, candidates.c.created_at, candidates.c.id)
+            < tuple_(cursor.rank, cursor.created_at, cursor.id)
+        )
+    page = (
+        page_query.order_by(
+            rank.desc(), candidates.c.created_at.desc(), candidates.c.id.desc()
+        )
+        .limit(limit)
+        .subquery("page")
+    )
+    return (
+        select(
+            page.c.id,
+            page.c.content,
+            page.c.created_at,
+            page.c.rank,
+            page.c.matched,
+            page.c.scanned,
+            page.c.user_id,
+            Users.name,
+            func.ts_headline(
+                headline_config(query), page.c.content, ts_query, HEADLINE_OPTIONS
+            ).label("snippet"),
+        )
+        .join(Users, Users.id == page.c.user_id)
+        .order_by(page.c.rank.desc(), page.c.created_at.desc(), page.c.id.desc())
+    )
+
+
+async def search_tweets(
+    session: AsyncSession,
+    query: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    author_ids: Optional[list[int]] = None,
+    hidden: frozenset[int] = frozenset(),
+    scan_limit: int = TWEET_SEARCH_SCAN_LIMIT,
+) -> dict:
+    """
+    Страница поиска твитов. На первой странице кандидаты сначала ищутся
+    среди scan_limit самых новых твитов; если там меньше
+    TWEET_SEARCH_CANDIDATES совпадений, а окно не просмотрено целиком,
+    запрос повторяется по GIN-индексу. Выбранный способ записывается в
+    курсор, и следующие страницы - одно выражение тем же способом. Оба
+    способа дают одних и тех же кандидатов, поэтому страницы одной выдачи
+    согласованы. Берётся limit + 1 строка, чтобы понять, есть ли следующая
+    страница. Вызывается внутри транзакции вызывающего
+    """
+    position = (
+        SearchCursor.decode(cursor)
+        if cursor
+        else SearchCursor(as_of=datetime.now(timezone.utc))
+    )
+    indexed = position.indexed
+    result = await session.execute(
+        select_tweets_matching(
+            query,
+            position,
+            limit + 1,
+            author_ids,
+            hidden,
+            scan_limit=None if indexed else scan_limit,
+        )
+    )
+    rows = result.all()
+    if position.id is None and not indexed:
+        # на первой странице условия курсора нет: matched - число всех кандидатов
+        indexed = not rows or (
+            rows[0].matched < TWEET_SEARCH_CANDIDATES and rows[0].scanned >= scan_limit
+        )
+        if indexed:
+            result = await session.execute(
+                select_tweets_matching(query, position, limit + 1, author_ids, hidden)
+            )
+            rows = result.all()
+    tweets = [
+        {
+            "id": row.id,
+            "content": row.content,
+            "snippet": highlight(row.snippet),
+            "author": {"id": row.user_id, "name": row.name},
+            "created_at": row.created_at,
+            "rank": row.rank,
+        }
+        for row in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = SearchCursor(
+            as_of=position.as_of,
+            rank=last.rank,
+            created_at=last.created_at,
+            id=last.id,
+            indexed=indexed,
+        ).encode()
+    return {"result": True, "tweets": tweets, "next_cursor": next_cursor}
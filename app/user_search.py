@@ -0,0 +1,179 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sqlalchemy import func, select
+
+from app.config import (
+    USER_SEARCH_CACHE_SIZE,
+    USER_SEARCH_CACHE_TTL,
+    USER_SEARCH_MAX_LIMIT,
+)
+from app.database import AsyncSession
+from app.metrics import USER_SEARCH_LOOKUPS
+from app.models import Users, UserStats
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# с трёх символов имя ищется по подстроке (триграммы), короче - по началу
+SUBSTRING_MIN_LENGTH = 3
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    """
+    Найденные пользователи (id, name, followers_count) в порядке выдачи.
+    complete - найдены все совпадения, а не первые USER_SEARCH_MAX_LIMIT
+    """
+
+    users: tuple[tuple[int, str, int], ...]
+    complete: bool
+
+
+def normalize(query: str) -> str:
+    return " ".join(query.split()).lower()
+
+
+def matches(name: str, query: str) -> bool:
+    """То же условие, что и в SQL: подстрока или начало имени без учёта регистра"""
+    name = name.lower()
+    if len(query) >= SUBSTRING_MIN_LENGTH:
+        return query in name
+    return name.startswith(query)
+
+
+def rank_key(query: str):
+    """Сначала имена, начинающиеся с запроса, дальше - по числу подписчиков"""
+    return lambda user: (not user[1].lower().startswith(query), -user[2], user[0])
+
+
+class PrefixCache:
+    """
+    Результаты поиска в памяти процесса, LRU на max_entries запросов.
+    Запрос, которого нет в кэше, можно ответить без БД по полному
+    (complete) результату более короткого запроса того же вида: имена,
+    содержащие "alex", - подмножество имён, содержащих "ale". Поэтому
+    частые короткие префиксы автодополнения закрывают и все их продолжения
+    """
+
+    def __init__(
+        self,
+        max_entries: int = USER_SEARCH_CACHE_SIZE,
+        ttl: float = USER_SEARCH_CACHE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: OrderedDict[str, tuple[SearchResult, float]] = OrderedDict()
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def _get(self, query: str) -> Optional[SearchResult]:
+        entry = self.entries.get(query)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at <= self.clock():
+            del self.entries[query]
+            return None
+        self.entries.move_to_end(query)
+        return result
+
+    def lookup(self, query: str) -> Optional[SearchResult]:
+        result = self._get(query)
+        if result is not None:
+            USER_SEARCH_LOOKUPS.labels("cache").inc()
+            return result
+        # более короткие запросы того же вида, от длинного к короткому
+        shortest = SUBSTRING_MIN_LENGTH if len(query) >= SUBSTRING_MIN_LENGTH else 1
+        for length in range(len(query) - 1, shortest - 1, -1):
+            shorter = self._get(query[:length])
+            if shorter is not None and shorter.complete:
+                USER_SEARCH_LOOKUPS.labels("prefix").inc()
+                users = sorted(
+                    (user for user in shorter.users if matches(user[1], query)),
+                    key=rank_key(query),
+                )
+                result = SearchResult(users=tuple(users), complete=True)
+                self.store(query, result)
+                return result
+        return None
+
+    def store(self, query: str, result: SearchResult) -> None:
+        self.entries[query] = (result, self.clock() + self.ttl)
+        self.entries.move_to_end(query)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+user_search_cache = PrefixCache()
+
+
+def select_users_matching(query: str, limit: int):
+    """
+    Пользователи, чьё имя содержит query (или начинается с него для
+    запросов короче SUBSTRING_MIN_LENGTH). Подстроку ищет ILIKE по
+    GIN-индексу ix_users_name_trgm (pg_trgm); из одного-двух символов
+    триграммы не строятся, и такой ILIKE читал бы весь индекс, поэтому
+    префикс ищется как lower(name) LIKE 'ab%' по btree-индексу
+    ix_users_name_lower_pattern. query уже в нижнем регистре (normalize)
+    """
+    followers = func.coalesce(UserStats.followers_count, 0)
+    columns = (Users.id, Users.name, followers.label("followers_count"))
+    if len(query) < SUBSTRING_MIN_LENGTH:
+        # все найденные имена начинаются с запроса: порядок - по подписчикам
+        return (
+            select(*columns)
+            .outerjoin(UserStats, UserStats.user_id == Users.id)
+            .where(func.lower(Users.name).startswith(query, autoescape=True))
+            .order_by(followers.desc(), Users.id)
+            .limit(limit)
+        )
+    return (
+        select(*columns)
+        .outerjoin(UserStats, UserStats.user_id == Users.id)
+        .where(Users.name.icontains(query, autoescape=True))
+        .order_by(
+            Users.name.istartswith(query, autoescape=True).desc(),
+            followers.desc(),
+            Users.id,
+        )
+        .limit(limit)
+    )
+
+
+async def search_users(session: AsyncSession, query: str, limit: int) -> list[dict]:
+    """
+    Поиск по имени: из кэша префиксов, иначе одним запросом к БД. Из БД
+    всегда берётся USER_SEARCH_MAX_LIMIT + 1 строка, чтобы одна запись кэша
+    отвечала на любой limit и было видно, полный ли результат
+    """
+    query = normalize(query)
+    if not query:
+        return []
+    result = user_search_cache.lookup(query)
+    if result is None:
+        USER_SEARCH_LOOKUPS.labels("db").inc()
+        async with session.begin():
+            rows = (
+                await session.execute(
+                    select_users_matching(query, USER_SEARCH_MAX_LIMIT + 1)
+                )
+            ).all()
+        result = SearchResult(
+            users=tuple(
+                (row.id, row.name, row.followers_count)
+                for row in rows[:USER_SEARCH_MAX_LIMIT]
+            ),
+            complete=len(rows) <= USER_SEARCH_MAX_LIMIT,
+        )
+        user_search_cache.store(query, result)
+    return [
+        {"id": user_id, "name": name, "followers_count": followers_count}
+        for user_id, name, followers_count in result.users[:limit]
+    ]
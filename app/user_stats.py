@@ -0,0 +1,199 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import CTE, Integer, func, literal, select, tuple_, union_all, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.config import USER_STATS_BATCH_SIZE, USER_STATS_RECONCILE_INTERVAL
+from app.metrics import USER_STATS_CORRECTIONS
+from app.models import Follows, Tweets, Users, UserStats
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("followers_count", "following_count", "tweets_count")
+# счётчики, изменение которых меняет граф подписок
+GRAPH_COUNTERS = ("followers_count", "following_count")
+
+
+async def bump_counters(session: AsyncSession, deltas: dict[int, dict[str, int]]):
+    """
+    Меняет счётчики пользователей одним выражением в текущей транзакции:
+    deltas - {user_id: {"followers_count": 1, ...}}. Строки блокируются
+    по возрастанию user_id, поэтому встречные подписки не дают взаимной
+    блокировки. Недостающая строка создаётся (её исправит сверка).
+    Изменение подписок отмечается в graph_changed_at для пересчёта рекомендаций
+    """
+    graph_changed = any(
+        name in changes for changes in deltas.values() for name in GRAPH_COUNTERS
+    )
+    extra = {"graph_changed_at": func.now()} if graph_changed else {}
+    rows = [
+        {name: changes.get(name, 0) for name in COUNTERS} | {"user_id": user_id} | extra
+        for user_id, changes in sorted(deltas.items())
+    ]
+    stmt = insert(UserStats).values(rows)
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[UserStats.user_id],
+            set_={
+                name: getattr(UserStats, name) + getattr(stmt.excluded, name)
+                for name in COUNTERS
+            }
+            | extra,
+        )
+    )
+
+
+def follow_counters_cte(pairs: CTE, delta: int) -> CTE:
+    """
+    Изменение счётчиков для подписок из pairs (follower_id, followed_id) -
+    data-modifying CTE, который выполняется в том же выражении, что и
+    вставка или удаление подписок. Изменения одного пользователя
+    суммируются: ON CONFLICT не может обновить строку дважды
+    """
+    changes = union_all(
+        select(
+            pairs.c.follower_id.label("user_id"),
+            literal(0, Integer).label("followers_count"),
+            literal(delta, Integer).label("following_count"),
+        ),
+        select(
+            pairs.c.followed_id,
+            literal(delta, Integer),
+            literal(0, Integer),
+        ),
+    ).subquery("changes")
+    stmt = insert(UserStats).from_select(
+        [*COUNTERS, "user_id", "graph_changed_at"],
+        select(
+            func.sum(changes.c.followers_count),
+            func.sum(changes.c.following_count),
+            literal(0, Integer),
+            changes.c.user_id,
+            func.now(),
+        ).group_by(changes.c.user_id)
+        # строки блокируются по возрастанию user_id, как в bump_counters
+        .order_by(changes.c.user_id),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            name: getattr(UserStats, name) + getattr(stmt.excluded, name)
+            for name in GRAPH_COUNTERS
+        }
+        | {"graph_changed_at": stmt.excluded.graph_changed_at},
+    ).cte("counters")
+
+
+def actual_counts(user_ids):
+    """Счётчики, посчитанные по follows и tweets (по индексам на user_id)"""
+    user = Users.__table__.alias("u")
+    return select(
+        user.c.id.label("user_id"),
+        select(func.count())
+        .where(Follows.followed_id == user.c.id)
+        .scalar_subquery()
+        .label("followers_count"),
+        select(func.count())
+        .where(Follows.follower_id == user.c.id)
+        .scalar_subquery()
+        .label("following_count"),
+        select(func.count())
+        .where(Tweets.user_id == user.c.id)
+        .scalar_subquery()
+        .label("tweets_count"),
+    ).where(user.c.id.in_(user_ids))
+
+
+async def reconcile_batch(
+    engine: AsyncEngine, after: int, batch_size: int
+) -> tuple[Optional[int], list[int]]:
+    """
+    Сверяет счётчики пачки пользователей с id больше after. Возвращает id
+    последнего пользователя пачки (None - пользователей больше нет) и
+    пользователей, чьи счётчики пришлось исправить.
+
+    Строки счётчиков блокируются до подсчёта: изменение, зафиксированное
+    раньше, попадёт в подсчёт, а начатое позже дождётся записи сверки и
+    прибавится к исправленному значению
+    """
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            select(Users.id)
+            .where(Users.id > after)
+            .order_by(Users.id)
+            .limit(batch_size)
+        )
+        user_ids = result.scalars().all()
+        if not user_ids:
+            return None, []
+        await conn.execute(
+            insert(UserStats)
+            .values([{"user_id": user_id} for user_id in user_ids])
+            .on_conflict_do_nothing()
+        )
+        await conn.execute(
+            select(UserStats.user_id)
+            .where(UserStats.user_id.in_(user_ids))
+            .order_by(UserStats.user_id)
+            .with_for_update()
+        )
+        actual = actual_counts(user_ids).subquery()
+        result = await conn.execute(
+            update(UserStats)
+            .where(
+                UserStats.user_id == actual.c.user_id,
+                tuple_(
+                    *(getattr(UserStats, name) for name in COUNTERS)
+                ).is_distinct_from(tuple_(*(actual.c[name] for name in COUNTERS))),
+            )
+            .values({name: actual.c[name] for name in COUNTERS})
+            .returning(UserStats.user_id)
+        )
+        corrected = list(result.scalars())
+    if corrected:
+        USER_STATS_CORRECTIONS.inc(len(corrected))
+        logger.warning(f"user stats corrected for users {corrected}")
+    return user_ids[-1], corrected
+
+
+async def reconcile_user_stats(
+    engine: AsyncEngine,
+    batch_size: int = USER_STATS_BATCH_SIZE,
+    on_corrected: Optional[Callable[[list[int]], Awaitable[None]]] = None,
+) -> int:
+    """
+    Проходит всех пользователей пачками по batch_size (каждая - своя
+    короткая транзакция) и исправляет разошедшиеся счётчики.
+    Возвращает число исправленных пользователей
+    """
+    after, total = 0, 0
+    while True:
+        last, corrected = await reconcile_batch(engine, after, batch_size)
+        if last is None:
+            return total
+        after = last
+        total += len(corrected)
+        if corrected and on_corrected is not None:
+            await on_corrected(corrected)
+
+
+async def maintain_user_stats(
+    engine: AsyncEngine,
+    interval: int = USER_STATS_RECONCILE_INTERVAL,
+    on_corrected: Optional[Callable[[list[int]], Awaitable[None]]] = None,
+) -> None:
+    """
+    Фоновая задача: сразу после старта и затем каждые interval секунд
+    сверяет счётчики. Расхождения появляются при изменениях в обход API:
+    удалении пользователей, загрузке данных, ручных правках
+    """
+    while True:
+        try:
+            await reconcile_user_stats(engine, on_corrected=on_corrected)
+        except Exception:
+            logger.exception("Failed to reconcile user stats")
+        await asyncio.sleep(interval)
@@ -0,0 +1,39 @@
+import logging
+import os
+import shutil
+
+# Запуск: gunicorn app.main:app -c gunicorn.conf.py
+# Каждый воркер пишет метрики Prometheus в свои файлы в общей папке,
+# /metrics любого воркера суммирует значения по всем воркерам
+multiproc_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", "/tmp/twitter_clone_metrics"
+)
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Записи кэша сбрасываются только в хранилище своего процесса: с кэшем в
+# памяти воркеры отдавали бы устаревшие ленты и профили до истечения TTL,
+# поэтому без Redis запускается один воркер
+shared_cache = os.getenv("CACHE_BACKEND", "memory") == "redis"
+workers = int(os.getenv("WEB_CONCURRENCY", "4" if shared_cache else "1"))
+if workers > 1 and not shared_cache:
+    logging.getLogger("gunicorn.error").warning(
+        "WEB_CONCURRENCY=%d needs a shared cache (CACHE_BACKEND=redis), "
+        "starting 1 worker",
+        workers,
+    )
+    workers = 1
+
+
+def on_starting(server):
+    """Очищаем метрики прошлого запуска до старта воркеров"""
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Убираем из gauge-метрик значения завершившегося воркера"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
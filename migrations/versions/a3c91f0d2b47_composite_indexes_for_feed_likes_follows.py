@@ -0,0 +1,87 @@
+"""composite indexes for feed, likes and follows
+
+Revision ID: a3c91f0d2b47
+Revises: 866a33b83f02
+Create Date: 2026-10-19 16:20:41.318907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c91f0d2b47'
+down_revision: Union[str, Sequence[str], None] = '866a33b83f02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции,
+    # зато он не блокирует запись в большие таблицы на время построения
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_tweets_user_id_created_at',
+            'tweets',
+            ['user_id', sa.text('created_at DESC')],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_likes_tweet_id_user_id',
+            'likes',
+            ['tweet_id', 'user_id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_follows_followed_id_follower_id',
+            'follows',
+            ['followed_id', 'follower_id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_medias_tweet_id',
+            'medias',
+            ['tweet_id'],
+            unique=False,
+            postgresql_include=['id', 'path_url'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_medias_tweet_id',
+            table_name='medias',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            'ix_follows_followed_id_follower_id',
+            table_name='follows',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            'ix_likes_tweet_id_user_id',
+            table_name='likes',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            'ix_tweets_user_id_created_at',
+            table_name='tweets',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
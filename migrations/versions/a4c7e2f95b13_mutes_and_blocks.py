@@ -0,0 +1,55 @@
+"""mutes and blocks
+
+Revision ID: a4c7e2f95b13
+Revises: f1a8d3e6b7c4
+Create Date: 2026-10-19 21:02:14.268391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c7e2f95b13'
+down_revision: Union[str, Sequence[str], None] = 'f1a8d3e6b7c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'mutes',
+        sa.Column('muter_id', sa.Integer(), nullable=False),
+        sa.Column('muted_id', sa.Integer(), nullable=False),
+        sa.CheckConstraint('muter_id <> muted_id', name='ck_mutes_not_self'),
+        sa.ForeignKeyConstraint(['muter_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['muted_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('muter_id', 'muted_id'),
+    )
+    op.create_index('ix_mutes_muted_id', 'mutes', ['muted_id'], unique=False)
+    op.create_table(
+        'blocks',
+        sa.Column('blocker_id', sa.Integer(), nullable=False),
+        sa.Column('blocked_id', sa.Integer(), nullable=False),
+        sa.CheckConstraint('blocker_id <> blocked_id', name='ck_blocks_not_self'),
+        sa.ForeignKeyConstraint(['blocker_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['blocked_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('blocker_id', 'blocked_id'),
+    )
+    op.create_index(
+        'ix_blocks_blocked_id_blocker_id',
+        'blocks',
+        ['blocked_id', 'blocker_id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_blocks_blocked_id_blocker_id', table_name='blocks')
+    op.drop_table('blocks')
+    op.drop_index('ix_mutes_muted_id', table_name='mutes')
+    op.drop_table('mutes')
@@ -0,0 +1,46 @@
+"""notify follows changes
+
+Revision ID: b5e8c3f1d920
+Revises: d4f7b2a81c36
+Create Date: 2026-10-19 12:41:08.527319
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e8c3f1d920'
+down_revision: Union[str, Sequence[str], None] = 'd4f7b2a81c36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # индекс подписок каждого процесса узнаёт об изменениях из других
+    # процессов: NOTIFY доставляется после коммита, одинаковые уведомления
+    # одной транзакции (массовая подписка) склеиваются
+    op.execute(
+        'CREATE OR REPLACE FUNCTION follows_notify() RETURNS trigger AS $$\n'
+        'DECLARE\n'
+        '    row follows%ROWTYPE;\n'
+        'BEGIN\n'
+        "    IF TG_OP = 'DELETE' THEN row := OLD; ELSE row := NEW; END IF;\n"
+        "    PERFORM pg_notify('follows_changed', row.follower_id::text);\n"
+        '    RETURN NULL;\n'
+        'END;\n'
+        '$$ LANGUAGE plpgsql'
+    )
+    op.execute(
+        'CREATE TRIGGER follows_notify AFTER INSERT OR DELETE ON follows '
+        'FOR EACH ROW EXECUTE FUNCTION follows_notify()'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER IF EXISTS follows_notify ON follows')
+    op.execute('DROP FUNCTION IF EXISTS follows_notify()')
@@ -0,0 +1,45 @@
+"""users name trigram index
+
+Revision ID: b8d1f4a06c29
+Revises: a4c7e2f95b13
+Create Date: 2026-10-19 21:47:05.913527
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d1f4a06c29'
+down_revision: Union[str, Sequence[str], None] = 'a4c7e2f95b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # индекс не описан в модели: create_all выполняется и без pg_trgm,
+    # поиск тогда работает полным просмотром users
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CONCURRENTLY не блокирует запись в users на время построения,
+    # но не может выполняться внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_name_trgm',
+            'users',
+            ['name'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_users_name_trgm', table_name='users', postgresql_concurrently=True
+        )
@@ -0,0 +1,59 @@
+"""tweets full text search
+
+Revision ID: c2e6a9d47f85
+Revises: b8d1f4a06c29
+Create Date: 2026-10-19 22:31:48.504176
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2e6a9d47f85'
+down_revision: Union[str, Sequence[str], None] = 'b8d1f4a06c29'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # сохраняемый вычисляемый столбец переписывает все партиции tweets
+    # под блокировкой - миграцию нужно выполнять в окно обслуживания
+    op.add_column(
+        'tweets',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "to_tsvector('russian', content) || to_tsvector('english', content)",
+                persisted=True,
+            ),
+            nullable=True,
+        ),
+    )
+    # индекс на партиционированной таблице создаётся и на всех партициях
+    op.create_index(
+        'ix_tweets_search_vector',
+        'tweets',
+        ['search_vector'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_with={'fastupdate': 'off'},
+    )
+    op.create_index(
+        'ix_tweets_created_at',
+        'tweets',
+        [sa.text('created_at DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tweets_created_at', table_name='tweets')
+    op.drop_index('ix_tweets_search_vector', table_name='tweets')
+    op.drop_column('tweets', 'search_vector')
@@ -0,0 +1,168 @@
+"""partition tweets by created_at and likes by tweet_id
+
+Revision ID: c5d2e8a41f6b
+Revises: a3c91f0d2b47
+Create Date: 2026-10-19 17:02:13.584120
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d2e8a41f6b'
+down_revision: Union[str, Sequence[str], None] = 'a3c91f0d2b47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LIKES_PARTITIONS = 16
+MONTHS_AHEAD = 3
+
+
+def _add_months(moment: datetime, months: int) -> datetime:
+    index = moment.year * 12 + moment.month - 1 + months
+    return moment.replace(year=index // 12, month=index % 12 + 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # внешние ключи на tweets.id невозможны: уникальный ключ
+    # партиционированной таблицы обязан включать ключ партиционирования
+    op.drop_constraint('likes_tweet_id_fkey', 'likes', type_='foreignkey')
+    op.drop_constraint('medias_tweet_id_fkey', 'medias', type_='foreignkey')
+
+    # старые таблицы переименовываем, данные перенесём в партиционированные
+    op.rename_table('tweets', 'tweets_legacy')
+    op.execute('ALTER TABLE tweets_legacy RENAME CONSTRAINT tweets_pkey TO tweets_legacy_pkey')
+    op.execute('ALTER INDEX IF EXISTS ix_tweets_user_id_created_at RENAME TO ix_tweets_legacy_user_id_created_at')
+    op.rename_table('likes', 'likes_legacy')
+    op.execute('ALTER TABLE likes_legacy RENAME CONSTRAINT likes_pkey TO likes_legacy_pkey')
+    op.execute('ALTER INDEX IF EXISTS ix_likes_tweet_id_user_id RENAME TO ix_likes_legacy_tweet_id_user_id')
+
+    op.execute(
+        """
+        CREATE TABLE tweets (
+            id INTEGER NOT NULL DEFAULT nextval('tweets_id_seq'::regclass),
+            user_id INTEGER REFERENCES users (id) ON DELETE CASCADE,
+            content VARCHAR(280) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            CONSTRAINT tweets_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute('ALTER SEQUENCE tweets_id_seq OWNED BY tweets.id')
+    op.create_index('ix_tweets_user_id_created_at', 'tweets', ['user_id', sa.text('created_at DESC')])
+
+    # месячные партиции от самого старого твита до нескольких месяцев вперёд
+    oldest = bind.execute(sa.text('SELECT min(created_at) FROM tweets_legacy')).scalar()
+    now = datetime.now(timezone.utc)
+    current = (oldest or now).astimezone(timezone.utc)
+    current = datetime(current.year, current.month, 1, tzinfo=timezone.utc)
+    last = _add_months(datetime(now.year, now.month, 1, tzinfo=timezone.utc), MONTHS_AHEAD)
+    while current <= last:
+        end = _add_months(current, 1)
+        op.execute(
+            f"CREATE TABLE tweets_y{current.year:04d}m{current.month:02d} "
+            f"PARTITION OF tweets FOR VALUES "
+            f"FROM ('{current.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        current = end
+    op.execute('CREATE TABLE tweets_default PARTITION OF tweets DEFAULT')
+    op.execute(
+        'INSERT INTO tweets (id, user_id, content, created_at) '
+        'SELECT id, user_id, content, created_at FROM tweets_legacy'
+    )
+
+    op.execute(
+        """
+        CREATE TABLE likes (
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            tweet_id INTEGER NOT NULL,
+            CONSTRAINT likes_pkey PRIMARY KEY (user_id, tweet_id)
+        ) PARTITION BY HASH (tweet_id)
+        """
+    )
+    op.create_index('ix_likes_tweet_id_user_id', 'likes', ['tweet_id', 'user_id'])
+    for remainder in range(LIKES_PARTITIONS):
+        op.execute(
+            f'CREATE TABLE likes_p{remainder} PARTITION OF likes '
+            f'FOR VALUES WITH (MODULUS {LIKES_PARTITIONS}, REMAINDER {remainder})'
+        )
+    op.execute('INSERT INTO likes (user_id, tweet_id) SELECT user_id, tweet_id FROM likes_legacy')
+
+    # каскадное удаление лайков и медиа вместо внешних ключей
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION tweets_cascade_delete() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM likes WHERE tweet_id = OLD.id;
+            DELETE FROM medias WHERE tweet_id = OLD.id;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        'CREATE TRIGGER tweets_cascade_delete AFTER DELETE ON tweets '
+        'FOR EACH ROW EXECUTE FUNCTION tweets_cascade_delete()'
+    )
+
+    op.drop_table('likes_legacy')
+    op.drop_table('tweets_legacy')
+    op.execute('ANALYZE tweets')
+    op.execute('ANALYZE likes')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER IF EXISTS tweets_cascade_delete ON tweets')
+    op.execute('DROP FUNCTION IF EXISTS tweets_cascade_delete()')
+
+    op.rename_table('tweets', 'tweets_partitioned')
+    op.execute('ALTER TABLE tweets_partitioned RENAME CONSTRAINT tweets_pkey TO tweets_partitioned_pkey')
+    op.execute('ALTER INDEX ix_tweets_user_id_created_at RENAME TO ix_tweets_partitioned_user_id_created_at')
+    op.rename_table('likes', 'likes_partitioned')
+    op.execute('ALTER TABLE likes_partitioned RENAME CONSTRAINT likes_pkey TO likes_partitioned_pkey')
+    op.execute('ALTER INDEX ix_likes_tweet_id_user_id RENAME TO ix_likes_partitioned_tweet_id_user_id')
+
+    op.execute(
+        """
+        CREATE TABLE tweets (
+            id INTEGER NOT NULL DEFAULT nextval('tweets_id_seq'::regclass),
+            user_id INTEGER REFERENCES users (id) ON DELETE CASCADE,
+            content VARCHAR(280) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            CONSTRAINT tweets_pkey PRIMARY KEY (id)
+        )
+        """
+    )
+    op.execute('ALTER SEQUENCE tweets_id_seq OWNED BY tweets.id')
+    op.execute(
+        'INSERT INTO tweets (id, user_id, content, created_at) '
+        'SELECT id, user_id, content, created_at FROM tweets_partitioned'
+    )
+    op.create_index('ix_tweets_user_id_created_at', 'tweets', ['user_id', sa.text('created_at DESC')])
+
+    op.execute(
+        """
+        CREATE TABLE likes (
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            tweet_id INTEGER NOT NULL REFERENCES tweets (id) ON DELETE CASCADE,
+            CONSTRAINT likes_pkey PRIMARY KEY (user_id, tweet_id)
+        )
+        """
+    )
+    op.execute('INSERT INTO likes (user_id, tweet_id) SELECT user_id, tweet_id FROM likes_partitioned')
+    op.create_index('ix_likes_tweet_id_user_id', 'likes', ['tweet_id', 'user_id'])
+
+    op.drop_table('likes_partitioned')
+    op.drop_table('tweets_partitioned')
+    # медиа без твита не восстанавливаются внешним ключом, удаляем их связь
+    op.execute('UPDATE medias SET tweet_id = NULL WHERE tweet_id NOT IN (SELECT id FROM tweets)')
+    op.create_foreign_key(
+        'medias_tweet_id_fkey', 'medias', 'tweets', ['tweet_id'], ['id'], ondelete='CASCADE'
+    )
@@ -0,0 +1,83 @@
+"""hashtags, mentions and trends
+
+Revision ID: d4f7b2a81c36
+Revises: c2e6a9d47f85
+Create Date: 2026-10-20 00:14:37.912604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f7b2a81c36'
+down_revision: Union[str, Sequence[str], None] = 'c2e6a9d47f85'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def cascade_function(tables: list[str]) -> str:
+    deletes = ''.join(
+        f'DELETE FROM {table} WHERE tweet_id = OLD.id;\n' for table in tables
+    )
+    return (
+        'CREATE OR REPLACE FUNCTION tweets_cascade_delete() RETURNS trigger AS $$\n'
+        f'BEGIN\n{deletes}RETURN OLD;\nEND;\n$$ LANGUAGE plpgsql'
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'tweet_hashtags',
+        sa.Column('tweet_id', sa.Integer(), nullable=False),
+        sa.Column('tag', sa.String(length=100), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('tweet_id', 'tag'),
+    )
+    op.create_index(
+        'ix_tweet_hashtags_tag_created_at',
+        'tweet_hashtags',
+        ['tag', sa.text('created_at DESC')],
+        unique=False,
+    )
+    op.create_table(
+        'tweet_mentions',
+        sa.Column('tweet_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('tweet_id', 'user_id'),
+    )
+    op.create_index(
+        'ix_tweet_mentions_user_id_tweet_id',
+        'tweet_mentions',
+        ['user_id', sa.text('tweet_id DESC')],
+        unique=False,
+    )
+    op.create_table(
+        'trend_buckets',
+        sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('tag', sa.String(length=100), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('bucket_start', 'tag'),
+    )
+    op.create_index(
+        'ix_users_name_lower', 'users', [sa.text('lower(name)')], unique=False
+    )
+    # каскадное удаление хештегов и упоминаний вместе с твитом
+    op.execute(
+        cascade_function(['likes', 'medias', 'tweet_hashtags', 'tweet_mentions'])
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(cascade_function(['likes', 'medias']))
+    op.drop_index('ix_users_name_lower', table_name='users')
+    op.drop_table('trend_buckets')
+    op.drop_index('ix_tweet_mentions_user_id_tweet_id', table_name='tweet_mentions')
+    op.drop_table('tweet_mentions')
+    op.drop_index('ix_tweet_hashtags_tag_created_at', table_name='tweet_hashtags')
+    op.drop_table('tweet_hashtags')
@@ -0,0 +1,47 @@
+"""user_stats counters
+
+Revision ID: d7a4f1c93e28
+Revises: c5d2e8a41f6b
+Create Date: 2026-10-19 18:41:07.220315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a4f1c93e28'
+down_revision: Union[str, Sequence[str], None] = 'c5d2e8a41f6b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'user_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('following_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('tweets_count', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    # начальные значения; изменения во время миграции исправит фоновая сверка
+    op.execute(
+        """
+        INSERT INTO user_stats (user_id, followers_count, following_count, tweets_count)
+        SELECT u.id,
+               (SELECT count(*) FROM follows f WHERE f.followed_id = u.id),
+               (SELECT count(*) FROM follows f WHERE f.follower_id = u.id),
+               (SELECT count(*) FROM tweets t WHERE t.user_id = u.id)
+        FROM users u
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_stats')
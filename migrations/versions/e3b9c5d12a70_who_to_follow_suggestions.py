@@ -0,0 +1,53 @@
+"""who to follow suggestions
+
+Revision ID: e3b9c5d12a70
+Revises: d7a4f1c93e28
+Create Date: 2026-10-19 19:26:52.804113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b9c5d12a70'
+down_revision: Union[str, Sequence[str], None] = 'd7a4f1c93e28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'user_stats',
+        sa.Column('graph_changed_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.add_column(
+        'user_stats',
+        sa.Column('suggestions_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_table(
+        'suggestions',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.SmallInteger(), nullable=False),
+        sa.Column('suggested_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('mutual_count', sa.Integer(), nullable=False),
+        sa.Column('follows_you', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['suggested_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'rank'),
+    )
+    op.create_index(
+        'ix_suggestions_suggested_id', 'suggestions', ['suggested_id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_suggestions_suggested_id', table_name='suggestions')
+    op.drop_table('suggestions')
+    op.drop_column('user_stats', 'suggestions_at')
+    op.drop_column('user_stats', 'graph_changed_at')
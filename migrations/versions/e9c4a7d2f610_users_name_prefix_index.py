@@ -0,0 +1,49 @@
+"""users name prefix index
+
+Revision ID: e9c4a7d2f610
+Revises: b5e8c3f1d920
+Create Date: 2026-10-19 15:22:41.306818
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9c4a7d2f610'
+down_revision: Union[str, Sequence[str], None] = 'b5e8c3f1d920'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # text_pattern_ops обслуживает и равенство (упоминания), и LIKE 'ab%'
+    # (поиск коротких префиксов), поэтому заменяет ix_users_name_lower
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY ix_users_name_lower_pattern '
+            'ON users (lower(name) text_pattern_ops)'
+        )
+        op.drop_index(
+            'ix_users_name_lower', table_name='users', postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_name_lower',
+            'users',
+            [sa.text('lower(name)')],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_users_name_lower_pattern',
+            table_name='users',
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,38 @@
+"""forbid self follow
+
+Revision ID: f1a8d3e6b7c4
+Revises: e3b9c5d12a70
+Create Date: 2026-10-19 20:08:33.517962
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1a8d3e6b7c4'
+down_revision: Union[str, Sequence[str], None] = 'e3b9c5d12a70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # подписки на себя раньше не запрещались; счётчики поправит сверка
+    op.execute("DELETE FROM follows WHERE follower_id = followed_id")
+    # NOT VALID не проверяет всю таблицу под блокировкой записи,
+    # проверка идёт отдельно и не мешает вставкам
+    op.create_check_constraint(
+        'ck_follows_not_self',
+        'follows',
+        'follower_id <> followed_id',
+        postgresql_not_valid=True,
+    )
+    op.execute("ALTER TABLE follows VALIDATE CONSTRAINT ck_follows_not_self")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('ck_follows_not_self', 'follows', type_='check')
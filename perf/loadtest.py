@@ -0,0 +1,387 @@
+"""
+Нагрузочный тест API с отчётом о задержках по каждому маршруту.
+
+Запускает заданное число конкурентных клиентов, каждый из которых выбирает
+сценарий по весам смеси (например 80% чтения ленты, 10% лайков, 5% твитов,
+5% подписок) и обращается к API от имени случайного пользователя из набора
+данных, созданного perf.datagen. По итогам считается пропускная способность
+и p50/p95/p99 по маршрутам, результат сохраняется в JSON и может сравниваться
+с предыдущим прогоном: при регрессии сверх порога процесс завершается с кодом 1.
+
+Пример запуска:
+    python -m perf.loadtest --manifest dataset.json --start-app \\
+        --mix feed=80,like=10,tweet=5,follow=5 --duration 60 \\
+        --output run.json --baseline previous_run.json
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import math
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable
+
+import httpx
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIX = "feed=80,like=10,tweet=5,follow=5"
+
+
+@dataclasses.dataclass(frozen=True)
+class Dataset:
+    """Диапазоны id набора данных, по которым выбираются пользователи и твиты"""
+
+    first_user: int
+    last_user: int
+    first_tweet: int
+    last_tweet: int
+    api_key_template: str
+
+    @classmethod
+    def from_manifest(cls, manifest: dict) -> "Dataset":
+        return cls(
+            first_user=manifest["users"]["first_id"],
+            last_user=manifest["users"]["last_id"],
+            first_tweet=manifest["tweets"]["first_id"],
+            last_tweet=manifest["tweets"]["last_id"],
+            api_key_template=manifest["api_key_template"],
+        )
+
+    def user(self, rnd: random.Random) -> int:
+        return rnd.randint(self.first_user, self.last_user)
+
+    def tweet(self, rnd: random.Random) -> int:
+        return rnd.randint(self.first_tweet, self.last_tweet)
+
+    def headers(self, user_id: int) -> dict[str, str]:
+        return {"api-key": self.api_key_template.format(id=user_id)}
+
+
+# Сценарий выполняет один запрос и возвращает метку маршрута и ответ
+Scenario = Callable[
+    [httpx.AsyncClient, Dataset, random.Random],
+    Awaitable[tuple[str, httpx.Response]],
+]
+
+
+async def scenario_feed(client, dataset, rnd):
+    resp = await client.get("/api/tweets", headers=dataset.headers(dataset.user(rnd)))
+    return "GET /api/tweets", resp
+
+
+async def scenario_me(client, dataset, rnd):
+    resp = await client.get("/api/users/me", headers=dataset.headers(dataset.user(rnd)))
+    return "GET /api/users/me", resp
+
+
+async def scenario_profile(client, dataset, rnd):
+    resp = await client.get(
+        f"/api/users/{dataset.user(rnd)}", headers=dataset.headers(dataset.user(rnd))
+    )
+    return "GET /api/users/{user_id}", resp
+
+
+async def scenario_like(client, dataset, rnd):
+    resp = await client.post(
+        f"/api/tweets/{dataset.tweet(rnd)}/likes",
+        headers=dataset.headers(dataset.user(rnd)),
+    )
+    return "POST /api/tweets/{tweet_id}/likes", resp
+
+
+async def scenario_unlike(client, dataset, rnd):
+    resp = await client.delete(
+        f"/api/tweets/{dataset.tweet(rnd)}/likes",
+        headers=dataset.headers(dataset.user(rnd)),
+    )
+    return "DELETE /api/tweets/{tweet_id}/likes", resp
+
+
+async def scenario_tweet(client, dataset, rnd):
+    resp = await client.post(
+        "/api/tweets",
+        headers=dataset.headers(dataset.user(rnd)),
+        json={"tweet_data": f"load test {rnd.random()}", "tweet_media_ids": []},
+    )
+    return "POST /api/tweets", resp
+
+
+async def scenario_follow(client, dataset, rnd):
+    resp = await client.post(
+        f"/api/users/{dataset.user(rnd)}/follow",
+        headers=dataset.headers(dataset.user(rnd)),
+    )
+    return "POST /api/users/{user_id}/follow", resp
+
+
+async def scenario_unfollow(client, dataset, rnd):
+    resp = await client.delete(
+        f"/api/users/{dataset.user(rnd)}/follow",
+        headers=dataset.headers(dataset.user(rnd)),
+    )
+    return "DELETE /api/users/{user_id}/follow", resp
+
+
+SCENARIOS: dict[str, Scenario] = {
+    "feed": scenario_feed,
+    "me": scenario_me,
+    "profile": scenario_profile,
+    "like": scenario_like,
+    "unlike": scenario_unlike,
+    "tweet": scenario_tweet,
+    "follow": scenario_follow,
+    "unfollow": scenario_unfollow,
+}
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """Разбирает смесь сценариев вида "feed=80,like=10" в словарь весов"""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}, known: {sorted(SCENARIOS)}")
+        weights[name] = float(weight)
+    return weights
+
+
+def percentile(sorted_values: list[float], share: float) -> float:
+    """Перцентиль по методу ближайшего ранга, значения отсортированы"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(share * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+@dataclasses.dataclass
+class RouteStats:
+    """Накопленные результаты по одному маршруту"""
+
+    latencies: list[float] = dataclasses.field(default_factory=list)
+    statuses: dict[str, int] = dataclasses.field(
+        default_factory=lambda: defaultdict(int)
+    )
+    errors: int = 0
+
+    def summary(self, elapsed: float) -> dict:
+        values = sorted(self.latencies)
+        return {
+            "requests": len(values),
+            "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+            "errors": self.errors,
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    dataset: Dataset,
+    mix: dict[str, float],
+    duration: float,
+    concurrency: int,
+    seed: int,
+) -> dict:
+    """
+    Гоняет смесь сценариев duration секунд в concurrency параллельных клиентах.
+    Ошибкой считаются ответы 5xx и сетевые исключения
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    stats: dict[str, RouteStats] = defaultdict(RouteStats)
+    deadline = time.perf_counter() + duration
+
+    async def worker(index: int) -> None:
+        rnd = random.Random(f"{seed}:{index}")
+        while time.perf_counter() < deadline:
+            scenario = SCENARIOS[rnd.choices(names, weights=weights)[0]]
+            started = time.perf_counter()
+            try:
+                route, resp = await scenario(client, dataset, rnd)
+            except httpx.HTTPError as exc:
+                logger.warning(f"{scenario.__name__} failed: {exc!r}")
+                stats[scenario.__name__].errors += 1
+                continue
+            route_stats = stats[route]
+            route_stats.latencies.append(time.perf_counter() - started)
+            route_stats.statuses[str(resp.status_code)] += 1
+            if resp.status_code >= 500:
+                route_stats.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    total = RouteStats()
+    for route_stats in stats.values():
+        total.latencies.extend(route_stats.latencies)
+        total.errors += route_stats.errors
+        for status, count in route_stats.statuses.items():
+            total.statuses[status] += count
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "duration_s": round(elapsed, 2),
+        "concurrency": concurrency,
+        "mix": mix,
+        "seed": seed,
+        "total": total.summary(elapsed),
+        "routes": {
+            route: route_stats.summary(elapsed)
+            for route, route_stats in sorted(stats.items())
+        },
+    }
+
+
+def compare_with_baseline(
+    result: dict, baseline: dict, max_regression: float
+) -> list[str]:
+    """
+    Сравнивает прогон с базовым: p95/p99 маршрута не должны вырасти,
+    а пропускная способность упасть больше чем на max_regression (доля)
+    """
+    problems = []
+    for route, current in result["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous:
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            if previous[metric] and current[metric] > previous[metric] * (
+                1 + max_regression
+            ):
+                problems.append(
+                    f"{route}: {metric} {previous[metric]} -> {current[metric]}"
+                )
+        if current["throughput_rps"] < previous["throughput_rps"] * (
+            1 - max_regression
+        ):
+            problems.append(
+                f"{route}: throughput_rps {previous['throughput_rps']} -> "
+                f"{current['throughput_rps']}"
+            )
+    if result["total"]["errors"] > baseline.get("total", {}).get("errors", 0):
+        problems.append(
+            f"errors {baseline.get('total', {}).get('errors', 0)} -> "
+            f"{result['total']['errors']}"
+        )
+    return problems
+
+
+def format_report(result: dict) -> str:
+    """Табличный отчёт для вывода в консоль"""
+    header = (
+        f"{'route':<40}{'req':>8}{'rps':>10}{'p50':>10}{'p95':>10}"
+        f"{'p99':>10}{'err':>6}"
+    )
+    lines = [header, "-" * len(header)]
+    rows = list(result["routes"].items()) + [("TOTAL", result["total"])]
+    for route, summary in rows:
+        lines.append(
+            f"{route:<40}{summary['requests']:>8}{summary['throughput_rps']:>10}"
+            f"{summary['p50_ms']:>10}{summary['p95_ms']:>10}"
+            f"{summary['p99_ms']:>10}{summary['errors']:>6}"
+        )
+    return "\n".join(lines)
+
+
+async def wait_until_ready(base_url: str, timeout: float) -> None:
+    """Ждёт, пока запущенное приложение начнёт отвечать"""
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while True:
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"App at {base_url} did not start in {timeout}s")
+            await asyncio.sleep(0.5)
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    with open(args.manifest) as file:
+        dataset = Dataset.from_manifest(json.load(file))
+    mix = parse_mix(args.mix)
+
+    app_process = None
+    if args.start_app:
+        host, _, port = args.base_url.split("://")[-1].partition(":")
+        app_process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--host", host, "--port", port or "8000",
+                "--workers", str(args.app_workers), "--log-level", "warning",
+            ]
+        )  # fmt: skip
+    try:
+        await wait_until_ready(args.base_url, args.startup_timeout)
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(
+            base_url=args.base_url, limits=limits, timeout=args.timeout
+        ) as client:
+            result = await run_load(
+                client, dataset, mix, args.duration, args.concurrency, args.seed
+            )
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait()
+
+    print(format_report(result))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            problems = compare_with_baseline(
+                result, json.load(file), args.max_regression
+            )
+        if problems:
+            print("Regressions against baseline:\n" + "\n".join(problems))
+            return 1
+    return 0
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--manifest", required=True, help="манифест perf.datagen")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="веса сценариев")
+    parser.add_argument("--duration", type=float, default=30.0, help="секунды")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="куда сохранить результаты (JSON)")
+    parser.add_argument("--baseline", help="результаты прошлого прогона (JSON)")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="допустимое ухудшение p95/p99 и пропускной способности (доля)",
+    )
+    parser.add_argument(
+        "--start-app", action="store_true", help="запустить приложение через uvicorn"
+    )
+    parser.add_argument("--app-workers", type=int, default=1)
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    sys.exit(asyncio.run(main_async(parse_args(argv))))
+
+
+if __name__ == "__main__":
+    main()
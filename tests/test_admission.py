@@ -0,0 +1,170 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+from app import admission
+from app.admission import (
+    PRIORITY_FEED,
+    PRIORITY_READ,
+    PRIORITY_WRITE,
+    AdmissionController,
+    request_priority,
+)
+from app.metrics import pool_wait
+
+FEED = "GET /api/tweets"
+READ = "GET /api/users/{user_id}"
+WRITE = "POST /api/tweets/{tweet_id}/likes"
+
+
+def controller(**kwargs) -> AdmissionController:
+    options: dict[str, Any] = {
+        "concurrency": 1,
+        "min_concurrency": 1,
+        "queue_size": 10,
+        "queue_timeout": 1,
+        "target_pool_wait": 0.05,
+        "route_limits": {},
+    }
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+@pytest.fixture(autouse=True)
+def idle_pool(monkeypatch):
+    """Пул без ожидания, чтобы лимит не зависел от предыдущих тестов"""
+    monkeypatch.setattr(pool_wait, "value", 0.0)
+
+
+@pytest.mark.admission
+def test_request_priority():
+    assert request_priority(WRITE, authenticated=True) == PRIORITY_WRITE
+    assert request_priority(READ, authenticated=True) == PRIORITY_READ
+    assert request_priority(FEED, authenticated=True) == PRIORITY_FEED
+    assert request_priority(WRITE, authenticated=False) > PRIORITY_FEED
+
+
+@pytest.mark.admission
+@pytest.mark.asyncio
+async def test_queued_requests_admitted_by_priority():
+    """Освободившийся слот получает запись, потом чтение, потом лента"""
+    limiter = controller()
+    assert await limiter.acquire(READ, PRIORITY_READ)
+
+    order = []
+
+    async def request(route, priority):
+        assert await limiter.acquire(route, priority)
+        order.append(route)
+        limiter.release(route)
+
+    tasks = [
+        asyncio.create_task(request(FEED, PRIORITY_FEED)),
+        asyncio.create_task(request(READ, PRIORITY_READ)),
+        asyncio.create_task(request(WRITE, PRIORITY_WRITE)),
+    ]
+    await asyncio.sleep(0)
+    assert limiter.state()["queued"] == 3
+    limiter.release(READ)
+    await asyncio.gather(*tasks)
+    assert order == [WRITE, READ, FEED]
+    assert limiter.state() == {
+        "limit": 1,
+        "active": 0,
+        "queued": 0,
+        "active_by_route": {},
+    }
+
+
+@pytest.mark.admission
+@pytest.mark.asyncio
+async def test_full_queue_rejects_or_evicts_lower_priority():
+    """
+    При полной очереди запрос того же или более низкого приоритета сразу
+    получает отказ, а более приоритетный вытесняет ленту
+    """
+    limiter = controller(queue_size=1)
+    assert await limiter.acquire(READ, PRIORITY_READ)
+    feed = asyncio.create_task(limiter.acquire(FEED, PRIORITY_FEED))
+    await asyncio.sleep(0)
+
+    assert await limiter.acquire(FEED, PRIORITY_FEED) is False
+    write = asyncio.create_task(limiter.acquire(WRITE, PRIORITY_WRITE))
+    assert await feed is False
+
+    limiter.release(READ)
+    assert await write is True
+    limiter.release(WRITE)
+
+
+@pytest.mark.admission
+@pytest.mark.asyncio
+async def test_route_limit_does_not_block_other_routes():
+    """Лента упирается в свой лимит, а другие маршруты проходят"""
+    limiter = controller(concurrency=5, route_limits={FEED: 1})
+    assert await limiter.acquire(FEED, PRIORITY_FEED)
+    second_feed = asyncio.create_task(limiter.acquire(FEED, PRIORITY_FEED))
+    await asyncio.sleep(0)
+
+    assert await asyncio.wait_for(limiter.acquire(READ, PRIORITY_READ), 0.1)
+    assert not second_feed.done()
+    limiter.release(FEED)
+    assert await second_feed
+    limiter.release(FEED)
+    limiter.release(READ)
+
+
+@pytest.mark.admission
+@pytest.mark.asyncio
+async def test_queue_timeout_and_cancellation_free_the_queue():
+    limiter = controller(queue_timeout=0.05)
+    assert await limiter.acquire(READ, PRIORITY_READ)
+    assert await limiter.acquire(READ, PRIORITY_READ) is False
+
+    waiting = asyncio.create_task(limiter.acquire(READ, PRIORITY_READ))
+    await asyncio.sleep(0)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    assert limiter.state()["queued"] == 0
+    limiter.release(READ)
+    assert limiter.state()["active"] == 0
+
+
+@pytest.mark.admission
+def test_limit_shrinks_with_pool_wait(monkeypatch):
+    """Лимит уменьшается пропорционально превышению целевого ожидания пула"""
+    limiter = controller(concurrency=30, min_concurrency=4)
+    assert limiter.limit() == 30
+    monkeypatch.setattr(pool_wait, "value", 0.1)
+    assert limiter.limit() == 15
+    monkeypatch.setattr(pool_wait, "value", 10.0)
+    assert limiter.limit() == 4
+
+
+@pytest.mark.admission
+@pytest.mark.asyncio
+async def test_overloaded_api_returns_503(async_client, monkeypatch):
+    """Перегруженный API быстро отвечает 503 с Retry-After, админка доступна"""
+    limiter = controller(queue_size=0)
+    monkeypatch.setattr(admission, "admission_controller", limiter)
+    assert await limiter.acquire(READ, PRIORITY_READ)
+
+    resp = await async_client.get("/api/tweets", headers={"api-key": "test"})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+    assert resp.json() == {
+        "result": False,
+        "error_type": "ServiceUnavailable",
+        "error_message": "Server is overloaded, retry later",
+    }
+    assert "X-DB-Query-Count" not in resp.headers
+
+    resp = await async_client.get("/api/admin/traces", headers={"api-key": "key2"})
+    assert resp.status_code == 403
+
+    limiter.release(READ)
+    resp = await async_client.get("/api/tweets", headers={"api-key": "test"})
+    assert resp.status_code == 200
+    assert limiter.state()["active"] == 0
@@ -1,6 +1,9 @@
+import asyncio
+
 import pytest
+from sqlalchemy import select
 
-from app.models import Follows, Users
+from app.models import Follows, Users, UserStats
 
 
 @pytest.mark.user_delete_follow
@@ -85,3 +88,46 @@ async def test_negative_api_user_user_id(async_client, api_key, status_code):
     )
 
     assert resp.status_code == status_code
+
+
+@pytest.mark.user_delete_follow
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_unfollows(
+    async_client, test_session, session_per_request
+):
+    """
+    Из одновременных одинаковых отписок проходит ровно одна, остальные
+    получают 404; счётчики уменьшаются один раз
+    """
+    follower = Users(name="follower", api_key="concurrent_unfollower")
+    followed = Users(name="followed", api_key="concurrent_unfollowed")
+    test_session.add_all([follower, followed])
+    await test_session.commit()
+    try:
+        resp = await async_client.post(
+            f"/api/users/{followed.id}/follow", headers={"api-key": follower.api_key}
+        )
+        assert resp.status_code == 200
+
+        responses = await asyncio.gather(
+            *(
+                async_client.delete(
+                    f"/api/users/{followed.id}/follow",
+                    headers={"api-key": follower.api_key},
+                )
+                for _ in range(10)
+            )
+        )
+        assert sorted(resp.status_code for resp in responses) == [200] + [404] * 9
+
+        result = await test_session.execute(
+            select(UserStats.following_count, UserStats.followers_count)
+            .where(UserStats.user_id.in_([follower.id, followed.id]))
+            .order_by(UserStats.user_id)
+        )
+        assert result.all() == [(0, 0), (0, 0)]
+        await test_session.commit()
+    finally:
+        await test_session.delete(follower)
+        await test_session.delete(followed)
+        await test_session.commit()
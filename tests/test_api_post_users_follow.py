@@ -1,6 +1,10 @@
+import asyncio
+
 import pytest
+from sqlalchemy import select
 
-from app.models import Follows, Users
+from app.models import Follows, Users, UserStats
+from app.query_stats import collect_queries
 
 
 @pytest.mark.user_add_follow
@@ -80,3 +84,74 @@ async def test_negative_add_follows(async_client, api_key, status_code):
     resp = await async_client.post("/api/users/{}/follow", headers={"api-key": api_key})
 
     assert resp.status_code == status_code
+
+
+@pytest.mark.user_add_follow
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "user_id, error_message",
+    [(9999, "User not found"), (1, "Cannot follow yourself")],
+)
+async def test_negative_follow_rejected_by_database(
+    async_client, user_id, error_message
+):
+    """
+    Несуществующий пользователь (внешний ключ) и подписка на себя
+    (ограничение ck_follows_not_self) - ответ 400 без отдельных проверок
+    """
+    with collect_queries() as stats:
+        resp = await async_client.post(
+            f"/api/users/{user_id}/follow", headers={"api-key": "test"}
+        )
+    assert resp.status_code == 400
+    assert resp.json()["error_type"] == "BadRequest"
+    assert resp.json()["error_message"] == error_message
+    # не больше auth и одного выражения подписки
+    assert stats.statements <= 2
+
+
+@pytest.mark.user_add_follow
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_follows(
+    async_client, test_session, session_per_request
+):
+    """
+    Из одновременных одинаковых подписок проходит ровно одна, остальные
+    получают "Subscription already made"; счётчики растут один раз
+    """
+    follower = Users(name="follower", api_key="concurrent_follower")
+    followed = Users(name="followed", api_key="concurrent_followed")
+    test_session.add_all([follower, followed])
+    await test_session.commit()
+    try:
+        with collect_queries() as stats:
+            responses = await asyncio.gather(
+                *(
+                    async_client.post(
+                        f"/api/users/{followed.id}/follow",
+                        headers={"api-key": follower.api_key},
+                    )
+                    for _ in range(10)
+                )
+            )
+        statuses = sorted(resp.status_code for resp in responses)
+        assert statuses == [200] + [400] * 9
+        assert {
+            resp.json()["error_message"]
+            for resp in responses
+            if resp.status_code == 400
+        } == {"Subscription already made"}
+        # одно выражение на запрос (плюс одна загрузка API key на запрос)
+        assert stats.statements <= 20
+
+        result = await test_session.execute(
+            select(UserStats.following_count, UserStats.followers_count)
+            .where(UserStats.user_id.in_([follower.id, followed.id]))
+            .order_by(UserStats.user_id)
+        )
+        assert result.all() == [(1, 0), (0, 1)]
+        await test_session.commit()
+    finally:
+        await test_session.delete(follower)
+        await test_session.delete(followed)
+        await test_session.commit()
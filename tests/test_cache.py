@@ -0,0 +1,329 @@
+import asyncio
+import fnmatch
+import time
+
+import pytest
+import pytest_asyncio
+
+from app import main
+from app.cache import Cache, MemoryCacheBackend
+from app.config import CACHE_KEY_PREFIX
+from app.metrics import CACHE_REQUESTS
+from app.models import Users
+from app.redis_cache import RedisCacheBackend, read_reply
+
+
+def resp_encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(resp_encode(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RespStandIn:
+    """
+    Локальная замена сервера Redis для тестов: протокол RESP и команды,
+    которыми пользуется RedisCacheBackend
+    """
+
+    def __init__(self):
+        self.data: dict[bytes, tuple[bytes, float | None]] = {}
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"redis://127.0.0.1:{port}/1"
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                command = await read_reply(reader)
+                writer.write(self.execute(command))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _get(self, key: bytes):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, command: list) -> bytes:
+        name, args = command[0].upper(), command[1:]
+        if name in (b"PING", b"SELECT"):
+            return b"+OK\r\n"
+        if name == b"GET":
+            return resp_encode(self._get(args[0]))
+        if name == b"MGET":
+            return resp_encode([self._get(key) for key in args])
+        if name == b"SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            if b"NX" in options and self._get(key) is not None:
+                return resp_encode(None)
+            expires_at = None
+            if b"PX" in options:
+                expires_at = (
+                    time.monotonic() + int(args[2:][options.index(b"PX") + 1]) / 1000
+                )
+            self.data[key] = (value, expires_at)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            return resp_encode(
+                sum(self.data.pop(key, None) is not None for key in args)
+            )
+        if name == b"SCAN":
+            pattern = args[args.index(b"MATCH") + 1].decode()
+            keys = [k for k in list(self.data) if fnmatch.fnmatch(k.decode(), pattern)]
+            return resp_encode([b"0", keys])
+        return b"-ERR unknown command '%s'\r\n" % name
+
+
+@pytest_asyncio.fixture()
+async def stand_in():
+    server = RespStandIn()
+    url = await server.start()
+    yield server, url
+    await server.stop()
+
+
+@pytest_asyncio.fixture(params=["memory", "redis"])
+async def backend(request, stand_in):
+    if request.param == "memory":
+        yield MemoryCacheBackend()
+        return
+    _, url = stand_in
+    backend = RedisCacheBackend(url)
+    yield backend
+    await backend.close()
+
+
+def hits(namespace: str, result: str) -> float:
+    return CACHE_REQUESTS.labels(namespace, result)._value.get()
+
+
+@pytest.mark.cache
+@pytest.mark.asyncio
+async def test_backend_operations(backend):
+    """Общий контракт хранилищ: bulk-операции, TTL, запись без перезаписи"""
+    key = CACHE_KEY_PREFIX + "test:"
+    await backend.set_many({key + "a": b"1", key + "b": b"2"}, None)
+    await backend.set_many({key + "short": b"3"}, 0.05)
+    assert await backend.get_many([key + "a", key + "b", key + "c"]) == [
+        b"1",
+        b"2",
+        None,
+    ]
+    assert await backend.get_many([key + "short"]) == [b"3"]
+    await asyncio.sleep(0.1)
+    assert await backend.get_many([key + "short"]) == [None]
+
+    assert await backend.add(key + "a", b"x") is False
+    assert await backend.add(key + "new", b"x") is True
+    await backend.delete_many([key + "a"])
+    assert await backend.get_many([key + "a", key + "new"]) == [None, b"x"]
+    await backend.clear()
+    assert await backend.get_many([key + "b", key + "new"]) == [None, None]
+
+
+@pytest.mark.cache
+@pytest.mark.asyncio
+async def test_namespaces_bulk_and_versioned_invalidation(backend):
+    profiles = Cache("test_profiles", ttl=60, backend=backend)
+    feeds = Cache("test_feeds", ttl=60, backend=backend)
+
+    await profiles.set_many({1: {"name": "one"}, 2: {"name": "two"}})
+    await feeds.set(1, ["tweet"])
+    assert await profiles.get_many([1, 2, 3]) == {
+        1: {"name": "one"},
+        2: {"name": "two"},
+    }
+    assert await feeds.get(2) is None
+
+    await profiles.invalidate()
+    assert await profiles.get_many([1, 2]) == {}
+    assert await feeds.get(1) == ["tweet"]
+
+    await feeds.delete(1)
+    assert await feeds.get(1) is None
+
+
+@pytest.mark.cache
+@pytest.mark.asyncio
+async def test_get_or_load_does_not_store_value_loaded_before_invalidation(backend):
+    """Значение, прочитанное из БД до сброса кэша, после сброса не читается"""
+    cache = Cache("test_race", ttl=60, backend=backend)
+    hits_before = hits("test_race", "hit")
+    misses_before = hits("test_race", "miss")
+
+    async def load_during_invalidation():
+        await cache.invalidate()
+        return "old"
+
+    assert await cache.get_or_load("key", load_during_invalidation) == "old"
+    assert await cache.get_or_load("key", lambda: asyncio.sleep(0, "new")) == "new"
+    assert await cache.get_or_load("key", lambda: asyncio.sleep(0, "newer")) == "new"
+    assert hits("test_race", "miss") - misses_before == 2
+    assert hits("test_race", "hit") - hits_before == 1
+
+
+@pytest.mark.cache
+@pytest.mark.asyncio
+async def test_memory_backend_evicts_by_size():
+    backend = MemoryCacheBackend(max_bytes=25)
+    await backend.set_many({"a": b"x" * 9, "b": b"x" * 9}, None)
+    await backend.get_many(["a"])  # a читался позже b
+    await backend.set_many({"c": b"x" * 9}, None)
+    assert await backend.get_many(["a", "b", "c"]) == [b"x" * 9, None, b"x" * 9]
+    assert backend.size == 20
+
+    await backend.set_many({"huge": b"x" * 100}, None)
+    assert await backend.get_many(["huge"]) == [None]
+    assert backend.size == 20
+
+
+@pytest.mark.cache
+@pytest.mark.asyncio
+async def test_unavailable_redis_degrades_to_misses(stand_in):
+    """Ошибки и недоступность сервера кэша - промахи, а не ошибки запроса"""
+    server, url = stand_in
+    await server.stop()
+    cache = Cache("test_down", backend=RedisCacheBackend(url, timeout=0.2))
+    assert await cache.get_or_load("key", lambda: asyncio.sleep(0, "db")) == "db"
+    await cache.invalidate()
+    await cache.delete("key")
+
+
+@pytest.mark.cache
+@pytest.mark.asyncio
+async def test_endpoints_read_through_cache(async_client):
+    """
+    Повторные запросы профиля и ленты не обращаются к БД, а подписка
+    и новый твит сбрасывают затронутые записи
+    """
+    headers = {"api-key": "test"}
+    resp = await async_client.get("/api/users/me", headers=headers)
+    assert int(resp.headers["X-DB-Query-Count"]) > 0
+    resp = await async_client.get("/api/users/me", headers=headers)
+    assert resp.headers["X-DB-Query-Count"] == "0"
+
+    resp = await async_client.get("/api/users/2", headers=headers)
+    assert 1 in {user["id"] for user in resp.json()["user"]["followers"]}
+    resp = await async_client.delete("/api/users/2/follow", headers=headers)
+    assert resp.status_code == 200
+    try:
+        resp = await async_client.get("/api/users/2", headers=headers)
+        assert 1 not in {user["id"] for user in resp.json()["user"]["followers"]}
+        resp = await async_client.get("/api/users/me", headers=headers)
+        assert 2 not in {user["id"] for user in resp.json()["user"]["following"]}
+    finally:
+        resp = await async_client.post("/api/users/2/follow", headers=headers)
+        assert resp.status_code == 200
+
+    await async_client.get("/api/tweets", headers=headers)
+    resp = await async_client.get("/api/tweets", headers=headers)
+    assert resp.headers["X-DB-Query-Count"] == "0"
+    resp = await async_client.post(
+        "/api/tweets",
+        headers={"api-key": "key2"},
+        json={"tweet_data": "твит для проверки кэша ленты", "tweet_media_ids": []},
+    )
+    tweet_id = resp.json()["tweet_id"]
+    try:
+        resp = await async_client.get("/api/tweets", headers=headers)
+        assert tweet_id in {tweet["id"] for tweet in resp.json()["tweets"]}
+    finally:
+        await async_client.delete(
+            f"/api/tweets/{tweet_id}", headers={"api-key": "key2"}
+        )
+    resp = await async_client.get("/api/tweets", headers=headers)
+    assert tweet_id not in {tweet["id"] for tweet in resp.json()["tweets"]}
+
+
+@pytest.mark.cache
+@pytest.mark.asyncio
+async def test_tweet_and_like_keep_unrelated_feeds_cached(async_client, test_session):
+    """
+    Твит и лайк сбрасывают ленты автора и его подписчиков, а ленты
+    читателей, не подписанных на автора, остаются в кэше
+    """
+    outsider = Users(name="outsider", api_key="outsider")
+    test_session.add(outsider)
+    await test_session.commit()
+    reader = {"api-key": "test"}
+    other = {"api-key": outsider.api_key}
+    try:
+        for headers in (reader, other):
+            await async_client.get("/api/tweets", headers=headers)
+        resp = await async_client.post(
+            "/api/tweets",
+            headers={"api-key": "key2"},
+            json={"tweet_data": "твит для подписчиков", "tweet_media_ids": []},
+        )
+        tweet_id = resp.json()["tweet_id"]
+        resp = await async_client.get("/api/tweets", headers=other)
+        assert resp.headers["X-DB-Query-Count"] == "0"
+        resp = await async_client.get("/api/tweets", headers=reader)
+        assert tweet_id in {tweet["id"] for tweet in resp.json()["tweets"]}
+
+        resp = await async_client.post(f"/api/tweets/{tweet_id}/likes", headers=other)
+        assert resp.status_code == 200
+        resp = await async_client.get("/api/tweets", headers=other)
+        assert resp.headers["X-DB-Query-Count"] == "0"
+        resp = await async_client.get("/api/tweets", headers=reader)
+        tweet = next(t for t in resp.json()["tweets"] if t["id"] == tweet_id)
+        assert tweet["likes"] == [{"user_id": outsider.id, "name": "outsider"}]
+        await async_client.delete(
+            f"/api/tweets/{tweet_id}", headers={"api-key": "key2"}
+        )
+    finally:
+        await test_session.delete(outsider)
+        await test_session.commit()
+
+
+@pytest.mark.cache
+@pytest.mark.asyncio
+async def test_popular_author_resets_all_feeds(
+    async_client, test_session, query_budget, monkeypatch
+):
+    """
+    Если подписчиков у автора больше FEED_INVALIDATION_MAX_READERS, твит
+    сбрасывает все ленты сменой версии, а не удаляет ключ каждого подписчика
+    """
+    monkeypatch.setattr(main, "FEED_INVALIDATION_MAX_READERS", 0)
+    outsider = Users(name="outsider", api_key="outsider")
+    test_session.add(outsider)
+    await test_session.commit()
+    reader = {"api-key": "test"}
+    other = {"api-key": outsider.api_key}
+    try:
+        for headers in (reader, other):
+            await async_client.get("/api/tweets", headers=headers)
+        with query_budget(4):
+            resp = await async_client.post(
+                "/api/tweets",
+                headers={"api-key": "key2"},
+                json={"tweet_data": "твит популярного автора", "tweet_media_ids": []},
+            )
+        tweet_id = resp.json()["tweet_id"]
+        resp = await async_client.get("/api/tweets", headers=other)
+        assert resp.headers["X-DB-Query-Count"] != "0"
+        resp = await async_client.get("/api/tweets", headers=reader)
+        assert tweet_id in {tweet["id"] for tweet in resp.json()["tweets"]}
+        await async_client.delete(
+            f"/api/tweets/{tweet_id}", headers={"api-key": "key2"}
+        )
+    finally:
+        await test_session.delete(outsider)
+        await test_session.commit()
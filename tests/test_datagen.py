@@ -0,0 +1,49 @@
+from collections import Counter
+from datetime import datetime, timezone
+
+import pytest
+
+from perf import datagen
+
+CONFIG = datagen.GeneratorConfig(
+    users=2_000,
+    tweets_per_user=5,
+    follows_per_user=20,
+    likes_per_tweet=3,
+    seed=7,
+    batch_size=500,
+    days=30,
+    anchor=datetime(2026, 10, 1, tzinfo=timezone.utc),
+)
+
+
+@pytest.mark.datagen
+def test_batches_are_reproducible():
+    """
+    Одна и та же пачка с тем же seed генерируется одинаково,
+    независимо от того, какие пачки генерировались до неё.
+    """
+    datagen.init_worker(CONFIG)
+    first = [datagen.follows_batch(CONFIG, 1), datagen.tweets_batch(CONFIG, 2)]
+    datagen.likes_batch(CONFIG, 0)
+    datagen.init_worker(CONFIG)
+    second = [datagen.follows_batch(CONFIG, 1), datagen.tweets_batch(CONFIG, 2)]
+    assert first == second
+
+
+@pytest.mark.datagen
+def test_follows_have_power_law_shape():
+    """
+    Подписки уникальны, без подписок на себя, а один процент самых популярных
+    пользователей собирает заметную долю всех подписчиков.
+    """
+    datagen.init_worker(CONFIG)
+    follows = []
+    for index in range(CONFIG.batches(CONFIG.users)):
+        follows.extend(datagen.follows_batch(CONFIG, index))
+    assert len(follows) == len(set(follows))
+    assert all(follower != followed for follower, followed in follows)
+
+    followers = Counter(followed for _, followed in follows)
+    top = sum(count for _, count in followers.most_common(CONFIG.users // 100))
+    assert top / len(follows) > 0.2
@@ -0,0 +1,153 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event, text
+
+from app.partitions import ensure_partitions
+
+# id сгенерированных записей начинаются отсюда, чтобы не пересекаться
+# с предзаполненными данными и данными других тестов
+BASE_ID = 1_000_000
+USERS_COUNT = 20_000
+TWEETS_COUNT = 200_000
+# таблицы (и их партиции) с большим числом строк, последовательное чтение
+# которых в запросах эндпоинтов недопустимо
+LARGE_TABLE_ROWS = 1_000
+
+DATASET_SQL = [
+    f"""
+    INSERT INTO users (id, name, api_key)
+    SELECT {BASE_ID} + g, 'explain_' || g, 'explain_key_' || g
+    FROM generate_series(1, {USERS_COUNT}) AS g
+    """,
+    # у каждого пользователя по пять подписок
+    f"""
+    INSERT INTO follows (follower_id, followed_id)
+    SELECT {BASE_ID} + g, {BASE_ID} + 1 + (g * 7 + k * 13) % {USERS_COUNT}
+    FROM generate_series(1, {USERS_COUNT}) AS g, generate_series(1, 5) AS k
+    WHERE 1 + (g * 7 + k * 13) % {USERS_COUNT} <> g
+    ON CONFLICT DO NOTHING
+    """,
+    f"""
+    INSERT INTO tweets (id, user_id, content, created_at)
+    SELECT {BASE_ID} + g,
+           {BASE_ID} + 1 + g % {USERS_COUNT},
+           'explain tweet ' || g,
+           now() - g * interval '10 seconds'
+    FROM generate_series(1, {TWEETS_COUNT}) AS g
+    """,
+    f"""
+    INSERT INTO likes (user_id, tweet_id)
+    SELECT {BASE_ID} + 1 + (g * 31 + k) % {USERS_COUNT}, {BASE_ID} + g
+    FROM generate_series(1, {TWEETS_COUNT}) AS g, generate_series(1, 2) AS k
+    ON CONFLICT DO NOTHING
+    """,
+    f"""
+    INSERT INTO medias (id, tweet_id, path_url)
+    SELECT {BASE_ID} + g, {BASE_ID} + g, 'explain_' || g || '.jpg'
+    FROM generate_series(4, {TWEETS_COUNT}, 4) AS g
+    """,
+    "ANALYZE users, follows, tweets, likes, medias",
+]
+
+
+def find_seq_scans(plan: dict) -> list[str]:
+    """Рекурсивно собирает имена таблиц и партиций, читаемых через Seq Scan"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(find_seq_scans(child))
+    return found
+
+
+@pytest.fixture
+async def explain_dataset(test_session):
+    """Заполняет таблицы сгенерированными данными и удаляет их после теста"""
+    # партиции tweets должны покрывать даты сгенерированных твитов
+    connection = await test_session.connection()
+    oldest = datetime.now(timezone.utc) - timedelta(seconds=10 * TWEETS_COUNT)
+    await ensure_partitions(connection, start=oldest)
+    for statement in DATASET_SQL:
+        await test_session.execute(text(statement))
+    await test_session.commit()
+    yield {"api_key": "explain_key_1", "user_id": BASE_ID + 1}
+    # удаление пользователей каскадом удалит их твиты, лайки и подписки
+    await test_session.execute(text(f"DELETE FROM medias WHERE id > {BASE_ID}"))
+    await test_session.execute(text(f"DELETE FROM users WHERE id > {BASE_ID}"))
+    await test_session.commit()
+
+
+@pytest.mark.explain
+@pytest.mark.asyncio
+async def test_endpoint_queries_use_indexes(
+    async_client, test_session, explain_dataset
+):
+    """
+    Регрессионный тест планов запросов.
+    Шаги:
+    - Таблицы заполняются сгенерированным набором данных.
+    - Выполняются запросы к эндпоинтам, все SQL-выражения перехватываются.
+    - Для каждого выражения выполняется EXPLAIN (FORMAT JSON).
+    - Тест падает, если хотя бы в одном плане есть Seq Scan большой таблицы
+      (для партиционированных таблиц - большой партиции).
+    """
+    headers = {"api-key": explain_dataset["api_key"]}
+    other_user_id = explain_dataset["user_id"] + 1
+    # твит сгенерирован для пользователя BASE_ID + 1 + g % USERS_COUNT
+    other_tweet_id = BASE_ID + 1
+    requests = [
+        ("GET", "/api/users/me"),
+        ("GET", "/api/tweets"),
+        # слово из текста одного твита: поиск идёт по GIN-индексу
+        ("GET", f"/api/tweets/search?q={other_tweet_id - BASE_ID + 12344}"),
+        ("GET", f"/api/users/{other_user_id}"),
+        ("POST", f"/api/tweets/{other_tweet_id}/likes"),
+        ("DELETE", f"/api/tweets/{other_tweet_id}/likes"),
+        ("DELETE", f"/api/users/{other_user_id}/follow"),
+        ("POST", f"/api/users/{other_user_id}/follow"),
+    ]
+
+    captured: list[tuple[str, str, tuple]] = []
+    current_route = [""]
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            captured.append((current_route[0], statement, parameters))
+
+    sync_engine = test_session.bind.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", capture)
+    try:
+        for method, url in requests:
+            current_route[0] = f"{method} {url}"
+            resp = await async_client.request(method, url, headers=headers)
+            assert resp.status_code < 500, current_route[0]
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", capture)
+
+    assert captured
+    failures = []
+    connection = await test_session.connection()
+    result = await connection.execute(
+        text(
+            "SELECT relname FROM pg_class "
+            "WHERE relkind = 'r' AND reltuples > :rows "
+            "AND relnamespace = 'public'::regnamespace"
+        ),
+        {"rows": LARGE_TABLE_ROWS},
+    )
+    large_tables = set(result.scalars())
+    assert large_tables
+    for route, statement, parameters in captured:
+        result = await connection.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement}", parameters
+        )
+        plan = result.scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        for table in set(find_seq_scans(plan[0]["Plan"])) & large_tables:
+            failures.append(f"{route}: Seq Scan on {table}\n{statement}")
+    await test_session.rollback()
+
+    assert not failures, "\n\n".join(failures)
@@ -0,0 +1,176 @@
+import asyncio
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.follow_graph import FollowGraph, csr_size, follow_graph, maintain_follow_graph
+from app.models import Follows
+from app.query_stats import collect_queries
+
+
+async def following_in_db(session, user_id: int) -> list[int]:
+    result = await session.execute(
+        select(Follows.followed_id)
+        .where(Follows.follower_id == user_id)
+        .order_by(Follows.followed_id)
+    )
+    await session.commit()
+    return list(result.scalars())
+
+
+@pytest.mark.follow_graph
+@pytest.mark.asyncio
+async def test_build_matches_follows_table(test_session):
+    """Списки индекса совпадают с follows и отдаются без копирования"""
+    graph = FollowGraph()
+    await graph.build(test_session.bind)
+    assert graph.covered > 3
+    for user_id in (1, 2, 3):
+        row = graph.following(user_id)
+        assert list(row) == await following_in_db(test_session, user_id)
+        # срез memoryview над общим массивом, а не новый список
+        assert isinstance(row, memoryview) and row.obj is graph.targets
+    assert list(graph.following(0)) == []
+
+
+@pytest.mark.follow_graph
+@pytest.mark.asyncio
+async def test_follow_and_unfollow_keep_lists_sorted(test_session):
+    graph = FollowGraph()
+    await graph.build(test_session.bind)
+    before = list(graph.following(1))
+
+    graph.unfollow(1, 2)
+    assert list(graph.following(1)) == [i for i in before if i != 2]
+    graph.follow(1, 9999)
+    graph.follow(1, 2)
+    graph.follow(1, 2)  # повторное событие ничего не меняет
+    assert list(graph.following(1)) == sorted(set(before) | {2, 9999})
+
+    # уплотнение переносит изменения в CSR
+    graph.compact()
+    assert not graph.overrides
+    assert list(graph.following(1)) == sorted(set(before) | {2, 9999})
+
+
+@pytest.mark.follow_graph
+@pytest.mark.asyncio
+async def test_cold_users_beyond_budget_are_read_from_db(test_session):
+    """
+    Пользователи, не поместившиеся в бюджет, читаются из БД один раз,
+    дальше их списки берутся из памяти
+    """
+    # в CSR помещаются только пользователи 0 и 1 (две подписки)
+    graph = FollowGraph(max_bytes=csr_size(2, 2) * 4 // 3 + 1)
+    await graph.build(test_session.bind)
+    assert graph.covered == 2
+    assert graph.following(2) is None
+    # место для холодных списков
+    graph.max_bytes = 10_000
+
+    with collect_queries() as stats:
+        row = await graph.get_following(test_session, 2)
+    await test_session.commit()
+    assert stats.statements == 1
+    assert list(row) == await following_in_db(test_session, 2)
+
+    with collect_queries() as stats:
+        assert list(await graph.get_following(test_session, 2)) == list(row)
+    assert stats.statements == 0
+    assert graph.size_bytes <= graph.max_bytes
+
+    # события меняют и холодные списки в памяти
+    graph.unfollow(2, 1)
+    assert 1 not in list(graph.following(2))
+
+
+@pytest.mark.follow_graph
+@pytest.mark.asyncio
+async def test_event_during_cold_load_is_not_lost(test_session):
+    """Список, прочитанный одновременно с подпиской, не сохраняется"""
+    graph = FollowGraph()
+
+    class SessionWithConcurrentFollow:
+        async def execute(self, statement):
+            result = await test_session.execute(statement)
+            graph.follow(3, 9999)
+            return result
+
+    await graph.get_following(SessionWithConcurrentFollow(), 3)
+    await test_session.commit()
+    assert graph.following(3) is None
+
+
+@pytest.mark.follow_graph
+@pytest.mark.asyncio
+async def test_changes_from_other_process_invalidate_lists(test_session):
+    """
+    Отписка, сделанная другим процессом, приходит через NOTIFY: список
+    подписчика перечитывается из БД, остальные списки остаются в памяти
+    """
+    graph = FollowGraph()
+    task = asyncio.create_task(
+        maintain_follow_graph(test_session.bind, interval=3600, graph=graph)
+    )
+
+    async def wait_for(condition) -> None:
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0.05)
+        raise AssertionError("condition not met")
+
+    try:
+        await wait_for(lambda: graph.covered > 3)
+        before = await following_in_db(test_session, 3)
+        assert 2 in before
+        await test_session.execute(
+            delete(Follows).where(Follows.follower_id == 3, Follows.followed_id == 2)
+        )
+        await test_session.commit()
+        try:
+            await wait_for(lambda: graph.following(3) is None)
+            assert 3 in graph.stale
+            assert graph.following(1) is not None
+            with collect_queries() as stats:
+                row = await graph.get_following(test_session, 3)
+            await test_session.commit()
+            assert stats.statements == 1
+            assert list(row) == [i for i in before if i != 2]
+            # перечитанный список хранится в памяти до следующего изменения
+            assert 3 not in graph.stale
+            assert list(graph.following(3)) == list(row)
+        finally:
+            test_session.add(Follows(follower_id=3, followed_id=2))
+            await test_session.commit()
+        await wait_for(lambda: graph.following(3) is None)
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.follow_graph
+@pytest.mark.asyncio
+async def test_feed_uses_follow_graph_events(async_client, test_session):
+    """Отписка через API сразу убирает твиты автора из ленты"""
+    await follow_graph.build(test_session.bind)
+    headers = {"api-key": "test"}
+
+    def authors(resp):
+        return {tweet["author"]["id"] for tweet in resp.json()["tweets"]}
+
+    with collect_queries() as stats:
+        resp = await async_client.get("/api/tweets", headers=headers)
+    assert 2 in authors(resp)
+    # подписки ленты берутся из индекса, без запроса к follows
+    assert not any("FROM follows" in sql for sql in stats.sql)
+
+    await async_client.delete("/api/users/2/follow", headers=headers)
+    try:
+        assert 2 not in follow_graph.following(1)
+        resp = await async_client.get("/api/tweets", headers=headers)
+        assert 2 not in authors(resp)
+    finally:
+        await async_client.post("/api/users/2/follow", headers=headers)
+    assert 2 in follow_graph.following(1)
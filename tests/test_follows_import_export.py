@@ -0,0 +1,111 @@
+import csv
+import io
+
+import pytest
+from sqlalchemy import select
+
+from app.models import Follows, Users, UserStats
+from app.query_stats import collect_queries
+
+
+@pytest.fixture
+async def importer(test_session):
+    """Пользователь, уже подписанный на первого из двух других"""
+    users = [
+        Users(name="importer", api_key="importer"),
+        Users(name="known", api_key="known"),
+        Users(name="Doe, John", api_key="comma"),
+    ]
+    test_session.add_all(users)
+    await test_session.commit()
+    test_session.add(Follows(follower_id=users[0].id, followed_id=users[1].id))
+    await test_session.commit()
+    yield users
+    for user in users:
+        await test_session.delete(user)
+    await test_session.commit()
+
+
+@pytest.mark.follows_import
+@pytest.mark.asyncio
+async def test_bulk_follow_reports_each_id(async_client, test_session, importer):
+    """
+    Одно выражение подписки на весь список; результат по каждому id,
+    повторы учитываются один раз, счётчики растут только для новых подписок
+    """
+    me, known, new = importer
+    headers = {"api-key": me.api_key}
+    # профиль в кэше должен сброситься после подписки
+    await async_client.get("/api/users/me", headers=headers)
+
+    with collect_queries() as stats:
+        resp = await async_client.post(
+            "/api/users/me/follows",
+            headers=headers,
+            json={"user_ids": [known.id, new.id, new.id, 999999, me.id]},
+        )
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "result": True,
+        "results": [
+            {"id": known.id, "status": "already_following"},
+            {"id": new.id, "status": "followed"},
+            {"id": 999999, "status": "not_found"},
+            {"id": me.id, "status": "self"},
+        ],
+    }
+    # auth и одно выражение подписки
+    assert stats.statements <= 2
+
+    result = await test_session.execute(
+        select(UserStats.followers_count).where(UserStats.user_id == new.id)
+    )
+    assert result.scalar_one() == 1
+    await test_session.commit()
+
+    me_resp = await async_client.get("/api/users/me", headers=headers)
+    assert {user["id"] for user in me_resp.json()["user"]["following"]} >= {new.id}
+
+    # повторный импорт ничего не создаёт
+    resp = await async_client.post(
+        "/api/users/me/follows", headers=headers, json={"user_ids": [new.id]}
+    )
+    assert resp.json()["results"] == [{"id": new.id, "status": "already_following"}]
+
+
+@pytest.mark.follows_import
+@pytest.mark.asyncio
+@pytest.mark.parametrize("user_ids", [[], list(range(1, 1002))])
+async def test_negative_bulk_follow_size(async_client, user_ids):
+    resp = await async_client.post(
+        "/api/users/me/follows",
+        headers={"api-key": "test"},
+        json={"user_ids": user_ids},
+    )
+    assert resp.status_code == 422
+
+
+@pytest.mark.follows_import
+@pytest.mark.asyncio
+async def test_export_following_streams_csv(async_client, importer):
+    """Выгрузка подписок - CSV по возрастанию id, с экранированием имён"""
+    me, known, new = importer
+    headers = {"api-key": me.api_key}
+    await async_client.post(
+        "/api/users/me/follows", headers=headers, json={"user_ids": [new.id]}
+    )
+
+    resp = await async_client.get(
+        f"/api/users/{me.id}/following/export", headers=headers
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(resp.text)))
+    assert rows == [
+        ["id", "name"],
+        [str(known.id), "known"],
+        [str(new.id), "Doe, John"],
+    ]
+
+    resp = await async_client.get("/api/users/999999/following/export", headers=headers)
+    assert resp.status_code == 404
@@ -1,5 +1,11 @@
+from datetime import datetime, timedelta, timezone
+
 import pytest
 
+from app import main
+from app.config import FEED_WINDOW_DAYS
+from app.models import Follows, Tweets, Users
+
 
 @pytest.mark.tweets_get
 @pytest.mark.asyncio
@@ -51,3 +57,70 @@ async def test_negative_api_tweets(async_client, api_key, status_code):
     """
     resp = await async_client.get("/api/tweets", headers={"api-key": api_key})
     assert resp.status_code == status_code
+
+
+@pytest.fixture
+async def quiet_author(test_session):
+    """
+    Читатель и автор, на которого он подписан, с двумя твитами старше
+    окна ленты FEED_WINDOW_DAYS
+    """
+    reader = Users(name="feed reader", api_key="feed-reader")
+    author = Users(name="quiet author", api_key="quiet-author")
+    test_session.add_all([reader, author])
+    await test_session.flush()
+    old = datetime.now(timezone.utc) - timedelta(days=FEED_WINDOW_DAYS + 30)
+    tweets = [
+        Tweets(content="давний твит", user_id=author.id, created_at=old),
+        Tweets(
+            content="совсем давний твит",
+            user_id=author.id,
+            created_at=old - timedelta(days=1),
+        ),
+    ]
+    test_session.add_all(
+        [*tweets, Follows(follower_id=reader.id, followed_id=author.id)]
+    )
+    await test_session.commit()
+    yield reader, tweets
+    for tweet in tweets:
+        await test_session.delete(tweet)
+    await test_session.delete(reader)
+    await test_session.delete(author)
+    await test_session.commit()
+
+
+@pytest.mark.tweets_get
+@pytest.mark.asyncio
+async def test_feed_falls_back_to_tweets_before_window(
+    async_client, quiet_author, monkeypatch
+):
+    """
+    Если в окне ленты меньше FEED_MIN_TWEETS твитов, она дополняется
+    более старыми, но не больше чем FEED_MIN_TWEETS; полное окно
+    старые твиты не читает
+    """
+    reader, (older, oldest) = quiet_author
+    headers = {"api-key": reader.api_key}
+
+    def feed_ids(resp):
+        return [tweet["id"] for tweet in resp.json()["tweets"]]
+
+    resp = await async_client.get("/api/tweets", headers=headers)
+    assert feed_ids(resp) == [older.id, oldest.id]
+
+    monkeypatch.setattr(main, "FEED_MIN_TWEETS", 1)
+    await main.feed_cache.delete(reader.id)
+    resp = await async_client.get("/api/tweets", headers=headers)
+    assert feed_ids(resp) == [older.id]
+
+    resp = await async_client.post(
+        "/api/tweets",
+        headers=headers,
+        json={"tweet_data": "свежий твит", "tweet_media_ids": []},
+    )
+    fresh_id = resp.json()["tweet_id"]
+    resp = await async_client.get("/api/tweets", headers=headers)
+    assert feed_ids(resp) == [fresh_id]
+    resp = await async_client.delete(f"/api/tweets/{fresh_id}", headers=headers)
+    assert resp.status_code == 200
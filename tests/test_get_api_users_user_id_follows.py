@@ -0,0 +1,72 @@
+import pytest
+
+from app import main
+
+
+@pytest.mark.user_follows
+@pytest.mark.asyncio
+@pytest.mark.parametrize("direction", ["followers", "following"])
+async def test_follows_pages_by_cursor(async_client, direction):
+    """
+    Списки подписчиков и подписок отдаются страницами по возрастанию id,
+    курсор следующей страницы - id последнего пользователя страницы
+    """
+    headers = {"api-key": "test"}
+    resp = await async_client.get(
+        f"/api/users/1/{direction}", params={"limit": 1}, headers=headers
+    )
+    assert resp.status_code == 200
+    first = resp.json()
+    assert first["result"] is True
+    assert [user["id"] for user in first["users"]] == [2]
+    assert first["next_cursor"] == 2
+
+    resp = await async_client.get(
+        f"/api/users/1/{direction}",
+        params={"limit": 1, "cursor": first["next_cursor"]},
+        headers=headers,
+    )
+    second = resp.json()
+    assert [user["id"] for user in second["users"]] == [3]
+    assert second["next_cursor"] is None
+
+
+@pytest.mark.user_follows
+@pytest.mark.asyncio
+async def test_follows_page_of_unknown_user(async_client):
+    resp = await async_client.get(
+        "/api/users/9999/followers", headers={"api-key": "test"}
+    )
+    assert resp.status_code == 404
+    assert resp.json()["error_type"] == "NotFound"
+
+    # страница после последней - пустая, а не 404
+    resp = await async_client.get(
+        "/api/users/1/following", params={"cursor": 9999}, headers={"api-key": "test"}
+    )
+    assert resp.status_code == 200
+    assert resp.json()["users"] == []
+
+
+@pytest.mark.user_follows
+@pytest.mark.asyncio
+async def test_profile_counts_and_preview(async_client, monkeypatch):
+    """
+    Профиль содержит число подписчиков и подписок; в режиме preview списки
+    обрезаются до PROFILE_PREVIEW_SIZE, а числа остаются полными
+    """
+    headers = {"api-key": "test"}
+    full = (await async_client.get("/api/users/2", headers=headers)).json()["user"]
+    assert full["followers_count"] == len(full["followers"]) == 2
+    assert full["following_count"] == len(full["following"]) == 2
+
+    me = (await async_client.get("/api/users/me", headers=headers)).json()["user"]
+    assert me["followers_count"] == 2
+    assert me["following_count"] == 2
+
+    monkeypatch.setattr(main, "PROFILE_PREVIEW_SIZE", 1)
+    for path in ("/api/users/2", "/api/users/me"):
+        resp = await async_client.get(path, params={"preview": True}, headers=headers)
+        user = resp.json()["user"]
+        assert len(user["followers"]) == len(user["following"]) == 1
+        assert user["followers_count"] == user["following_count"] == 2
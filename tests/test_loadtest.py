@@ -0,0 +1,61 @@
+import pytest
+
+from perf.loadtest import (
+    Dataset,
+    compare_with_baseline,
+    parse_mix,
+    percentile,
+    run_load,
+)
+
+
+@pytest.mark.loadtest
+def test_percentile_and_regression_check():
+    """
+    Перцентили считаются по ближайшему рангу, а сравнение с базовым прогоном
+    находит рост p95 и падение пропускной способности сверх порога.
+    """
+    values = [i / 1000 for i in range(1, 101)]
+    assert percentile(values, 0.50) == 0.05
+    assert percentile(values, 0.99) == 0.099
+    assert parse_mix("feed=80,like=20") == {"feed": 80.0, "like": 20.0}
+    with pytest.raises(ValueError):
+        parse_mix("unknown=1")
+
+    route = {"p95_ms": 10.0, "p99_ms": 20.0, "throughput_rps": 100.0}
+    baseline = {"routes": {"GET /api/tweets": route}, "total": {"errors": 0}}
+    same = {"routes": {"GET /api/tweets": route}, "total": {"errors": 0}}
+    assert compare_with_baseline(same, baseline, 0.2) == []
+    slower = {
+        "routes": {"GET /api/tweets": {**route, "p95_ms": 15.0, "throughput_rps": 50}},
+        "total": {"errors": 0},
+    }
+    assert len(compare_with_baseline(slower, baseline, 0.2)) == 2
+
+
+@pytest.mark.loadtest
+@pytest.mark.asyncio
+async def test_run_load_reports_routes(async_client):
+    """
+    Короткий прогон смеси только читающих сценариев против приложения
+    в процессе: в отчёте есть оба маршрута, без ошибок.
+    """
+    dataset = Dataset(
+        first_user=1,
+        last_user=1,
+        first_tweet=11,
+        last_tweet=11,
+        api_key_template="test",
+    )
+    result = await run_load(
+        async_client,
+        dataset,
+        {"feed": 80, "profile": 20},
+        duration=0.5,
+        concurrency=1,
+        seed=1,
+    )
+    assert set(result["routes"]) == {"GET /api/tweets", "GET /api/users/{user_id}"}
+    assert result["total"]["requests"] > 0
+    assert result["total"]["errors"] == 0
+    assert result["routes"]["GET /api/tweets"]["p99_ms"] > 0
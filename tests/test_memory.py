@@ -0,0 +1,78 @@
+import pytest
+
+from app import dependencies, memory
+
+
+@pytest.fixture()
+def admin(monkeypatch):
+    monkeypatch.setattr(dependencies, "ADMIN_API_KEYS", frozenset({"test"}))
+    yield {"api-key": "test"}
+    memory.stop_tracing()
+
+
+@pytest.mark.memory
+@pytest.mark.asyncio
+async def test_snapshot_diff_shows_growth(async_client, admin):
+    """
+    Первый снимок включает tracemalloc, сравнение второго снимка
+    с первым показывает место, где выросла память
+    """
+    resp = await async_client.post("/api/admin/memory/snapshots", headers=admin)
+    assert resp.status_code == 200
+    first = resp.json()["snapshot"]
+    assert first["tracing"] is True
+
+    held = [bytearray(1024) for _ in range(2000)]
+    resp = await async_client.post(
+        "/api/admin/memory/snapshots", params={"limit": 5}, headers=admin
+    )
+    second = resp.json()["snapshot"]
+    assert len(second["top"]) <= 5
+
+    resp = await async_client.get(
+        f"/api/admin/memory/snapshots/{second['id']}/diff", headers=admin
+    )
+    assert resp.status_code == 200
+    diff = resp.json()["diff"]
+    assert diff["base_id"] == first["id"]
+    top = diff["top"][0]
+    assert "test_memory.py" in top["location"]
+    assert top["size_diff_kb"] >= 1500
+    assert len(held) == 2000
+
+    resp = await async_client.get("/api/admin/memory", headers=admin)
+    assert [s["id"] for s in resp.json()["snapshots"]] == [first["id"], second["id"]]
+
+    resp = await async_client.delete("/api/admin/memory", headers=admin)
+    assert resp.json() == {"result": True}
+    resp = await async_client.get("/api/admin/memory", headers=admin)
+    assert resp.json()["memory"]["tracing"] is False
+    assert resp.json()["snapshots"] == []
+
+
+@pytest.mark.memory
+@pytest.mark.asyncio
+async def test_unknown_snapshot_diff(async_client, admin):
+    """Сравнение с несуществующим снимком возвращает 404"""
+    resp = await async_client.get(
+        "/api/admin/memory/snapshots/9999/diff", headers=admin
+    )
+    assert resp.status_code == 404
+    assert resp.json()["error_type"] == "NotFound"
+
+
+@pytest.mark.memory
+@pytest.mark.asyncio
+async def test_route_peak_allocations(async_client, admin, monkeypatch):
+    """При MEMORY_ROUTE_STATS пиковые аллокации учитываются по маршрутам"""
+    monkeypatch.setattr(memory, "MEMORY_ROUTE_STATS", True)
+    memory.ensure_tracing()
+    for _ in range(2):
+        await async_client.get("/api/tweets", headers={"api-key": "key2"})
+
+    resp = await async_client.get("/api/admin/memory", headers=admin)
+    routes = {row["route"]: row for row in resp.json()["routes"]}
+    feed = routes["GET /api/tweets"]
+    assert feed["requests"] == 2
+    assert feed["overlapped"] == 0
+    assert feed["max_peak_kb"] > 0
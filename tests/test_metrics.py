@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.metrics import TimedQueuePool, monitor_event_loop_lag
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.mark.metrics
+@pytest.mark.asyncio
+async def test_metrics_count_requests_by_route(async_client):
+    """
+    Запросы учитываются по шаблону маршрута и статусу,
+    после ответа запросов в работе не остаётся
+    """
+    labels = {"method": "GET", "route": "/api/users/{user_id}"}
+    before = sample("http_requests_total", status="200", **labels)
+    before_latency = sample("http_request_duration_seconds_count", **labels)
+
+    await async_client.get("/api/users/2", headers={"api-key": "test"})
+    await async_client.get("/api/users/3", headers={"api-key": "test"})
+
+    assert sample("http_requests_total", status="200", **labels) == before + 2
+    assert sample("http_request_duration_seconds_count", **labels) == (
+        before_latency + 2
+    )
+    assert sample("http_requests_in_flight", **labels) == 0
+
+    resp = await async_client.get("/metrics")
+    assert resp.status_code == 200
+    assert 'route="/api/users/{user_id}"' in resp.text
+    assert "cache_requests_total" in resp.text
+
+
+@pytest.mark.metrics
+@pytest.mark.asyncio
+async def test_metrics_unknown_paths_share_one_label(async_client):
+    """Пути мимо маршрутов не создают отдельных рядов метрик"""
+    await async_client.get("/no/such/path/123")
+    resp = await async_client.get("/metrics")
+    assert 'route="unmatched"' in resp.text
+    assert "/no/such/path/123" not in resp.text
+
+
+@pytest.mark.metrics
+@pytest.mark.asyncio
+async def test_pool_metrics(database_url):
+    """Пул учитывает выданные соединения и время их ожидания"""
+    engine = create_async_engine(database_url, poolclass=TimedQueuePool)
+    waits = sample("db_pool_wait_seconds_count")
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            assert sample("db_pool_checked_out") == 1
+        assert sample("db_pool_checked_out") == 0
+        assert sample("db_pool_capacity") == 15
+        assert sample("db_pool_wait_seconds_count") == waits + 1
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.metrics
+@pytest.mark.asyncio
+async def test_event_loop_lag_is_measured():
+    """Блокирующий код в event loop виден как опоздание"""
+    lag_before = sample("event_loop_lag_seconds_distribution_sum")
+    task = asyncio.create_task(monitor_event_loop_lag(interval=0.01))
+    await asyncio.sleep(0)
+    # блокируем loop, не отдавая управление
+    time.sleep(0.05)
+    await asyncio.sleep(0.02)
+    task.cancel()
+    assert sample("event_loop_lag_seconds_distribution_sum") - lag_before >= 0.03
@@ -0,0 +1,229 @@
+import pytest
+from sqlalchemy import select
+
+from app.main import feed_cache
+from app.models import Blocks, Follows, Likes, Suggestions, Tweets, Users, UserStats
+from app.query_stats import collect_queries
+
+
+def authors(resp) -> set[int]:
+    return {tweet["author"]["id"] for tweet in resp.json()["tweets"]}
+
+
+@pytest.fixture
+async def pair(async_client, test_session):
+    """Два пользователя, подписанные друг на друга через API, у второго - твит"""
+    users = [
+        Users(name="blocker", api_key="blocker"),
+        Users(name="blocked", api_key="blocked"),
+    ]
+    test_session.add_all(users)
+    await test_session.commit()
+    first, second = users
+    tweet = Tweets(content="твит второго", user_id=second.id)
+    test_session.add(tweet)
+    await test_session.commit()
+    for follower, followed in ((first, second), (second, first)):
+        resp = await async_client.post(
+            f"/api/users/{followed.id}/follow", headers={"api-key": follower.api_key}
+        )
+        assert resp.status_code == 200
+    yield first, second, tweet.id
+    for user in users:
+        await test_session.delete(user)
+    await test_session.commit()
+
+
+@pytest.mark.exclusions
+@pytest.mark.asyncio
+async def test_mute_hides_author_from_feed(async_client):
+    """
+    Скрытый автор исключается из списка авторов до запроса твитов,
+    множество исключений берётся из кэша; подписка сохраняется
+    """
+    headers = {"api-key": "test"}
+    resp = await async_client.get("/api/tweets", headers=headers)
+    assert 2 in authors(resp)
+
+    resp = await async_client.post("/api/users/2/mute", headers=headers)
+    assert resp.status_code == 200
+    try:
+        with collect_queries() as stats:
+            resp = await async_client.get("/api/tweets", headers=headers)
+        assert 2 not in authors(resp)
+        # твиты не фильтруются подзапросом к mutes
+        assert not any("mutes" in sql and "tweets" in sql for sql in stats.sql)
+
+        # при следующей сборке ленты исключения читаются из кэша
+        await feed_cache.delete(1)
+        with collect_queries() as stats:
+            await async_client.get("/api/tweets", headers=headers)
+        assert not any("FROM mutes" in sql for sql in stats.sql)
+
+        profile = (await async_client.get("/api/users/me", headers=headers)).json()
+        assert 2 in {user["id"] for user in profile["user"]["following"]}
+
+        resp = await async_client.post("/api/users/2/mute", headers=headers)
+        assert resp.json()["error_message"] == "User already muted"
+    finally:
+        resp = await async_client.delete("/api/users/2/mute", headers=headers)
+    assert resp.status_code == 200
+    resp = await async_client.get("/api/tweets", headers=headers)
+    assert 2 in authors(resp)
+
+    resp = await async_client.delete("/api/users/2/mute", headers=headers)
+    assert resp.status_code == 404
+    assert resp.json()["error_message"] == "Mute not found"
+
+
+@pytest.mark.exclusions
+@pytest.mark.asyncio
+async def test_block_removes_follows_and_is_enforced(async_client, test_session, pair):
+    """
+    Блокировка удаляет подписки в обе стороны вместе со счётчиками, а
+    подписка и лайк заблокированного отклоняются
+    """
+    first, second, tweet_id = pair
+    blocker = {"api-key": first.api_key}
+    blocked = {"api-key": second.api_key}
+    resp = await async_client.get("/api/tweets", headers=blocker)
+    assert second.id in authors(resp)
+
+    resp = await async_client.post(f"/api/users/{second.id}/block", headers=blocker)
+    assert resp.status_code == 200
+
+    result = await test_session.execute(
+        select(Follows).where(Follows.follower_id.in_([first.id, second.id]))
+    )
+    assert result.all() == []
+    result = await test_session.execute(
+        select(UserStats.followers_count, UserStats.following_count).where(
+            UserStats.user_id.in_([first.id, second.id])
+        )
+    )
+    assert set(result.all()) == {(0, 0)}
+    await test_session.commit()
+
+    resp = await async_client.get("/api/tweets", headers=blocker)
+    assert second.id not in authors(resp)
+
+    # заблокированный не может подписаться и лайкнуть, и наоборот
+    resp = await async_client.post(f"/api/users/{first.id}/follow", headers=blocked)
+    assert resp.status_code == 403
+    assert resp.json()["error_message"] == "User is blocked"
+    resp = await async_client.post(f"/api/users/{second.id}/follow", headers=blocker)
+    assert resp.status_code == 403
+    resp = await async_client.post(f"/api/tweets/{tweet_id}/likes", headers=blocker)
+    assert resp.status_code == 403
+    resp = await async_client.post(
+        "/api/users/me/follows", headers=blocked, json={"user_ids": [first.id]}
+    )
+    assert resp.json()["results"] == [{"id": first.id, "status": "blocked"}]
+
+    resp = await async_client.post(f"/api/users/{second.id}/block", headers=blocker)
+    assert resp.json()["error_message"] == "User already blocked"
+
+    resp = await async_client.delete(f"/api/users/{second.id}/block", headers=blocker)
+    assert resp.status_code == 200
+    resp = await async_client.post(f"/api/users/{first.id}/follow", headers=blocked)
+    assert resp.status_code == 200
+    resp = await async_client.delete(f"/api/users/{second.id}/block", headers=blocker)
+    assert resp.status_code == 404
+
+
+@pytest.mark.exclusions
+@pytest.mark.asyncio
+async def test_block_from_other_process_is_enforced(async_client, test_session, pair):
+    """
+    Блокировка, сделанная другим процессом, не сбрасывает кэш исключений
+    этого процесса, но подписка и лайк всё равно отклоняются
+    """
+    first, second, tweet_id = pair
+    headers = {"api-key": first.api_key}
+    await async_client.post(f"/api/users/{second.id}/follow", headers=headers)
+    await async_client.delete(f"/api/users/{second.id}/follow", headers=headers)
+    # кэш исключений первого загружен до блокировки
+    resp = await async_client.get("/api/tweets", headers=headers)
+    assert resp.status_code == 200
+    test_session.add(Blocks(blocker_id=second.id, blocked_id=first.id))
+    await test_session.commit()
+
+    resp = await async_client.post(f"/api/users/{second.id}/follow", headers=headers)
+    assert resp.status_code == 403
+    assert resp.json()["error_message"] == "User is blocked"
+    resp = await async_client.post(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    assert resp.status_code == 403
+    resp = await async_client.post(
+        "/api/users/me/follows", headers=headers, json={"user_ids": [second.id]}
+    )
+    assert resp.json()["results"] == [{"id": second.id, "status": "blocked"}]
+
+    result = await test_session.execute(
+        select(Follows.followed_id).where(Follows.follower_id == first.id)
+    )
+    assert second.id not in result.scalars().all()
+    result = await test_session.execute(
+        select(Likes).where(Likes.user_id == first.id, Likes.tweet_id == tweet_id)
+    )
+    assert result.all() == []
+    await test_session.commit()
+
+
+@pytest.mark.exclusions
+@pytest.mark.asyncio
+async def test_muted_and_blocked_users_are_not_suggested(
+    async_client, test_session, pair
+):
+    """
+    Рекомендации не предлагают скрытых и заблокированных в любую сторону:
+    подписка на них всё равно была бы отклонена или бесполезна
+    """
+    first, second, _ = pair
+    test_session.add_all(
+        [
+            Suggestions(
+                user_id=1,
+                rank=rank,
+                suggested_id=user.id,
+                score=1.0,
+                mutual_count=1,
+                follows_you=False,
+            )
+            for rank, user in enumerate((first, second))
+        ]
+    )
+    await test_session.commit()
+    headers = {"api-key": "test"}
+
+    def suggested(resp) -> list[int]:
+        return [user["id"] for user in resp.json()["users"]]
+
+    resp = await async_client.get("/api/users/me/suggestions", headers=headers)
+    assert suggested(resp) == [first.id, second.id]
+
+    resp = await async_client.post(f"/api/users/{first.id}/mute", headers=headers)
+    assert resp.status_code == 200
+    # блокировка с другой стороны: второй заблокировал пользователя 1
+    resp = await async_client.post(
+        "/api/users/1/block", headers={"api-key": second.api_key}
+    )
+    assert resp.status_code == 200
+    resp = await async_client.get("/api/users/me/suggestions", headers=headers)
+    assert suggested(resp) == []
+
+
+@pytest.mark.exclusions
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "path, error_message",
+    [
+        ("/api/users/1/mute", "Cannot mute yourself"),
+        ("/api/users/1/block", "Cannot block yourself"),
+        ("/api/users/9999/mute", "User not found"),
+        ("/api/users/9999/block", "User not found"),
+    ],
+)
+async def test_negative_mute_and_block(async_client, path, error_message):
+    resp = await async_client.post(path, headers={"api-key": "test"})
+    assert resp.status_code == 400
+    assert resp.json()["error_message"] == error_message
@@ -0,0 +1,79 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import text
+
+from app.config import TWEETS_PARTITION_MONTHS_AHEAD
+from app.partitions import (
+    add_months,
+    ensure_partitions,
+    month_start,
+    tweets_partition_name,
+)
+
+
+@pytest.mark.partitions
+@pytest.mark.asyncio
+async def test_ensure_partitions_creates_future_months(test_session):
+    """
+    Проверка создания партиций:
+    - повторный вызов ensure_partitions не падает;
+    - партиции tweets существуют на TWEETS_PARTITION_MONTHS_AHEAD месяцев вперёд;
+    - у likes есть hash-партиции.
+    """
+    connection = await test_session.connection()
+    await ensure_partitions(connection)
+    await ensure_partitions(connection)
+    await test_session.commit()
+
+    last = add_months(
+        month_start(datetime.now(timezone.utc)), TWEETS_PARTITION_MONTHS_AHEAD
+    )
+    result = await test_session.execute(
+        text("SELECT to_regclass(:name) IS NOT NULL"),
+        {"name": tweets_partition_name(last)},
+    )
+    assert result.scalar() is True
+    result = await test_session.execute(
+        text("SELECT count(*) FROM pg_inherits WHERE inhparent = 'likes'::regclass")
+    )
+    assert result.scalar() > 1
+
+
+@pytest.mark.partitions
+@pytest.mark.asyncio
+async def test_new_tweet_lands_in_current_partition(async_client, test_session):
+    """
+    Новый твит попадает в партицию текущего месяца, а не в партицию
+    по умолчанию, и удаляется вместе с лайками через триггер.
+    """
+    resp = await async_client.post(
+        "/api/tweets",
+        headers={"api-key": "test"},
+        json={"tweet_data": "твит для проверки партиций", "tweet_media_ids": []},
+    )
+    tweet_id = resp.json().get("tweet_id")
+    assert resp.status_code == 200
+    resp = await async_client.post(
+        f"/api/tweets/{tweet_id}/likes", headers={"api-key": "key2"}
+    )
+    assert resp.status_code == 200
+
+    result = await test_session.execute(
+        text("SELECT tableoid::regclass::text FROM tweets WHERE id = :id"),
+        {"id": tweet_id},
+    )
+    assert result.scalar_one() == tweets_partition_name(
+        month_start(datetime.now(timezone.utc))
+    )
+    await test_session.commit()
+
+    # удаление твита мимо ORM: лайки удаляет триггер tweets_cascade_delete
+    await test_session.execute(
+        text("DELETE FROM tweets WHERE id = :id"), {"id": tweet_id}
+    )
+    await test_session.commit()
+    result = await test_session.execute(
+        text("SELECT count(*) FROM likes WHERE tweet_id = :id"), {"id": tweet_id}
+    )
+    assert result.scalar() == 0
@@ -0,0 +1,53 @@
+import pytest
+
+from app import profiling
+
+
+@pytest.fixture()
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    monkeypatch.setattr(profiling, "ADMIN_API_KEYS", frozenset({"test"}))
+    return tmp_path
+
+
+@pytest.mark.profiling
+@pytest.mark.asyncio
+async def test_admin_request_with_header_is_profiled(async_client, profile_dir):
+    """
+    Запрос администратора с X-Profile сохраняет профиль в формате
+    folded stacks, в стеках есть эндпоинт и зависимость get_current_user
+    """
+    resp = await async_client.get(
+        "/api/tweets", headers={"api-key": "test", "X-Profile": "1"}
+    )
+    assert resp.status_code == 200
+    profile_file = profile_dir / resp.headers["X-Profile-File"]
+    lines = profile_file.read_text().splitlines()
+    assert lines
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == int(
+        resp.headers["X-Profile-Samples"]
+    )
+    stacks = "\n".join(lines)
+    assert "get_current_user" in stacks or "get_twitter_feed" in stacks
+
+
+@pytest.mark.profiling
+@pytest.mark.asyncio
+async def test_profile_header_requires_admin_key(async_client, profile_dir):
+    """Заголовок X-Profile от обычного пользователя игнорируется"""
+    resp = await async_client.get(
+        "/api/tweets", headers={"api-key": "key2", "X-Profile": "1"}
+    )
+    assert resp.status_code == 200
+    assert "X-Profile-File" not in resp.headers
+    assert list(profile_dir.iterdir()) == []
+
+
+@pytest.mark.profiling
+@pytest.mark.asyncio
+async def test_sampled_requests_are_profiled(async_client, profile_dir, monkeypatch):
+    """При PROFILE_SAMPLE_RATE=1 профилируется каждый запрос без заголовка"""
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+    resp = await async_client.get("/api/users/2", headers={"api-key": "key2"})
+    assert resp.status_code == 200
+    assert (profile_dir / resp.headers["X-Profile-File"]).exists()
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import select
+
+from app.models import Users
+from app.query_stats import collect_queries
+
+# Бюджет SQL-выражений на эндпоинт при пустом кэше. Одно выражение из них
+# тратит get_current_user, два - чтение профиля с подписчиками и подписками
+QUERY_BUDGETS = [
+    ("get", "/api/users/me", 3),
+    ("get", "/api/tweets", 7),
+    ("get", "/api/users/2", 6),
+    ("delete", "/api/tweets/9999", 4),
+    ("post", "/api/tweets/9999/likes", 4),
+    ("delete", "/api/tweets/9999/likes", 4),
+    ("delete", "/api/users/999/follow", 4),
+    ("post", "/api/users/999/follow", 4),
+]
+
+
+@pytest.mark.query_budget
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method, url, budget", QUERY_BUDGETS)
+async def test_endpoint_query_budget(async_client, query_budget, method, url, budget):
+    """
+    Число SQL-выражений на эндпоинт не растёт с количеством данных
+    и не превышает бюджет; заголовок X-DB-Query-Count совпадает с подсчётом
+    """
+    with query_budget(budget) as stats:
+        resp = await async_client.request(method, url, headers={"api-key": "test"})
+    assert int(resp.headers["X-DB-Query-Count"]) == stats.statements
+    assert int(resp.headers["X-DB-Rows"]) >= 1
+    assert float(resp.headers["X-DB-Time-Ms"]) > 0
+
+
+@pytest.mark.query_budget
+@pytest.mark.asyncio
+async def test_create_and_delete_tweet_query_budget(async_client, query_budget):
+    """
+    Создание твита - одна вставка, удаление чужого твита (403) не подгружает
+    автора твита отдельным запросом, удаление своего - выборка и удаление
+    """
+    with query_budget(4):
+        resp = await async_client.post(
+            "/api/tweets",
+            headers={"api-key": "test"},
+            json={"tweet_data": "твит для проверки бюджета", "tweet_media_ids": []},
+        )
+    tweet_id = resp.json()["tweet_id"]
+    with query_budget(4):
+        resp = await async_client.delete(
+            f"/api/tweets/{tweet_id}", headers={"api-key": "key2"}
+        )
+    assert resp.status_code == 403
+    with query_budget(5):
+        resp = await async_client.delete(
+            f"/api/tweets/{tweet_id}", headers={"api-key": "test"}
+        )
+    assert resp.status_code == 200
+
+
+@pytest.mark.query_budget
+@pytest.mark.asyncio
+async def test_repeated_statements_detected_as_n_plus_one(test_session):
+    """Одинаковые выражения в цикле распознаются как N+1"""
+    with collect_queries() as stats:
+        for user_id in (1, 2, 3):
+            await test_session.execute(select(Users).where(Users.id == user_id))
+    assert stats.statements == 3
+    assert len(stats.repeated()) == 1
@@ -0,0 +1,165 @@
+import pytest
+
+from app import rate_limit
+from app.query_stats import collect_queries
+from app.rate_limit import Limit, MemoryBackend, RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture()
+def clock():
+    return FakeClock()
+
+
+@pytest.mark.rate_limit
+@pytest.mark.asyncio
+async def test_bucket_spends_burst_and_refills(clock):
+    backend = MemoryBackend(shards=4, clock=clock)
+    limit = Limit(rate=2, burst=3)
+
+    remaining = [(await backend.take([("key:a", limit)])).remaining for _ in range(3)]
+    assert remaining == [2, 1, 0]
+    denied = await backend.take([("key:a", limit)])
+    assert not denied.allowed
+    assert denied.retry_after == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert (await backend.take([("key:a", limit)])).allowed
+    # другой ключ - своя корзина
+    assert (await backend.take([("key:b", limit)])).remaining == 2
+
+
+@pytest.mark.rate_limit
+@pytest.mark.asyncio
+async def test_route_bucket_denial_does_not_spend_key_bucket(clock):
+    """Токены списываются, только если их хватает во всех корзинах запроса"""
+    backend = MemoryBackend(clock=clock)
+    limiter = RateLimiter(
+        backend, default=Limit(1, 5), routes={"GET /api/tweets": Limit(1, 1)}
+    )
+    assert (await limiter.check("key:a", "GET /api/tweets")).allowed
+    denied = await limiter.check("key:a", "GET /api/tweets")
+    assert not denied.allowed
+    assert denied.limit == 1
+
+    # в общей корзине ключа потрачен один токен из пяти
+    other = await limiter.check("key:a", "GET /api/users/me")
+    assert other.allowed
+    assert other.remaining == 3
+
+
+@pytest.mark.rate_limit
+@pytest.mark.asyncio
+async def test_idle_keys_evicted(clock):
+    backend = MemoryBackend(shards=1, idle_ttl=60, clock=clock)
+    limit = Limit(1, 10)
+    for key in ("key:a", "key:b", "key:c"):
+        await backend.take([(key, limit)])
+    assert len(backend) == 3
+
+    clock.now += 30
+    await backend.take([("key:c", limit)])
+    clock.now += 45
+    await backend.take([("key:d", limit)])
+    assert len(backend) == 2  # a и b простаивали дольше idle_ttl
+
+
+@pytest.mark.rate_limit
+@pytest.mark.asyncio
+async def test_throttled_request_makes_no_db_queries(async_client, monkeypatch, clock):
+    """
+    Запрос сверх лимита получает 429 с заголовками RateLimit-* и Retry-After
+    ещё до проверки API key, то есть без запросов к БД
+    """
+    limiter = RateLimiter(
+        MemoryBackend(clock=clock),
+        default=Limit(1, 10),
+        routes={"GET /api/tweets": Limit(0.5, 2)},
+    )
+    monkeypatch.setattr(rate_limit, "rate_limiter", limiter)
+
+    for remaining in ("1", "0"):
+        resp = await async_client.get("/api/tweets", headers={"api-key": "test"})
+        assert resp.status_code == 200
+        assert resp.headers["RateLimit-Limit"] == "2"
+        assert resp.headers["RateLimit-Remaining"] == remaining
+
+    with collect_queries() as stats:
+        resp = await async_client.get("/api/tweets", headers={"api-key": "test"})
+    assert resp.status_code == 429
+    assert resp.json() == {
+        "result": False,
+        "error_type": "TooManyRequests",
+        "error_message": "Rate limit exceeded",
+    }
+    assert resp.headers["Retry-After"] == "2"
+    assert resp.headers["RateLimit-Remaining"] == "0"
+    assert stats.statements == 0
+
+    # другой ключ и другие маршруты того же ключа не затронуты
+    resp = await async_client.get("/api/tweets", headers={"api-key": "key2"})
+    assert resp.status_code == 200
+    resp = await async_client.get("/api/users/me", headers={"api-key": "test"})
+    assert resp.status_code == 200
+    assert resp.headers["RateLimit-Limit"] == "10"
+
+
+@pytest.mark.rate_limit
+@pytest.mark.asyncio
+async def test_bucket_count_is_capped(clock):
+    """Новые корзины вытесняют давно не использованные, а не растят память"""
+    backend = MemoryBackend(shards=2, max_keys=4, clock=clock)
+    limit = Limit(1, 10)
+    for i in range(100):
+        await backend.take([(f"key:{i}", limit)])
+    assert len(backend) <= 4
+
+
+@pytest.mark.rate_limit
+@pytest.mark.asyncio
+async def test_random_keys_share_ip_bucket(async_client, monkeypatch, clock):
+    """
+    Запросы с непроверенными ключами тратят корзину IP клиента, поэтому
+    перебор случайных ключей не даёт каждому новому ключу полную корзину.
+    Ключ, прошедший проверку, ограничивается только своими корзинами
+    """
+    limiter = RateLimiter(
+        MemoryBackend(clock=clock),
+        default=Limit(1, 10),
+        routes={},
+        unverified=Limit(1, 3),
+    )
+    monkeypatch.setattr(rate_limit, "rate_limiter", limiter)
+
+    statuses = []
+    for i in range(4):
+        resp = await async_client.get("/api/users/me", headers={"api-key": f"r{i}"})
+        statuses.append(resp.status_code)
+    assert statuses == [404, 404, 404, 429]
+    assert not limiter.known_keys
+
+    # проверенный ключ с того же адреса корзину IP больше не тратит
+    limiter.remember("key:test")
+    resp = await async_client.get("/api/users/me", headers={"api-key": "test"})
+    assert resp.status_code == 200
+    resp = await async_client.get("/api/users/me", headers={"api-key": "r9"})
+    assert resp.status_code == 429
+
+
+@pytest.mark.rate_limit
+@pytest.mark.asyncio
+async def test_valid_key_is_remembered(async_client, monkeypatch, clock):
+    limiter = RateLimiter(MemoryBackend(clock=clock), max_known_keys=1)
+    monkeypatch.setattr(rate_limit, "rate_limiter", limiter)
+    await async_client.get("/api/users/me", headers={"api-key": "wrong"})
+    assert list(limiter.known_keys) == []
+    await async_client.get("/api/users/me", headers={"api-key": "test"})
+    await async_client.get("/api/users/me", headers={"api-key": "key2"})
+    assert list(limiter.known_keys) == ["key:key2"]
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.main import load_user_profile
+from app.query_stats import collect_queries
+from app.singleflight import SingleFlight
+
+
+@pytest.mark.singleflight
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_computation():
+    """Одновременные вызовы с одним ключом получают результат одного вычисления"""
+    flight = SingleFlight("test")
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"value": 42}
+
+    results = await asyncio.gather(*(flight.do("key", compute) for _ in range(10)))
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.in_flight() == 0
+
+    # результат не кэшируется: следующий вызов вычисляет заново
+    await flight.do("key", compute)
+    assert len(calls) == 2
+
+
+@pytest.mark.singleflight
+@pytest.mark.asyncio
+async def test_different_keys_are_not_coalesced():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def compute(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    results = await asyncio.gather(
+        flight.do(1, lambda: compute(1)), flight.do(2, lambda: compute(2))
+    )
+    assert results == [1, 2]
+    assert sorted(calls) == [1, 2]
+
+
+@pytest.mark.singleflight
+@pytest.mark.asyncio
+async def test_error_propagates_to_all_waiters_and_is_not_kept():
+    """Ошибку вычисления получают все ожидающие, следующий вызов повторяет его"""
+    flight = SingleFlight("test")
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("db is down")
+
+    results = await asyncio.gather(
+        *(flight.do("key", failing) for _ in range(3)), return_exceptions=True
+    )
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+    with pytest.raises(ValueError):
+        await flight.do("key", failing)
+    assert len(calls) == 2
+
+
+@pytest.mark.singleflight
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_others():
+    """Отмена первого запроса (лидера) не прерывает вычисление для остальных"""
+    flight = SingleFlight("test")
+    release = asyncio.Event()
+
+    async def compute():
+        await release.wait()
+        return "done"
+
+    leader = asyncio.create_task(flight.do("key", compute))
+    follower = asyncio.create_task(flight.do("key", compute))
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await follower == "done"
+    assert leader.cancelled()
+
+
+@pytest.mark.singleflight
+@pytest.mark.asyncio
+async def test_computation_cancelled_when_nobody_waits():
+    """Когда отменились все ожидающие, отменяется и вычисление"""
+    flight = SingleFlight("test")
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def compute():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiters = [asyncio.create_task(flight.do("key", compute)) for _ in range(2)]
+    await started.wait()
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert flight.in_flight() == 0
+
+    async def compute_again():
+        return "fresh"
+
+    # новый вызов не получает отмену прошлого вычисления
+    assert await flight.do("key", compute_again) == "fresh"
+
+
+@pytest.mark.singleflight
+@pytest.mark.asyncio
+async def test_concurrent_profile_reads_hit_db_once(test_session):
+    """Одновременные чтения профиля выполняют SQL одного чтения"""
+    session_factory = async_sessionmaker(test_session.bind, expire_on_commit=False)
+    flight = SingleFlight("test_user_profile")
+
+    with collect_queries() as stats:
+        profiles = await asyncio.gather(
+            *(
+                flight.do(2, lambda: load_user_profile(session_factory, 2))
+                for _ in range(10)
+            )
+        )
+
+    with collect_queries() as single:
+        expected = await load_user_profile(session_factory, 2)
+    assert stats.statements == single.statements
+    assert all(profile == expected for profile in profiles)
+    assert expected["id"] == 2
+    assert {user["id"] for user in expected["followers"]} == {1, 3}
+    assert await load_user_profile(session_factory, 100500) is None
@@ -0,0 +1,124 @@
+import pytest
+
+from app import dependencies, slow_queries
+from app.slow_queries import (
+    explain_sql,
+    normalize_statement,
+    parameters_shape,
+    slow_query_log,
+)
+
+
+@pytest.fixture()
+def slow_log(monkeypatch):
+    """Журнал, в который попадает каждое выражение"""
+    monkeypatch.setattr(slow_queries, "SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(dependencies, "ADMIN_API_KEYS", frozenset({"test"}))
+    slow_query_log.clear()
+    yield slow_query_log
+    slow_query_log.clear()
+
+
+@pytest.mark.slow_queries
+def test_statements_normalized_for_deduplication():
+    """IN-списки разной длины и номера плейсхолдеров дают одну запись"""
+    one = "SELECT * FROM tweets\nWHERE user_id IN ($1::INTEGER) AND created_at >= $2"
+    three = (
+        "SELECT * FROM tweets WHERE user_id IN "
+        "($1::INTEGER, $2::INTEGER, $3::INTEGER) AND created_at >= $4"
+    )
+    assert normalize_statement(one) == normalize_statement(three)
+    assert normalize_statement(one) == (
+        "SELECT * FROM tweets WHERE user_id IN (...) AND created_at >= $?"
+    )
+    assert parameters_shape((1, 2, "x")) == "2 x int, 1 x str"
+    assert parameters_shape(()) == "no parameters"
+
+
+@pytest.mark.slow_queries
+def test_explain_analyze_only_for_reads():
+    """
+    ANALYZE выполняет выражение, поэтому запись и блокирующие SELECT
+    получают план без выполнения
+    """
+    read = "SELECT tweets.id FROM tweets WHERE tweets.updated_at > $1"
+    assert explain_sql(read) == f"EXPLAIN (ANALYZE, BUFFERS) {read}"
+    for statement in [
+        "INSERT INTO likes (user_id, tweet_id) VALUES ($1, $2)",
+        "DELETE FROM follows WHERE follower_id = $1",
+        "WITH inserted AS (INSERT INTO follows VALUES ($1, $2) RETURNING *) "
+        "SELECT count(*) FROM inserted",
+        "SELECT user_stats.user_id FROM user_stats FOR UPDATE",
+        "SELECT users.id FROM users FOR KEY SHARE",
+    ]:
+        assert explain_sql(statement) == f"EXPLAIN {statement}"
+
+
+@pytest.mark.slow_queries
+@pytest.mark.asyncio
+async def test_slow_queries_recorded_with_endpoint(async_client, slow_log):
+    """
+    Медленные выражения записываются с эндпоинтом и формой параметров,
+    повторы одного выражения складываются в одну запись
+    """
+    await async_client.get("/api/users/2", headers={"api-key": "key2"})
+    await async_client.get("/api/users/3", headers={"api-key": "key2"})
+
+    resp = await async_client.get(
+        "/api/admin/slow-queries", headers={"api-key": "test"}
+    )
+    assert resp.status_code == 200
+    entries = resp.json()["slow_queries"]
+    by_user_id = [
+        entry
+        for entry in entries
+        if "WHERE users.id = $?" in entry["statement"]
+        and "GET /api/users/{user_id}" in entry["endpoints"]
+    ]
+    assert len(by_user_id) == 1
+    assert by_user_id[0]["count"] == 2
+    assert by_user_id[0]["parameter_shapes"] == ["1 x int"]
+    assert by_user_id[0]["plan"] is None
+
+    resp = await async_client.delete(
+        "/api/admin/slow-queries", headers={"api-key": "test"}
+    )
+    assert resp.json() == {"result": True}
+    assert slow_query_log.report() == []
+
+
+@pytest.mark.slow_queries
+@pytest.mark.asyncio
+async def test_explain_plan_captured_off_request_path(
+    async_client, slow_log, monkeypatch
+):
+    """
+    План EXPLAIN (ANALYZE, BUFFERS) снимается фоновой задачей один раз
+    на выражение, сам EXPLAIN в журнал не попадает
+    """
+    monkeypatch.setattr(slow_queries, "SLOW_QUERY_EXPLAIN", True)
+    resp = await async_client.get("/api/tweets", headers={"api-key": "test"})
+    assert resp.status_code == 200
+    await slow_query_log.wait_for_plans()
+
+    feed = next(
+        entry
+        for entry in slow_query_log.report()
+        if entry["statement"].startswith("SELECT tweets.id")
+    )
+    assert "tweets.user_id IN (...)" in feed["statement"]
+    assert "actual time" in feed["plan"]
+    assert "Buffers" in feed["plan"] or "Planning" in feed["plan"]
+    assert not any(
+        entry["statement"].startswith("EXPLAIN") for entry in slow_query_log.report()
+    )
+
+
+@pytest.mark.slow_queries
+@pytest.mark.asyncio
+async def test_slow_queries_require_admin(async_client):
+    """Журнал медленных запросов недоступен обычному пользователю"""
+    resp = await async_client.get(
+        "/api/admin/slow-queries", headers={"api-key": "key2"}
+    )
+    assert resp.status_code == 403
@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+from app import stale_cache
+from app.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from app.database import get_session
+from app.dependencies import auth_cache
+from app.main import app
+from app.stale_cache import stale_responses
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture()
+def circuit(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    monkeypatch.setattr(stale_cache, "db_circuit", breaker)
+    yield breaker
+
+
+@pytest.fixture()
+def database_down(monkeypatch):
+    """Любая сессия БД не открывается, как при недоступном Postgres"""
+
+    def _down():
+        async def _broken_session():
+            raise ConnectionRefusedError("connection refused")
+            yield
+
+        monkeypatch.setitem(app.dependency_overrides, get_session, _broken_session)
+
+    return _down
+
+
+@pytest.mark.stale_cache
+def test_circuit_breaker_states():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow() and breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    clock.now += 10
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()  # один пробный запрос
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+@pytest.mark.stale_cache
+@pytest.mark.asyncio
+async def test_stale_served_when_database_fails(async_client, circuit, database_down):
+    """
+    При ошибках БД лента и профиль отдаются из последнего удачного ответа
+    с X-Degraded, после порога ошибок автомат размыкается и остальные
+    запросы быстро получают 503
+    """
+    headers = {"api-key": "test"}
+    fresh = await async_client.get("/api/users/me", headers=headers)
+    assert fresh.status_code == 200
+    assert "X-Degraded" not in fresh.headers
+
+    # без кэша API key запрос идёт в БД
+    await auth_cache.invalidate()
+    database_down()
+    resp = await async_client.get("/api/users/me", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["X-Degraded"] == "error"
+    assert resp.json() == fresh.json()
+
+    with pytest.raises(ConnectionRefusedError):
+        await async_client.post("/api/tweets/11/likes", headers=headers)
+    assert circuit.state == OPEN
+
+    resp = await async_client.get("/api/users/me", headers=headers)
+    assert resp.headers["X-Degraded"] == "circuit-open"
+    assert resp.json() == fresh.json()
+    # сохранённые ответы отдельны для каждого API key
+    resp = await async_client.get("/api/users/me", headers={"api-key": "key2"})
+    assert resp.status_code == 503
+    resp = await async_client.post("/api/tweets/11/likes", headers=headers)
+    assert resp.status_code == 503
+    assert resp.headers["X-Degraded"] == "circuit-open"
+    assert int(resp.headers["Retry-After"]) > 0
+    assert resp.json()["error_type"] == "ServiceUnavailable"
+
+
+@pytest.mark.stale_cache
+@pytest.mark.asyncio
+async def test_stale_served_while_slow_refresh_runs(
+    async_client, circuit, test_session, monkeypatch
+):
+    """
+    Медленная БД: после STALE_DEADLINE отдаётся сохранённый ответ, обновление
+    продолжается в фоне, а запросы во время него не идут в БД
+    """
+    headers = {"api-key": "key2"}
+    fresh = await async_client.get("/api/users/2", headers=headers)
+    assert fresh.status_code == 200
+    stored_at = (await stale_responses.get("key2|/api/users/2?")).stored_at
+    await auth_cache.invalidate()
+
+    async def _slow_session():
+        await asyncio.sleep(0.3)
+        yield test_session
+
+    monkeypatch.setattr(stale_cache, "STALE_DEADLINE", 0.05)
+    monkeypatch.setitem(app.dependency_overrides, get_session, _slow_session)
+
+    resp = await async_client.get("/api/users/2", headers=headers)
+    assert resp.headers["X-Degraded"] == "timeout"
+    assert "Age" in resp.headers
+    resp = await async_client.get("/api/users/2", headers=headers)
+    assert resp.headers["X-Degraded"] == "refreshing"
+    assert resp.json() == fresh.json()
+
+    await stale_responses.wait_for_refreshes()
+    assert not stale_responses.refreshing
+    entry = await stale_responses.get("key2|/api/users/2?")
+    assert entry.stored_at > stored_at
+    assert circuit.state == CLOSED
+
+
+@pytest.mark.stale_cache
+@pytest.mark.asyncio
+async def test_only_request_reaching_database_closes_circuit(async_client, monkeypatch):
+    """
+    Пробный запрос, ответивший из кэша без SQL, не замыкает автомат:
+    о доступности БД говорит только выполненное выражение
+    """
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    monkeypatch.setattr(stale_cache, "db_circuit", breaker)
+    headers = {"api-key": "test"}
+    # API key в кэше: запрос трендов не обращается к БД
+    await async_client.get("/api/trends", headers=headers)
+
+    breaker.record_failure()
+    clock.now += 10
+    resp = await async_client.get("/api/trends", headers=headers)
+    assert resp.status_code == 200
+    assert breaker.state == HALF_OPEN
+
+    clock.now += 10
+    resp = await async_client.delete("/api/tweets/9999", headers=headers)
+    assert resp.status_code == 404
+    assert breaker.state == CLOSED
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+from app.models import Follows, Users, UserStats
+from app.query_stats import collect_queries
+from app.suggestions import adjacency, refresh_suggestions, score_users
+
+
+@pytest.mark.suggestions
+def test_score_users_ranks_friends_of_friends():
+    """
+    0 подписан на 1 и 2; 1 и 2 подписаны на 3, 1 - на 4; 5 подписан на 0.
+    Для 0: 3 - две общие подписки, 4 - одна, 5 подписан на самого 0
+    """
+    follows = np.array([(0, 1), (0, 2), (1, 3), (2, 3), (1, 4), (5, 0), (3, 0)])
+    graph = adjacency(follows[:, 0], follows[:, 1], 6)
+    scored = score_users(
+        graph, graph.T.tocsr(), np.array([0]), limit=10, follows_you_weight=0.5
+    )
+    assert scored.suggested_ids.tolist() == [3, 4, 5]
+    assert scored.ranks.tolist() == [0, 1, 2]
+    assert scored.mutual_counts.tolist() == [2, 1, 0]
+    assert scored.follows_you.tolist() == [True, False, True]
+    assert scored.scores.tolist() == [2.5, 1.0, 0.5]
+
+    # не больше limit на пользователя; сам пользователь и его подписки исключены
+    scored = score_users(graph, graph.T.tocsr(), np.array([0, 1]), limit=1)
+    assert list(zip(scored.user_ids.tolist(), scored.suggested_ids.tolist())) == [
+        (0, 3),
+        (1, 0),
+    ]
+
+
+@pytest.mark.suggestions
+@pytest.mark.asyncio
+async def test_suggestions_endpoint_and_incremental_refresh(async_client, test_session):
+    """
+    Новый пользователь, на которого подписаны подписки пользователя 1,
+    появляется в его рекомендациях; инкрементальный пересчёт подхватывает
+    новые подписки, а подписка через API сразу убирает кандидата
+    """
+    engine = test_session.bind
+    candidate = Users(name="candidate", api_key="candidate")
+    test_session.add(candidate)
+    await test_session.commit()
+    test_session.add(Follows(follower_id=2, followed_id=candidate.id))
+    await test_session.commit()
+    headers = {"api-key": "test"}
+
+    def suggested(resp):
+        return {user["id"]: user for user in resp.json()["users"]}
+
+    try:
+        await refresh_suggestions(engine, full=True)
+        with collect_queries() as stats:
+            resp = await async_client.get("/api/users/me/suggestions", headers=headers)
+        assert resp.status_code == 200
+        assert suggested(resp)[candidate.id]["mutual_count"] == 1
+        # auth, рекомендации, подписки и исключения холодного пользователя
+        assert stats.statements <= 4
+
+        # подписка через API отмечает изменение графа
+        resp = await async_client.post(
+            f"/api/users/{candidate.id}/follow", headers={"api-key": "key3"}
+        )
+        assert resp.status_code == 200
+        changed_at = await test_session.scalar(
+            select(UserStats.graph_changed_at).where(UserStats.user_id == 3)
+        )
+        await test_session.commit()
+        assert changed_at is not None
+        # пересчитываются изменённые пользователи и их подписчики (1 и 2)
+        assert await refresh_suggestions(engine) >= 3
+        resp = await async_client.get("/api/users/me/suggestions", headers=headers)
+        assert suggested(resp)[candidate.id]["mutual_count"] == 2
+        # повторный пересчёт ничего не находит
+        assert await refresh_suggestions(engine) == 0
+
+        await async_client.post(f"/api/users/{candidate.id}/follow", headers=headers)
+        resp = await async_client.get("/api/users/me/suggestions", headers=headers)
+        assert candidate.id not in suggested(resp)
+    finally:
+        await test_session.delete(candidate)
+        await test_session.commit()
@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+from app import dependencies, tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+TRACEPARENT = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+
+@pytest.fixture()
+def traces(monkeypatch):
+    exporter = tracing.memory_exporter
+    exporter.traces.clear()
+    monkeypatch.setattr(tracing, "exporters", [exporter])
+    yield exporter
+    exporter.traces.clear()
+
+
+@pytest.mark.tracing
+@pytest.mark.asyncio
+async def test_sampled_traceparent_keeps_feed_trace(async_client, traces):
+    """
+    Запрос с sampled traceparent сохраняется с тем же trace_id, а в трассе
+    есть спаны авторизации, SQL, загрузки ORM, сборки и кодирования ответа
+    """
+    resp = await async_client.get(
+        "/api/tweets", headers={"api-key": "test", "traceparent": TRACEPARENT}
+    )
+    assert resp.status_code == 200
+    assert resp.headers["traceparent"].startswith(f"00-{TRACE_ID}-")
+    assert resp.headers["traceparent"].endswith("-01")
+
+    [trace] = traces.find(TRACE_ID)
+    assert trace["name"] == "GET /api/tweets"
+    spans = {span["span_id"]: span for span in trace["spans"]}
+    names = {span["name"] for span in trace["spans"]}
+    assert {"auth", "sql", "endpoint", "orm.load", "response.build"} <= names
+    assert "response.encode" in names
+
+    root = trace["spans"][0]
+    assert root["parent_id"] == "00f067aa0ba902b7"
+    # SQL ленты вложен в orm.load, тот - в эндпоинт
+    orm_load = next(
+        span
+        for span in trace["spans"]
+        if span["name"] == "orm.load" and span["attributes"]["entity"] == "Tweets"
+    )
+    feed_sql = [
+        span
+        for span in trace["spans"]
+        if span["name"] == "sql" and span["parent_id"] == orm_load["span_id"]
+    ]
+    assert "FROM tweets" in feed_sql[0]["attributes"]["statement"]
+    assert spans[orm_load["parent_id"]]["name"] == "endpoint"
+    assert orm_load["self_ms"] <= orm_load["duration_ms"]
+
+
+@pytest.mark.tracing
+@pytest.mark.asyncio
+async def test_tail_sampling_keeps_only_slow_traces(async_client, traces, monkeypatch):
+    """Быстрые запросы без флага sampled не сохраняются, медленные - сохраняются"""
+    monkeypatch.setattr(tracing, "TRACE_SLOW_MS", 60_000)
+    resp = await async_client.get("/api/users/me", headers={"api-key": "test"})
+    assert resp.headers["traceparent"].endswith("-00")
+    assert traces.find() == []
+
+    monkeypatch.setattr(tracing, "TRACE_SLOW_MS", 0)
+    resp = await async_client.get("/api/users/me", headers={"api-key": "test"})
+    trace_id = resp.headers["traceparent"].split("-")[1]
+    assert [trace["trace_id"] for trace in traces.find()] == [trace_id]
+
+
+@pytest.mark.tracing
+def test_parse_traceparent():
+    """Некорректные заголовки traceparent игнорируются"""
+    assert tracing.parse_traceparent(TRACEPARENT) == (
+        TRACE_ID,
+        "00f067aa0ba902b7",
+        True,
+    )
+    assert tracing.parse_traceparent(f"00-{TRACE_ID}-00f067aa0ba902b7-00")[2] is False
+    assert tracing.parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+    assert tracing.parse_traceparent("garbage") is None
+    assert tracing.parse_traceparent(None) is None
+
+
+@pytest.mark.tracing
+@pytest.mark.asyncio
+async def test_file_exporter_and_admin_endpoint(
+    async_client, traces, tmp_path, monkeypatch
+):
+    """
+    Трассы пишутся в файл построчно в JSON и доступны администратору
+    через /api/admin/traces, обычному пользователю - 403
+    """
+    trace_file = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(
+        tracing, "exporters", [traces, tracing.FileExporter(str(trace_file))]
+    )
+    monkeypatch.setattr(dependencies, "ADMIN_API_KEYS", frozenset({"test"}))
+    await async_client.get(
+        "/api/users/2", headers={"api-key": "key2", "traceparent": TRACEPARENT}
+    )
+    [line] = trace_file.read_text().splitlines()
+    assert json.loads(line)["trace_id"] == TRACE_ID
+
+    resp = await async_client.get(
+        "/api/admin/traces", params={"trace_id": TRACE_ID}, headers={"api-key": "test"}
+    )
+    assert resp.status_code == 200
+    assert resp.json()["traces"][0]["name"] == "GET /api/users/{user_id}"
+
+    resp = await async_client.get("/api/admin/traces", headers={"api-key": "key2"})
+    assert resp.status_code == 403
@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.models import TrendBuckets, TweetHashtags, TweetMentions
+from app.query_stats import collect_queries
+from app.trends import (
+    TrendCounters,
+    extract_hashtags,
+    extract_mentions,
+    hour_start,
+    trend_counters,
+)
+
+
+@pytest.fixture
+async def empty_trend_buckets(test_session):
+    """Тесты начинают и заканчивают с пустой trend_buckets"""
+    await test_session.execute(delete(TrendBuckets))
+    await test_session.commit()
+    yield
+    await test_session.execute(delete(TrendBuckets))
+    await test_session.commit()
+
+
+@pytest.mark.trends
+def test_extract_hashtags_and_mentions():
+    text = "#Python и #кофе#утро, снова #python; #2026 mail@kate.dev @Kate @kate_2"
+    assert extract_hashtags(text) == ["python", "кофе"]
+    assert extract_mentions(text) == ["kate", "kate_2"]
+    assert extract_hashtags("#" + "a" * 101) == []
+
+
+@pytest.mark.trends
+def test_counters_decay_roll_and_expire():
+    """
+    Старые твиты весят меньше, минуты старше часа сворачиваются в часы,
+    часы вне окна удаляются; top, обновлённый по изменившимся хештегам,
+    совпадает с полным отбором
+    """
+    counters = TrendCounters(top_k=2, window_hours=2, half_life=3600)
+    start = hour_start(counters.origin)
+
+    counters.advance(start)
+    counters.set_minute(start, {"old": 4, "rare": 1})
+    counters.update_top()
+    assert [trend["tag"] for trend in counters.trends(10, now=start)] == [
+        "old",
+        "rare",
+    ]
+
+    later = start + timedelta(hours=1)
+    counters.advance(later)
+    counters.set_minute(later, {"new": 3})
+    counters.update_top()
+    # 4 твита час назад весят как 2 твита сейчас
+    trends = counters.trends(10, now=later)
+    assert [(trend["tag"], trend["score"]) for trend in trends] == [
+        ("new", pytest.approx(3)),
+        ("old", pytest.approx(2)),
+    ]
+    # минута start свёрнута в час: за последний час твитов "old" нет
+    assert trends[1]["tweets_last_hour"] == 0
+    assert trends[1]["tweets_in_window"] == 4
+    assert set(counters.hours) == {start}
+
+    # рост счёта "rare" поднимает его в top без полного отбора
+    counters.set_minute(later, {"new": 3, "rare": 9})
+    counters.update_top()
+    full = sorted(counters.scores, key=lambda tag: -counters.scores[tag])[:2]
+    assert [tag for tag, _ in counters.top] == full == ["rare", "new"]
+
+    # час start выходит из двухчасового окна
+    counters.advance(start + timedelta(hours=3))
+    counters.update_top()
+    assert "old" not in counters.scores
+    assert [trend["tag"] for trend in counters.trends(10)] == ["rare", "new"]
+
+
+@pytest.mark.trends
+@pytest.mark.asyncio
+async def test_tweet_hashtags_mentions_and_trends(
+    async_client, test_session, empty_trend_buckets
+):
+    """
+    Хештеги и упоминания твита записываются вместе с ним и удаляются
+    вместе с ним; тренды обновляются сбросом счётчиков и отдаются из памяти
+    """
+    engine = test_session.bind
+    headers = {"api-key": "test"}
+
+    async def post(text: str) -> int:
+        resp = await async_client.post(
+            "/api/tweets",
+            headers=headers,
+            json={"tweet_data": text, "tweet_media_ids": []},
+        )
+        return resp.json()["tweet_id"]
+
+    with collect_queries() as stats:
+        first = await post("Учу #Python и пью #кофе, спасибо @Kate #python")
+    # хештеги и упоминания - одно выражение в транзакции твита
+    assert sum("tweet_hashtags" in sql for sql in stats.sql) == 1
+    second = await post("снова #python")
+    tags = await test_session.scalars(
+        select(TweetHashtags.tag).where(TweetHashtags.tweet_id == first)
+    )
+    assert set(tags) == {"python", "кофе"}
+    mentioned = await test_session.scalars(
+        select(TweetMentions.user_id).where(TweetMentions.tweet_id == first)
+    )
+    assert list(mentioned) == [2]
+    await test_session.commit()
+
+    # до сброса счётчиков трендов нет
+    resp = await async_client.get("/api/trends", headers=headers)
+    assert resp.json() == {"result": True, "trends": []}
+
+    await trend_counters.flush(engine)
+    await trend_counters.refresh(engine)
+    with collect_queries() as stats:
+        resp = await async_client.get("/api/trends?limit=5", headers=headers)
+    assert not any("tweets" in sql or "trend_buckets" in sql for sql in stats.sql)
+    trends = resp.json()["trends"]
+    assert [(trend["tag"], trend["tweets_last_hour"]) for trend in trends] == [
+        ("python", 2),
+        ("кофе", 1),
+    ]
+    assert trends[0]["score"] > trends[1]["score"]
+
+    # другой процесс видит тренды после своего обновления из БД
+    other = TrendCounters()
+    await other.refresh(engine)
+    assert [trend["tag"] for trend in other.trends(5)] == ["python", "кофе"]
+
+    for tweet_id in (first, second):
+        resp = await async_client.delete(f"/api/tweets/{tweet_id}", headers=headers)
+        assert resp.status_code == 200
+    left = await test_session.scalars(
+        select(TweetHashtags.tweet_id).where(TweetHashtags.tweet_id.in_([first]))
+    )
+    assert list(left) == []
+    left = await test_session.scalars(
+        select(TweetMentions.tweet_id).where(TweetMentions.tweet_id == first)
+    )
+    assert list(left) == []
+    await test_session.commit()
+
+
+@pytest.mark.trends
+@pytest.mark.asyncio
+async def test_negative_trends_limit(async_client):
+    resp = await async_client.get("/api/trends?limit=0", headers={"api-key": "test"})
+    assert resp.status_code == 422
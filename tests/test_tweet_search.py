@@ -0,0 +1,183 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import tweet_search
+from app.models import Tweets, Users
+from app.query_stats import collect_queries
+from app.tweet_search import search_tweets
+
+
+@pytest.fixture
+async def author(test_session):
+    """Пользователь, на которого никто не подписан, с твитами на двух языках"""
+    user = Users(name="search author", api_key="search_author")
+    test_session.add(user)
+    await test_session.commit()
+    now = datetime.now(timezone.utc)
+    contents = [
+        "Пишу код на Python каждый день",
+        "Running postgres in production: a < b & c",
+        "кофе и код с утра",
+        "совсем о другом",
+    ]
+    tweets = [
+        Tweets(content=content, user_id=user.id, created_at=now - timedelta(minutes=i))
+        for i, content in enumerate(contents)
+    ]
+    test_session.add_all(tweets)
+    await test_session.commit()
+    yield user, [tweet.id for tweet in tweets]
+    await test_session.delete(user)
+    await test_session.commit()
+
+
+async def search(async_client, query: str, api_key: str = "test"):
+    resp = await async_client.get(
+        f"/api/tweets/search?{query}", headers={"api-key": api_key}
+    )
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+@pytest.mark.tweet_search
+@pytest.mark.asyncio
+async def test_search_matches_both_languages_with_snippets(async_client, author):
+    user, tweet_ids = author
+    # русская морфология: "кода" находит "код"
+    with collect_queries() as stats:
+        found = await search(async_client, "q=кода")
+    assert [tweet["id"] for tweet in found["tweets"]] == [tweet_ids[0], tweet_ids[2]]
+    assert "<mark>код</mark>" in found["tweets"][0]["snippet"]
+    assert found["tweets"][0]["author"] == {"id": user.id, "name": user.name}
+    assert found["next_cursor"] is None
+    # поиск, подсветка и авторы - одно выражение (плюс auth и исключения)
+    assert sum("ts_headline" in sql for sql in stats.sql) == 1
+    assert stats.statements <= 3
+
+    # английская морфология и экранирование текста во фрагменте
+    found = await search(async_client, "q=run")
+    assert [tweet["id"] for tweet in found["tweets"]] == [tweet_ids[1]]
+    snippet = found["tweets"][0]["snippet"]
+    assert "<mark>Running</mark>" in snippet
+    assert "a &lt; b &amp; c" in snippet
+
+    # синтаксис websearch: исключение слова
+    found = await search(async_client, "q=код -кофе")
+    assert [tweet["id"] for tweet in found["tweets"]] == [tweet_ids[0]]
+
+
+@pytest.mark.tweet_search
+@pytest.mark.asyncio
+async def test_search_keyset_pages_are_stable(async_client, test_session, author):
+    """
+    Страницы по (rank, created_at, id) не повторяются и не пропускают твиты,
+    а твит, созданный после первой страницы, в выдачу не попадает
+    """
+    user, _ = author
+    now = datetime.now(timezone.utc)
+    tweets = [
+        Tweets(
+            content="zebrafish " * (1 + i % 2) + str(i),
+            user_id=user.id,
+            created_at=now - timedelta(hours=1, minutes=i),
+        )
+        for i in range(5)
+    ]
+    test_session.add_all(tweets)
+    await test_session.commit()
+
+    pages = [await search(async_client, "q=zebrafish&limit=2")]
+    test_session.add(Tweets(content="zebrafish zebrafish new", user_id=user.id))
+    await test_session.commit()
+    while pages[-1]["next_cursor"]:
+        pages.append(
+            await search(
+                async_client, f"q=zebrafish&limit=2&cursor={pages[-1]['next_cursor']}"
+            )
+        )
+    found = [tweet for page in pages for tweet in page["tweets"]]
+    assert [len(page["tweets"]) for page in pages] == [2, 2, 1]
+    assert sorted(tweet["id"] for tweet in found) == sorted(t.id for t in tweets)
+    ranks = [tweet["rank"] for tweet in found]
+    assert ranks == sorted(ranks, reverse=True)
+
+
+@pytest.mark.tweet_search
+@pytest.mark.asyncio
+async def test_search_falls_back_to_index_when_recent_scan_is_short(
+    test_session, author
+):
+    """
+    Если среди scan_limit новых твитов мало совпадений, поиск повторяется по
+    GIN-индексу и находит то же, что и полный просмотр окна
+    """
+    _, tweet_ids = author
+    with collect_queries() as stats:
+        full = await search_tweets(test_session, "код", limit=10)
+    assert stats.statements == 1
+    with collect_queries() as stats:
+        short = await search_tweets(test_session, "код", limit=10, scan_limit=1)
+    await test_session.commit()
+    assert stats.statements == 2
+    assert [tweet["id"] for tweet in short["tweets"]] == [tweet_ids[0], tweet_ids[2]]
+    assert short["tweets"] == full["tweets"]
+
+
+@pytest.mark.tweet_search
+@pytest.mark.asyncio
+async def test_search_next_pages_reuse_first_page_method(
+    test_session, author, monkeypatch
+):
+    """
+    Способ поиска кандидатов выбирается на первой странице и записывается в
+    курсор: следующие страницы, включая пустую последнюю, - одно выражение
+    """
+    user, tweet_ids = author
+    monkeypatch.setattr(tweet_search, "TWEET_SEARCH_CANDIDATES", 2)
+    # среди трёх новых твитов автора оба совпадения: хватает обхода новых
+    for scan_limit in (3, 1):
+        cursor = None
+        found = []
+        for page in range(3):
+            with collect_queries() as stats:
+                result = await search_tweets(
+                    test_session,
+                    "код",
+                    limit=1,
+                    cursor=cursor,
+                    author_ids=[user.id],
+                    scan_limit=scan_limit,
+                )
+            await test_session.commit()
+            # с scan_limit=1 первая страница повторяется по GIN-индексу
+            assert stats.statements == (2 if page == 0 and scan_limit == 1 else 1)
+            found += [tweet["id"] for tweet in result["tweets"]]
+            cursor = result["next_cursor"]
+            if cursor is None:
+                break
+        assert found == [tweet_ids[0], tweet_ids[2]]
+
+
+@pytest.mark.tweet_search
+@pytest.mark.asyncio
+async def test_search_network_filter(async_client, author):
+    """С network=true ищется только по своим твитам и твитам подписок"""
+    _, tweet_ids = author
+    found = await search(async_client, "q=кофе")
+    assert tweet_ids[2] in [tweet["id"] for tweet in found["tweets"]]
+    found = await search(async_client, "q=кофе&network=true")
+    assert tweet_ids[2] not in [tweet["id"] for tweet in found["tweets"]]
+
+
+@pytest.mark.tweet_search
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "query, status_code",
+    [("q=", 422), ("q=код&limit=0", 422), ("q=код&cursor=broken", 400)],
+)
+async def test_negative_search_params(async_client, query, status_code):
+    resp = await async_client.get(
+        f"/api/tweets/search?{query}", headers={"api-key": "test"}
+    )
+    assert resp.status_code == status_code
@@ -0,0 +1,165 @@
+import pytest
+from sqlalchemy import text
+
+from app.models import Users
+from app.query_stats import collect_queries
+from app.user_search import PrefixCache, SearchResult, select_users_matching
+
+
+@pytest.mark.user_search
+def test_prefix_cache_derives_longer_queries():
+    """
+    Полный результат короткого запроса отвечает на его продолжения того же
+    вида; неполный или другого вида - нет
+    """
+    cache = PrefixCache(max_entries=10)
+    users = ((1, "Alexander", 5), (2, "Kalex", 9), (3, "Alena", 7))
+    cache.store("ale", SearchResult(users=users, complete=True))
+
+    result = cache.lookup("alex")
+    # начало имени выше, дальше - по числу подписчиков
+    assert [user[0] for user in result.users] == [1, 2]
+    assert cache.lookup("alexa").users == ((1, "Alexander", 5),)
+
+    cache.store("bo", SearchResult(users=((4, "Bob", 1),), complete=False))
+    assert cache.lookup("bob") is None
+    # префиксный запрос из двух символов не отвечает на поиск подстроки
+    cache.store("ka", SearchResult(users=((2, "Kalex", 9),), complete=True))
+    assert cache.lookup("kal") is None
+    cache.store("k", SearchResult(users=((2, "Kalex", 9),), complete=True))
+    assert cache.lookup("kx").users == ()
+
+
+@pytest.mark.user_search
+def test_prefix_cache_expires_and_evicts():
+    now = [0.0]
+    cache = PrefixCache(max_entries=2, ttl=10, clock=lambda: now[0])
+    for query in ("a", "b", "c"):
+        cache.store(query, SearchResult(users=(), complete=False))
+    assert cache.lookup("a") is None
+    now[0] = 11
+    assert cache.lookup("b") is None
+
+
+@pytest.fixture
+async def named_users(async_client, test_session):
+    """Qzx-пользователи; у "Big qzxa" больше всех подписчиков"""
+    users = [
+        Users(name="qzxa one", api_key="qzx1"),
+        Users(name="Big qzxa", api_key="qzx2"),
+        Users(name="qzxb two", api_key="qzx3"),
+        Users(name="100% qzx", api_key="qzx4"),
+    ]
+    test_session.add_all(users)
+    await test_session.commit()
+    for api_key in ("test", "key2"):
+        resp = await async_client.post(
+            f"/api/users/{users[1].id}/follow", headers={"api-key": api_key}
+        )
+        assert resp.status_code == 200
+    yield users
+    for user in users:
+        await test_session.delete(user)
+    await test_session.commit()
+
+
+@pytest.mark.user_search
+@pytest.mark.asyncio
+async def test_search_ranks_and_serves_prefixes_from_cache(async_client, named_users):
+    one, big, two, percent = named_users
+    headers = {"api-key": "test"}
+
+    def found(resp):
+        return [user["id"] for user in resp.json()["users"]]
+
+    resp = await async_client.get("/api/users/search?q=QZX", headers=headers)
+    assert resp.status_code == 200
+    # имена, начинающиеся с запроса, выше; дальше - по числу подписчиков
+    assert found(resp)[:2] == [one.id, two.id]
+    assert found(resp)[2:] == [big.id, percent.id]
+    assert resp.json()["users"][2]["followers_count"] == 2
+
+    # продолжения полного результата отдаются без БД
+    with collect_queries() as stats:
+        resp = await async_client.get("/api/users/search?q=qzxa", headers=headers)
+        assert found(resp) == [one.id, big.id]
+        resp = await async_client.get(
+            "/api/users/search?q=qzx&limit=1", headers=headers
+        )
+        assert found(resp) == [one.id]
+    assert stats.statements == 0
+
+    # символы LIKE ищутся как есть
+    resp = await async_client.get("/api/users/search?q=0%25%20q", headers=headers)
+    assert found(resp) == [percent.id]
+
+
+@pytest.mark.user_search
+@pytest.mark.asyncio
+@pytest.mark.parametrize("query", ["q=", "q=a&limit=0", "limit=5"])
+async def test_negative_search_params(async_client, query):
+    resp = await async_client.get(
+        f"/api/users/search?{query}", headers={"api-key": "test"}
+    )
+    assert resp.status_code == 422
+
+
+@pytest.mark.user_search
+@pytest.mark.asyncio
+async def test_search_uses_trigram_index(test_session):
+    """Поиск подстроки идёт по GIN-индексу pg_trgm"""
+    available = await test_session.scalar(
+        text("SELECT count(*) FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    )
+    await test_session.commit()
+    if not available:
+        pytest.skip("pg_trgm is not available")
+
+    engine = test_session.bind
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            await conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_users_name_trgm "
+                    "ON users USING gin (name gin_trgm_ops)"
+                )
+            )
+            await conn.execute(text("SET LOCAL enable_seqscan = off"))
+            sql = select_users_matching("alex", 51).compile(
+                engine.sync_engine, compile_kwargs={"literal_binds": True}
+            )
+            plan = (await conn.execute(text(f"EXPLAIN {sql}"))).scalars().all()
+            assert "ix_users_name_trgm" in "\n".join(plan)
+        finally:
+            await transaction.rollback()
+
+
+@pytest.mark.user_search
+@pytest.mark.asyncio
+async def test_short_prefix_uses_btree_index(async_client, test_session, named_users):
+    """
+    Префикс короче трёх символов ищется по btree-индексу
+    ix_users_name_lower_pattern, а не по триграммам
+    """
+    one, big, two, percent = named_users
+    resp = await async_client.get("/api/users/search?q=QZ", headers={"api-key": "test"})
+    # все имена начинаются с запроса: порядок - по числу подписчиков
+    assert [user["id"] for user in resp.json()["users"]] == [one.id, two.id]
+    resp = await async_client.get("/api/users/search?q=10", headers={"api-key": "test"})
+    assert [user["id"] for user in resp.json()["users"]] == [percent.id]
+
+    engine = test_session.bind
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            await conn.execute(text("SET LOCAL enable_seqscan = off"))
+            for query in ("a", "q%"):
+                sql = select_users_matching(query, 51).compile(
+                    engine.sync_engine, compile_kwargs={"literal_binds": True}
+                )
+                plan = (await conn.execute(text(f"EXPLAIN {sql}"))).scalars().all()
+                assert "ix_users_name_lower_pattern" in "\n".join(plan)
+        finally:
+            await transaction.rollback()
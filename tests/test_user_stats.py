@@ -0,0 +1,151 @@
+import pytest
+from sqlalchemy import delete, func, select, update
+
+from app.models import Follows, Tweets, Users, UserStats
+from app.user_stats import reconcile_user_stats
+
+
+async def stats_of(session, user_id: int) -> tuple:
+    result = await session.execute(
+        select(
+            UserStats.followers_count,
+            UserStats.following_count,
+            UserStats.tweets_count,
+        ).where(UserStats.user_id == user_id)
+    )
+    await session.commit()
+    return tuple(result.one())
+
+
+async def actual_stats_of(session, user_id: int) -> tuple:
+    followers = await session.scalar(
+        select(func.count()).where(Follows.followed_id == user_id)
+    )
+    following = await session.scalar(
+        select(func.count()).where(Follows.follower_id == user_id)
+    )
+    tweets = await session.scalar(select(func.count()).where(Tweets.user_id == user_id))
+    await session.commit()
+    return followers, following, tweets
+
+
+@pytest.fixture
+async def reconciled(test_session):
+    """Тесты начинают со сверенных счётчиков: другие тесты пишут в обход API"""
+    await reconcile_user_stats(test_session.bind)
+
+
+@pytest.mark.user_stats
+@pytest.mark.asyncio
+async def test_follow_and_unfollow_update_counters(
+    async_client, test_session, reconciled
+):
+    """Подписка и отписка меняют счётчики обоих пользователей"""
+    before_1 = await stats_of(test_session, 1)
+    before_2 = await stats_of(test_session, 2)
+
+    resp = await async_client.delete("/api/users/2/follow", headers={"api-key": "test"})
+    assert resp.status_code == 200
+    assert await stats_of(test_session, 1) == (
+        before_1[0],
+        before_1[1] - 1,
+        before_1[2],
+    )
+    assert await stats_of(test_session, 2) == (
+        before_2[0] - 1,
+        before_2[1],
+        before_2[2],
+    )
+    profile = (
+        await async_client.get("/api/users/2", headers={"api-key": "test"})
+    ).json()["user"]
+    assert profile["followers_count"] == before_2[0] - 1
+
+    # повторная отписка ничего не удаляет и счётчики не трогает
+    resp = await async_client.delete("/api/users/2/follow", headers={"api-key": "test"})
+    assert resp.status_code == 404
+
+    resp = await async_client.post("/api/users/2/follow", headers={"api-key": "test"})
+    assert resp.status_code == 200
+    assert await stats_of(test_session, 1) == before_1
+    assert await stats_of(test_session, 2) == before_2
+
+
+@pytest.mark.user_stats
+@pytest.mark.asyncio
+async def test_create_and_delete_tweet_update_counter(
+    async_client, test_session, reconciled
+):
+    headers = {"api-key": "key3"}
+    followers, following, tweets = await stats_of(test_session, 3)
+    resp = await async_client.post(
+        "/api/tweets",
+        headers=headers,
+        json={"tweet_data": "твит для счётчика", "tweet_media_ids": []},
+    )
+    tweet_id = resp.json()["tweet_id"]
+    assert await stats_of(test_session, 3) == (followers, following, tweets + 1)
+    me = (await async_client.get("/api/users/me", headers=headers)).json()["user"]
+    assert me["tweets_count"] == tweets + 1
+
+    resp = await async_client.delete(f"/api/tweets/{tweet_id}", headers=headers)
+    assert resp.status_code == 200
+    assert await stats_of(test_session, 3) == (followers, following, tweets)
+
+
+@pytest.mark.user_stats
+@pytest.mark.asyncio
+async def test_reconciliation_fixes_drift_in_batches(test_session):
+    """Сверка пачками по одному пользователю исправляет разошедшиеся счётчики"""
+    await test_session.execute(
+        update(UserStats)
+        .where(UserStats.user_id.in_([1, 3]))
+        .values(followers_count=100, tweets_count=-5)
+    )
+    await test_session.execute(delete(UserStats).where(UserStats.user_id == 2))
+    await test_session.commit()
+
+    corrected = []
+
+    async def on_corrected(user_ids):
+        corrected.extend(user_ids)
+
+    total = await reconcile_user_stats(
+        test_session.bind, batch_size=1, on_corrected=on_corrected
+    )
+    assert {1, 2, 3} <= set(corrected)
+    assert total == len(corrected)
+    for user_id in (1, 2, 3):
+        assert await stats_of(test_session, user_id) == await actual_stats_of(
+            test_session, user_id
+        )
+    # повторная сверка ничего не находит
+    assert await reconcile_user_stats(test_session.bind) == 0
+
+
+@pytest.mark.user_stats
+@pytest.mark.asyncio
+async def test_profile_without_stats_row_counts_follows(async_client, test_session):
+    """Пока сверка не создала строку счётчиков, числа считаются по follows"""
+    user = Users(name="no stats", api_key="no_stats")
+    test_session.add(user)
+    await test_session.commit()
+    test_session.add_all(
+        [
+            Follows(follower_id=user.id, followed_id=1),
+            Follows(follower_id=2, followed_id=user.id),
+            Follows(follower_id=3, followed_id=user.id),
+        ]
+    )
+    await test_session.commit()
+    try:
+        resp = await async_client.get(
+            f"/api/users/{user.id}", headers={"api-key": "test"}
+        )
+        profile = resp.json()["user"]
+        assert profile["followers_count"] == 2
+        assert profile["following_count"] == 1
+        assert profile["tweets_count"] == 0
+    finally:
+        await test_session.delete(user)
+        await test_session.commit()